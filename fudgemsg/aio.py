@@ -0,0 +1,364 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""asyncio support for exchanging Fudge Envelopes.
+
+`EnvelopeProtocol` frames envelopes on an asyncio transport by the size
+in their headers, and `EnvelopeStreamReader` and `write_envelopes` do
+the same over asyncio streams.  Received envelopes are available as
+futures from `receive()`, or with `async for`.
+
+On python 2 the trollius backport of asyncio is used, if installed.
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+import collections
+
+from fudgemsg.registry import DEFAULT_REGISTRY
+from fudgemsg.stream import EnvelopeReader, DEFAULT_CHUNK_SIZE
+
+try:
+    _StopAsyncIteration = StopAsyncIteration
+except NameError:
+    # No async for before python 3.5
+    _StopAsyncIteration = StopIteration
+
+_ensure_future = getattr(asyncio, 'ensure_future', None) or \
+        getattr(asyncio, 'async')
+
+# Envelopes queued by an EnvelopeProtocol before it stops reading
+DEFAULT_MAX_QUEUED = 1024
+
+class _EnvelopeQueue(object):
+    """Received Envelopes waiting for a single consumer.
+
+    Subclasses add envelopes with `_put` and end the queue with `_close`.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._envelopes = collections.deque()
+        self._waiter = None
+        self._end_exception = None
+        self._closed = False
+        self._exception = None
+
+    def receive(self):
+        """Return a Future for the next Envelope.
+
+        The future raises EOFError once the connection has closed and
+        all envelopes have been received, or the error which closed
+        the connection.
+        """
+        return self._next(EOFError)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._next(_StopAsyncIteration)
+
+    def _next(self, end_exception):
+        if self._waiter is not None and not self._waiter.done():
+            raise RuntimeError("Already waiting for the next envelope")
+        self._waiter = asyncio.Future(loop=self._loop)
+        self._end_exception = end_exception
+        waiter = self._waiter
+        self._wake()
+        if self._waiter is not None:
+            self._starved()
+        return waiter
+
+    def _put(self, envelopes):
+        self._envelopes.extend(envelopes)
+        self._wake()
+
+    def _close(self, exception=None):
+        self._closed = True
+        self._exception = exception
+        self._wake()
+
+    def _wake(self):
+        waiter = self._waiter
+        if waiter is None:
+            return
+        if waiter.done():
+            # cancelled
+            self._waiter = None
+        elif self._envelopes:
+            self._waiter = None
+            waiter.set_result(self._envelopes.popleft())
+            self._dequeued()
+        elif self._closed:
+            self._waiter = None
+            waiter.set_exception(self._exception or self._end_exception())
+
+    def _dequeued(self):
+        """Called when an envelope has been handed to the consumer"""
+        pass
+
+    def _starved(self):
+        """Called when the consumer is waiting on an empty queue"""
+        pass
+
+
+class EnvelopeProtocol(asyncio.Protocol, _EnvelopeQueue):
+    """An asyncio Protocol sending and receiving Fudge Envelopes.
+
+    Reading is paused while max_queued received envelopes are waiting
+    to be consumed, and resumed once half of them have been. Envelopes
+    passed to `send` in the same event loop iteration are encoded into
+    one buffer and written to the transport with a single call.
+
+    Use it as the protocol factory for loop.create_connection or
+    loop.create_server, or see `open_connection`.
+    """
+
+    def __init__(self, taxonomy_resolver=None, lazy=False, \
+            max_queued=DEFAULT_MAX_QUEUED, loop=None, \
+            registry=DEFAULT_REGISTRY):
+        """Create a new EnvelopeProtocol.
+
+        Arguments:
+            taxonomy_resolver: used to find the Taxonomy named in each
+                envelope header (Default: None)
+            lazy: decode messages as `LazyMessage`s (Default: False)
+            max_queued: the number of received envelopes to queue before
+                pausing reading (Default: DEFAULT_MAX_QUEUED)
+            loop: the event loop (Default: the current event loop)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+        """
+        _EnvelopeQueue.__init__(self, loop or asyncio.get_event_loop())
+        self._reader = EnvelopeReader(taxonomy_resolver, lazy, registry)
+        self._max_queued = max_queued
+        self._transport = None
+        self._reading_paused = False
+        self._writing_paused = False
+        self._drain_waiters = []
+        self._outgoing = bytearray()
+        self._flush_scheduled = False
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def data_received(self, data):
+        try:
+            envelopes = self._reader.feed(data)
+        except Exception as exc:
+            envelopes = None
+            error = exc
+        else:
+            error = None
+        if envelopes:
+            self._put(envelopes)
+            # Any error after them is delivered once they have been
+            try:
+                self._reader.check()
+            except Exception as exc:
+                error = exc
+        if error is not None:
+            # Undecodable, so nothing further can be framed either
+            self._transport.close()
+            self._close(error)
+            return
+        if not self._reading_paused and \
+                len(self._envelopes) >= self._max_queued:
+            self._reading_paused = True
+            self._transport.pause_reading()
+
+    def eof_received(self):
+        # Let the transport close itself
+        return None
+
+    def connection_lost(self, exc):
+        if exc is None and self._reader.pending():
+            exc = ValueError("Connection closed within an envelope")
+        self._close(exc)
+        self._wake_drain_waiters(exc)
+
+    def _dequeued(self):
+        if self._reading_paused and \
+                len(self._envelopes) <= self._max_queued // 2:
+            self._reading_paused = False
+            self._transport.resume_reading()
+
+    def send(self, envelope, taxonomy_id=0):
+        """Queue an Envelope to be written to the transport.
+
+        Envelopes sent in the same event loop iteration are batched
+        into a single transport write. See `drain` for flow control.
+
+        Arguments:
+            envelope: the Envelope to send
+            taxonomy_id: the id of the Taxonomy to encode with (Default: 0)
+        """
+        envelope.encode_into(self._outgoing, taxonomy_id)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self._outgoing and self._transport is not None:
+            self._transport.write(bytes(self._outgoing))
+            del self._outgoing[:]
+
+    def drain(self):
+        """Write any batched envelopes now, and return a Future which is
+        done once the transport is ready for more.
+        """
+        self._flush()
+        waiter = asyncio.Future(loop=self._loop)
+        if self._writing_paused and not self._closed:
+            self._drain_waiters.append(waiter)
+        else:
+            waiter.set_result(None)
+        return waiter
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        self._wake_drain_waiters()
+
+    def _wake_drain_waiters(self, exc=None):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+    def close(self):
+        """Write any batched envelopes and close the transport."""
+        self._flush()
+        if self._transport is not None:
+            self._transport.close()
+
+
+class EnvelopeStreamReader(_EnvelopeQueue):
+    """Receive Fudge Envelopes from an asyncio.StreamReader.
+
+    The stream is read in chunks, each of which may complete several
+    envelopes, rather than with a readexactly per header and body.
+    """
+
+    def __init__(self, stream_reader, taxonomy_resolver=None, lazy=False, \
+            chunk_size=DEFAULT_CHUNK_SIZE, loop=None, \
+            registry=DEFAULT_REGISTRY):
+        """Create a new EnvelopeStreamReader.
+
+        Arguments:
+            stream_reader: the asyncio.StreamReader to read from
+            taxonomy_resolver: used to find the Taxonomy named in each
+                envelope header (Default: None)
+            lazy: decode messages as `LazyMessage`s (Default: False)
+            chunk_size: the most bytes to read at a time
+                (Default: DEFAULT_CHUNK_SIZE)
+            loop: the event loop (Default: the current event loop)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+        """
+        _EnvelopeQueue.__init__(self, loop or asyncio.get_event_loop())
+        self._stream = stream_reader
+        self._reader = EnvelopeReader(taxonomy_resolver, lazy, registry)
+        self._chunk_size = chunk_size
+        self._reading = False
+
+    def _starved(self):
+        if self._reading or self._closed:
+            return
+        self._reading = True
+        read = _ensure_future(self._stream.read(self._chunk_size), \
+                loop=self._loop)
+        read.add_done_callback(self._read_done)
+
+    def _read_done(self, read):
+        self._reading = False
+        if read.cancelled():
+            self._close(EOFError("Read cancelled"))
+            return
+        if read.exception() is not None:
+            self._close(read.exception())
+            return
+
+        data = read.result()
+        if not data:
+            if self._reader.pending():
+                self._close(ValueError("Stream ended within an envelope"))
+            else:
+                self._close()
+            return
+        try:
+            envelopes = self._reader.feed(data)
+        except Exception as exc:
+            self._close(exc)
+            return
+        self._put(envelopes)
+        try:
+            self._reader.check()
+        except Exception as exc:
+            # Delivered once the envelopes before it have been
+            self._close(exc)
+            return
+        if self._waiter is not None:
+            self._starved()
+
+
+def write_envelopes(stream_writer, envelopes, taxonomy_id=0):
+    """Write Envelopes to an asyncio.StreamWriter with a single write.
+
+    Arguments:
+        stream_writer: the asyncio.StreamWriter to write to
+        envelopes: the Envelopes to write
+        taxonomy_id: the id of the Taxonomy to encode with (Default: 0)
+
+    Return:
+        stream_writer.drain(), to wait on for flow control
+    """
+    buffer = bytearray()
+    for envelope in envelopes:
+        envelope.encode_into(buffer, taxonomy_id)
+    stream_writer.write(bytes(buffer))
+    return stream_writer.drain()
+
+def open_connection(host=None, port=None, taxonomy_resolver=None, \
+        lazy=False, max_queued=DEFAULT_MAX_QUEUED, loop=None, \
+        registry=DEFAULT_REGISTRY, **kwargs):
+    """Connect to a peer exchanging Fudge Envelopes.
+
+    Arguments are as for `EnvelopeProtocol`; any others are passed
+    on to loop.create_connection.
+
+    Return:
+        A coroutine giving (transport, EnvelopeProtocol)
+    """
+    loop = loop or asyncio.get_event_loop()
+    def factory():
+        return EnvelopeProtocol(taxonomy_resolver, lazy, max_queued, loop, \
+                registry)
+    return loop.create_connection(factory, host, port, **kwargs)
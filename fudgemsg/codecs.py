@@ -21,11 +21,31 @@
 
 """A bunch of encode/decode routines for types."""
 
+import datetime
 import struct
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from fudgemsg.types import INDICATOR
 
-from fudgemsg import utils
+from fudgemsg import types
+
+# Precompiled packings for the fixed width primitives
+BYTE_STRUCT = struct.Struct('!B')
+SHORT_STRUCT = struct.Struct('!h')
+INT_STRUCT = struct.Struct('!l')
+LONG_STRUCT = struct.Struct('!q')
+FLOAT_STRUCT = struct.Struct('!f')
+DOUBLE_STRUCT = struct.Struct('!d')
+
+# Dates are (year << 9 | month << 5 | day). Times are
+# (timezone << 24 | accuracy << 20 | seconds since midnight) followed by
+# nanoseconds, and datetimes are a date followed by a time.
+TIME_STRUCT = struct.Struct('!ll')
+DATETIME_STRUCT = struct.Struct('!lll')
 
 def enc_indicator(val=None):
     """Encode a Fudge Indicator Type.
@@ -40,49 +60,67 @@ def enc_bool(val):
         return '\x01'
     return '\x00'
 
-def enc_byte(val):
-    """encode a single unsignd byte"""
-    return struct.pack('!B', val)
+# The fixed width encoders are the bound pack methods themselves, to
+# keep a python level call out of the innermost loop.
+
+# encode a single unsigned byte
+enc_byte = BYTE_STRUCT.pack
 
-def enc_short(val):
-    """Encode a single signed int16"""
-    return struct.pack("!h", val)
+# Encode a single signed int16
+enc_short = SHORT_STRUCT.pack
 
-def enc_int(val):
-    """Encode a single signed int32"""
-    assert val >= utils.MIN_INT or val <= utils.MAX_INT
-    return struct.pack("!l", val)
+# Encode a single signed int32
+enc_int = INT_STRUCT.pack
 
-def enc_long(val):
-    """Encode a single signed int64"""
-    return struct.pack("!q", val)
+# Encode a single signed int64
+enc_long = LONG_STRUCT.pack
 
-def enc_float(val):
-    """Encode a single float"""
-    return struct.pack("!f", val)
+# Encode a single float
+enc_float = FLOAT_STRUCT.pack
 
-def enc_double(val):
-    """Encode a single double"""
-    return struct.pack("!d", val)
+# Encode a single double
+enc_double = DOUBLE_STRUCT.pack
 
 def enc_unicode(val):
     """encode a single unicode string"""
-    utf8 = val.encode("utf-8")
-    fmt = "!%ss"% len(utf8)
-    return struct.pack(fmt, utf8)
+    return val.encode("utf-8")
 
 def enc_str(val):
     """Encode a non-unicode string i.e a byte[]."""
     return str(val)
 
-def _unpack(fmt, encoded):
-    """A simple wrapper around struct.unpack
+def appender(struct_):
+    """Build a function which appends a value to a bytearray.
+
+    The value is packed in place with `struct_.pack_into`, so
+    no intermediate string is created for it.
 
     Arguments:
-        fmt: The format string (see struct docs for details)
-        encoded: The encoded array"""
-    length = struct.calcsize(fmt)
-    return struct.unpack(fmt, encoded[:length])[0]
+        struct_: the struct.Struct used to pack the value
+
+    Return:
+        A function of (buffer, value)"""
+    padding = '\x00' * struct_.size
+    pack_into = struct_.pack_into
+    def append(buffer, val):
+        offset = len(buffer)
+        buffer.extend(padding)
+        pack_into(buffer, offset, val)
+    return append
+
+def reader(struct_):
+    """Build a function which decodes a value in place from a buffer.
+
+    Arguments:
+        struct_: the struct.Struct used to unpack the value
+
+    Return:
+        A function of (buffer, offset, length) -> value, suitable
+        as a `FieldType.decode_from`"""
+    unpack_from = struct_.unpack_from
+    def read(buffer, offset, length):
+        return unpack_from(buffer, offset)[0]
+    return read
 
 def dec_indicator(encoded):
     """decode a Fudge Indicator.
@@ -94,44 +132,71 @@ def dec_indicator(encoded):
 def dec_bool(encoded):
     """Decode a single boolean"""
     # No '?' decode format in py2.4
-    if encoded[0] != '\x00':
-        return True
-    else: 
-        return False
+    return BYTE_STRUCT.unpack_from(encoded)[0] != 0
 
 def dec_byte(encoded):
     """Decode a single unsigned byte"""
-    i = _unpack('!B', encoded)
-    return i % 2**8
+    return BYTE_STRUCT.unpack_from(encoded)[0]
 
 def dec_short(encoded):
     """Decode a single signed short"""
-    i = _unpack('!h', encoded)
-    return (i + 2**15) % 2**16 - 2**15
+    return SHORT_STRUCT.unpack_from(encoded)[0]
 
 def dec_int(encoded):
     """Decode a single signed int"""
-    i = _unpack('!l', encoded)
-    return (i + 2**31) % 2**32 - 2**31
+    return INT_STRUCT.unpack_from(encoded)[0]
 
 def dec_long(encoded):
     """Decode a single signed long"""
-    i = _unpack('!q', encoded)
-    return (i + 2**63) % 2**64 - 2**63
+    return LONG_STRUCT.unpack_from(encoded)[0]
 
 def dec_float(encoded):
     """Decode a single signed float"""
-    return _unpack('!f', encoded)
+    return FLOAT_STRUCT.unpack_from(encoded)[0]
 
 def dec_double(encoded):
     """Decode a single signed double"""
-    return _unpack('!d', encoded)
+    return DOUBLE_STRUCT.unpack_from(encoded)[0]
+
+# In place decoders.  These take the buffer and the offset of the value
+# within it, and return (value, offset just past the value)
+
+def dec_bool_from(buffer, offset):
+    """Decode a single boolean at offset within buffer"""
+    return BYTE_STRUCT.unpack_from(buffer, offset)[0] != 0, offset + 1
+
+def dec_byte_from(buffer, offset):
+    """Decode a single unsigned byte at offset within buffer"""
+    return BYTE_STRUCT.unpack_from(buffer, offset)[0], offset + 1
+
+def dec_short_from(buffer, offset):
+    """Decode a single signed short at offset within buffer"""
+    return SHORT_STRUCT.unpack_from(buffer, offset)[0], offset + 2
+
+def dec_int_from(buffer, offset):
+    """Decode a single signed int at offset within buffer"""
+    return INT_STRUCT.unpack_from(buffer, offset)[0], offset + 4
+
+def dec_long_from(buffer, offset):
+    """Decode a single signed long at offset within buffer"""
+    return LONG_STRUCT.unpack_from(buffer, offset)[0], offset + 8
+
+def dec_float_from(buffer, offset):
+    """Decode a single float at offset within buffer"""
+    return FLOAT_STRUCT.unpack_from(buffer, offset)[0], offset + 4
+
+def dec_double_from(buffer, offset):
+    """Decode a single double at offset within buffer"""
+    return DOUBLE_STRUCT.unpack_from(buffer, offset)[0], offset + 8
 
 def dec_unicode(encoded):
     """Decode a single unicode string"""
-    fmt = '!%ss'% len(encoded)
-    utf8 = struct.unpack(fmt, encoded)[0]
-    return unicode(utf8, "utf-8")
+    return unicode(encoded, "utf-8")
+
+def dec_unicode_from(buffer, offset, length):
+    """Decode a unicode string of length bytes at offset within buffer"""
+    end = offset + length
+    return unicode(slice_bytes(buffer, offset, end), "utf-8"), end
 
 def dec_str(encoded):
     """Decode a non-unicode string i.e. byte[].
@@ -139,33 +204,280 @@ def dec_str(encoded):
     """
     return str(encoded)
 
+def slice_bytes(buffer, start, end):
+    """Copy buffer[start:end] out of a buffer as a byte string.
+
+    Arguments:
+        buffer: a str, bytearray, mmap or memoryview
+        start: the first byte to copy
+        end: the position just past the last byte to copy"""
+    chunk = buffer[start:end]
+    if isinstance(chunk, memoryview):
+        return chunk.tobytes()
+    return str(chunk)
+
 # Header helpers
 
 def enc_name(encoded):
     """encode a single name string"""
-    return struct.pack("!B", len(encoded)) + encoded
+    return BYTE_STRUCT.pack(len(encoded)) + encoded
 
 def dec_name(encoded):
     """Decode a name from field prefix string"""
     length = ord(encoded[0])
     return unicode(encoded[1:length+1])
 
+def dec_name_from(buffer, offset):
+    """Decode a length prefixed name at offset within buffer"""
+    length = BYTE_STRUCT.unpack_from(buffer, offset)[0]
+    return dec_unicode_from(buffer, offset + 1, length)
+
 # Arrays
 def enc_array(encode_fn, encoded):
     """Encode an array, usually of numbers.  We use a type \
-    specific encode function"""
+    specific encode function.
 
-    # TODO(jamesc) - Slow but correct...
-    out = ''
-    for val in encoded:
-        out = out + encode_fn(val)
-    return out
+    The primitive array types use the single call encoders below,
+    e.g. `enc_double_array`, instead."""
+    return ''.join([encode_fn(val) for val in encoded])
 
 def dec_array(decode_fn, width, encoded):
     assert len(encoded)%width == 0
 
-    out = []
-    num_elements = len(encoded)/width
-    for val in range(0, num_elements):
-        out.append(decode_fn(encoded[val*width:val*width+width]))
-    return out
+    return [decode_fn(encoded[pos:pos+width]) \
+            for pos in xrange(0, len(encoded), width)]
+
+def _array_codecs(code, width, typename):
+    """Build the encode, decode and in place decode functions for
+    an array of a fixed width primitive.
+
+    Each array is packed or unpacked by a single struct call with a
+    repeat count, rather than element by element.
+
+    Arguments:
+        code: the struct format code of one element
+        width: the size in bytes of one element
+        typename: the name of the element type, for the docstrings
+
+    Return:
+        (encoder, decoder, decode_from)"""
+    fmt = '!%d' + code
+
+    def encode(val):
+        return struct.pack(fmt % len(val), *val)
+
+    def decode(encoded):
+        assert len(encoded) % width == 0
+        return list(struct.unpack(fmt % (len(encoded) // width), encoded))
+
+    def decode_from(buffer, offset, length):
+        assert length % width == 0
+        return list(struct.unpack_from(fmt % (length // width), buffer, \
+                offset))
+
+    encode.__doc__ = "Encode a list of %ss in a single pack"% typename
+    decode.__doc__ = "Decode a %s[] into a list in a single unpack"% typename
+    decode_from.__doc__ = "Decode a %s[] of length bytes at offset " \
+            "within buffer into a list"% typename
+    return encode, decode, decode_from
+
+enc_short_array, dec_short_array, dec_short_array_from = \
+        _array_codecs('h', 2, 'short')
+enc_int_array, dec_int_array, dec_int_array_from = \
+        _array_codecs('l', 4, 'int')
+enc_long_array, dec_long_array, dec_long_array_from = \
+        _array_codecs('q', 8, 'long')
+enc_float_array, dec_float_array, dec_float_array_from = \
+        _array_codecs('f', 4, 'float')
+enc_double_array, dec_double_array, dec_double_array_from = \
+        _array_codecs('d', 8, 'double')
+
+def numpy_array_codecs(dtype):
+    """Build the codecs for an array type held as a numpy.ndarray.
+
+    Decoded arrays are big-endian views made with numpy.frombuffer
+    directly over the buffer they were decoded from, so no bytes are
+    copied; they are read-only if that buffer is a str.
+
+    Arguments:
+        dtype: the big-endian numpy dtype of one element (e.g. '>f8')
+
+    Return:
+        (encoder, decoder, decode_from, calc_size)"""
+    dtype = numpy.dtype(dtype)
+    itemsize = dtype.itemsize
+
+    def encode(val):
+        return numpy.asarray(val, dtype=dtype).tobytes()
+
+    def decode(encoded):
+        assert len(encoded) % itemsize == 0
+        return numpy.frombuffer(encoded, dtype=dtype)
+
+    def decode_from(buffer, offset, length):
+        assert length % itemsize == 0
+        if isinstance(buffer, memoryview):
+            # numpy.frombuffer can't take a memoryview on python 2
+            return numpy.asarray(buffer[offset:offset+length]).view(dtype)
+        return numpy.frombuffer(buffer, dtype, length // itemsize, offset)
+
+    def calc_size(val):
+        return itemsize * numpy.size(val)
+
+    return encode, decode, decode_from, calc_size
+
+# Dates and times
+_SECONDS_MASK = 0xfffff
+_ACCURACY_MASK = 0x0f
+_NANOS = 1000000000
+
+def _date_bits(val):
+    return (val.year << 9) | (val.month << 5) | val.day
+
+def _time_bits(val):
+    """The packed (seconds, nanoseconds) of a time or datetime. Python
+    times are accurate to the microsecond."""
+    offset = val.utcoffset()
+    if offset is None:
+        timezone = types.NO_TIMEZONE
+    else:
+        timezone, remainder = divmod(offset.days * 1440 + \
+                offset.seconds // 60, 15)
+        if remainder:
+            raise ValueError("Fudge timezones are in 15 minute units : %s"% \
+                    offset)
+    seconds = val.hour * 3600 + val.minute * 60 + val.second
+    return (timezone << 24) | (types.ACCURACY_MICROSECOND << 20) | seconds, \
+            val.microsecond * 1000
+
+def _tzinfo(bits):
+    timezone = bits >> 24
+    if timezone == types.NO_TIMEZONE:
+        return None
+    return types.fixed_offset(timezone * 15)
+
+def enc_date(val):
+    """Encode a datetime.date"""
+    return INT_STRUCT.pack(_date_bits(val))
+
+def enc_time(val):
+    """Encode a datetime.time, with its timezone if it has one"""
+    return TIME_STRUCT.pack(*_time_bits(val))
+
+def enc_datetime(val):
+    """Encode a datetime.datetime, with its timezone if it has one"""
+    seconds, nanos = _time_bits(val)
+    return DATETIME_STRUCT.pack(_date_bits(val), seconds, nanos)
+
+def dec_date_from(buffer, offset, length):
+    """Decode a datetime.date in place.
+
+    Dates less accurate than a day have a zero month or day, which
+    become 1."""
+    bits = INT_STRUCT.unpack_from(buffer, offset)[0]
+    return datetime.date(bits >> 9, (bits >> 5) & 0x0f or 1, bits & 0x1f or 1)
+
+def dec_time_from(buffer, offset, length):
+    """Decode a datetime.time in place, truncated to the microsecond"""
+    bits, nanos = TIME_STRUCT.unpack_from(buffer, offset)
+    minutes, second = divmod(bits & _SECONDS_MASK, 60)
+    return datetime.time(minutes // 60, minutes % 60, second, nanos // 1000, \
+            _tzinfo(bits))
+
+def dec_datetime_from(buffer, offset, length):
+    """Decode a datetime.datetime in place, truncated to the microsecond"""
+    date_bits, bits, nanos = DATETIME_STRUCT.unpack_from(buffer, offset)
+    minutes, second = divmod(bits & _SECONDS_MASK, 60)
+    return datetime.datetime(date_bits >> 9, (date_bits >> 5) & 0x0f or 1, \
+            date_bits & 0x1f or 1, minutes // 60, minutes % 60, second, \
+            nanos // 1000, _tzinfo(bits))
+
+def dec_date(encoded):
+    """Decode a datetime.date"""
+    return dec_date_from(encoded, 0, 4)
+
+def dec_time(encoded):
+    """Decode a datetime.time"""
+    return dec_time_from(encoded, 0, 8)
+
+def dec_datetime(encoded):
+    """Decode a datetime.datetime"""
+    return dec_datetime_from(encoded, 0, 12)
+
+# Dates and times as integers, for comparison without building objects
+def days_from_civil(year, month, day):
+    """The number of days from 1970-01-01 to a proleptic Gregorian date,
+    for any year"""
+    year -= month <= 2
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - \
+            year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def civil_from_days(days):
+    """The (year, month, day) of a number of days from 1970-01-01"""
+    days += 719468
+    era = days // 146097
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - \
+            day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - \
+            year_of_era // 100)
+    month_index = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * month_index + 2) // 5 + 1
+    month = month_index + (3 if month_index < 10 else -9)
+    return year_of_era + era * 400 + (month <= 2), month, day
+
+def enc_raw_date(val):
+    """Encode a date held as its packed integer"""
+    return INT_STRUCT.pack(val)
+
+def enc_raw_time(val):
+    """Encode nanoseconds since midnight as a time with no timezone"""
+    seconds, nanos = divmod(val, _NANOS)
+    return TIME_STRUCT.pack((types.NO_TIMEZONE << 24) | \
+            (types.ACCURACY_NANOSECOND << 20) | seconds, nanos)
+
+def enc_raw_datetime(val):
+    """Encode nanoseconds since 1970-01-01 UTC as a UTC datetime"""
+    seconds, nanos = divmod(val, _NANOS)
+    days, seconds = divmod(seconds, 86400)
+    year, month, day = civil_from_days(days)
+    return DATETIME_STRUCT.pack((year << 9) | (month << 5) | day, \
+            (types.ACCURACY_NANOSECOND << 20) | seconds, nanos)
+
+def dec_raw_date_from(buffer, offset, length):
+    """Decode a date as its packed integer, which orders as the date"""
+    return INT_STRUCT.unpack_from(buffer, offset)[0]
+
+def dec_raw_time_from(buffer, offset, length):
+    """Decode a time as nanoseconds since midnight, ignoring its
+    timezone"""
+    bits, nanos = TIME_STRUCT.unpack_from(buffer, offset)
+    return (bits & _SECONDS_MASK) * _NANOS + nanos
+
+def dec_raw_datetime_from(buffer, offset, length):
+    """Decode a datetime as nanoseconds since 1970-01-01 UTC. Those with
+    no timezone are taken to be UTC."""
+    date_bits, bits, nanos = DATETIME_STRUCT.unpack_from(buffer, offset)
+    days = days_from_civil(date_bits >> 9, (date_bits >> 5) & 0x0f or 1, \
+            date_bits & 0x1f or 1)
+    seconds = days * 86400 + (bits & _SECONDS_MASK)
+    timezone = bits >> 24
+    if timezone != types.NO_TIMEZONE:
+        seconds -= timezone * 900
+    return seconds * _NANOS + nanos
+
+def dec_raw_date(encoded):
+    """Decode a date as its packed integer"""
+    return dec_raw_date_from(encoded, 0, 4)
+
+def dec_raw_time(encoded):
+    """Decode a time as nanoseconds since midnight"""
+    return dec_raw_time_from(encoded, 0, 8)
+
+def dec_raw_datetime(encoded):
+    """Decode a datetime as nanoseconds since 1970-01-01 UTC"""
+    return dec_raw_datetime_from(encoded, 0, 12)
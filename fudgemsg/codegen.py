@@ -0,0 +1,579 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Generate python classes for Fudge messages from a schema.
+
+A schema lists message types and their fields, for example:
+
+    message Trade {
+        long id = 1;
+        double price;
+        string ticker [name="Ticker"];
+        repeated Fill fills = 4;
+    }
+
+    message Fill {
+        int quantity = 1;
+        double price = 2;
+    }
+
+Each field has a Fudge type (see `types.FUDGE_TYPE_NAMES`) or the name
+of another message in the schema, an attribute name, an optional
+ordinal, and an optional Fudge field name which defaults to the
+attribute name (name="" leaves the field unnamed). Repeated fields hold
+a list.
+
+`generate` turns the schema into python source defining a slotted class
+per message, with straight-line `to_fudge`/`from_fudge` methods
+converting to and from `Message`, and `encode_into`/`decode_from`
+methods which go directly to and from bytes with precomputed field
+headers, without any registry lookups or Field objects. Decoding
+expects fields in schema order, checking each header as a whole, and
+falls back to a general loop for anything else:
+
+    >>> source = generate(parse_schema(open('trades.schema').read()))
+
+`compile_schema` generates and executes the source, returning a module.
+Fields with ordinals or names not in the schema are ignored when
+decoding.
+"""
+
+import imp
+import re
+import sys
+
+from fudgemsg.codecs import BYTE_STRUCT, slice_bytes
+from fudgemsg.field import Field, _PADDING, _VARIABLE_WIDTH_PREFIX, \
+        bytes_for_value_length, encode_value_length_into, \
+        decode_value_length_from
+from fudgemsg.registry import DEFAULT_REGISTRY
+from fudgemsg.template import _STRUCT_CODES, _WIDTH_MASK
+from fudgemsg import types
+
+class SchemaError(Exception):
+    """A schema could not be parsed, or refers to an unknown type"""
+    pass
+
+class FieldSchema(object):
+    """The description of a field of a message schema."""
+
+    def __init__(self, attribute, type_, ordinal=None, name=None, \
+            repeated=False):
+        """Create a new FieldSchema.
+
+        Arguments:
+            attribute: the attribute of the generated class holding the
+                field's value
+            type_: a Fudge type name, e.g. "long" or "string[]", or the
+                classname of another MessageSchema
+            ordinal: the field ordinal (Default: None)
+            name: the field name. Defaults to the attribute, and may be
+                "" for an unnamed field. (Default: None)
+            repeated: the field may occur many times, and its attribute
+                holds a list (Default: False)
+        """
+        self.attribute = attribute
+        self.type_ = type_
+        self.ordinal = ordinal
+        if name is None:
+            name = unicode(attribute)
+        self.name = name or None
+        self.repeated = repeated
+
+    def __repr__(self):
+        return "FieldSchema(%r, %r, ordinal=%r, name=%r, repeated=%r)"% \
+                (self.attribute, self.type_, self.ordinal, self.name, \
+                self.repeated)
+
+class MessageSchema(object):
+    """The description of a message type."""
+
+    def __init__(self, classname, fields):
+        """Create a new MessageSchema.
+
+        Arguments:
+            classname: the name of the generated class
+            fields: a list of FieldSchema
+        """
+        self.classname = classname
+        self.fields = fields
+
+    def __repr__(self):
+        return "MessageSchema(%r, %r)"% (self.classname, self.fields)
+
+_TOKENS = re.compile(r'''
+    \s*(?:
+      (?P<comment>(?:\#|//)[^\n]*)
+    | (?P<message>message\s+(?P<classname>\w+)\s*\{)
+    | (?P<field>(?P<repeated>repeated\s+)?
+          (?P<type>\w+(?:\[\d*\])?)\s+(?P<attribute>\w+)
+          (?:\s*=\s*(?P<ordinal>-?\d+))?
+          (?:\s*\[\s*name\s*=\s*"(?P<name>[^"]*)"\s*\])?
+          \s*;)
+    | (?P<end>\})
+    )\s*''', re.VERBOSE)
+
+def parse_schema(text):
+    """Parse the text of a schema.
+
+    Arguments:
+        text: the schema (str or unicode)
+
+    Return:
+        A list of MessageSchema, in the order declared
+
+    Raises:
+        SchemaError: if the schema can not be parsed
+    """
+    schemas = []
+    current = None
+    pos = 0
+    while pos < len(text):
+        match = _TOKENS.match(text, pos)
+        if not match or match.end() == pos:
+            line = text.count('\n', 0, pos) + 1
+            raise SchemaError("Could not parse schema at line %d"% line)
+        pos = match.end()
+        if match.group('comment'):
+            continue
+        elif match.group('message'):
+            if current is not None:
+                raise SchemaError("Nested message %s"% \
+                        match.group('classname'))
+            current = MessageSchema(match.group('classname'), [])
+            schemas.append(current)
+        elif match.group('field'):
+            if current is None:
+                raise SchemaError("Field %s outside a message"% \
+                        match.group('attribute'))
+            ordinal = match.group('ordinal')
+            if ordinal is not None:
+                ordinal = int(ordinal)
+            name = match.group('name')
+            if name is not None:
+                name = unicode(name)
+            current.fields.append(FieldSchema(match.group('attribute'), \
+                    match.group('type'), ordinal, name, \
+                    bool(match.group('repeated'))))
+        else:
+            if current is None:
+                raise SchemaError("Unmatched }")
+            current = None
+    if current is not None:
+        raise SchemaError("Unterminated message %s"% current.classname)
+    return schemas
+
+# Runtime helpers used by generated code
+def append_variable(buffer, header, value):
+    """Append a variable width field, given its header and encoded value"""
+    start = len(buffer)
+    buffer.extend(header)
+    length = len(value)
+    width = bytes_for_value_length(length)
+    pos = len(buffer)
+    buffer.extend(_PADDING[width])
+    encode_value_length_into(length, buffer, pos, width)
+    buffer.extend(value)
+    buffer[start] |= _VARIABLE_WIDTH_PREFIX[width]
+
+def append_message(buffer, header, value):
+    """Append a sub-message field, given its header and an object with
+    an encode_into method"""
+    start = len(buffer)
+    buffer.extend(header)
+    pos = len(buffer)
+    buffer.append(0)
+    value.encode_into(buffer)
+    length = len(buffer) - pos - 1
+    width = bytes_for_value_length(length)
+    if width > 1:
+        buffer[pos + 1:pos + 1] = _PADDING[width - 1]
+    encode_value_length_into(length, buffer, pos, width)
+    buffer[start] |= _VARIABLE_WIDTH_PREFIX[width]
+
+def match_field(buffer, offset, end, header, fixed_size):
+    """Check whether the field at offset has the given header, ignoring
+    the width of its value length.
+
+    Return:
+        (value_offset, value_end), or None if it does not match
+    """
+    pos = offset + len(header)
+    if pos > end or slice_bytes(buffer, offset + 1, pos) != header[1:]:
+        return None
+    prefix_byte = BYTE_STRUCT.unpack_from(buffer, offset)[0]
+    if prefix_byte & _WIDTH_MASK != ord(header[0]):
+        return None
+    width = (0, 1, 2, 4)[(prefix_byte & _VARIABLE_WIDTH_PREFIX[4]) >> 5]
+    if width:
+        if pos + width > end:
+            return None
+        length = decode_value_length_from(buffer, pos, width)
+        pos += width
+    else:
+        length = fixed_size
+    if pos + length > end:
+        return None
+    return pos, pos + length
+
+_TYPE_IDS_BY_NAME = dict([(name, type_id) for type_id, name in \
+        types.FUDGE_TYPE_NAMES.items()])
+
+_PREAMBLE = '''\
+# Generated by fudgemsg.codegen - do not edit.
+
+import struct as _struct
+
+from fudgemsg import codegen as _codegen
+from fudgemsg.codecs import dec_name_from as _dec_name_from
+from fudgemsg.field import Field as _Field, decode_header as _decode_header, \\
+        decode_value as _decode_value
+from fudgemsg.message import Message as _Message
+from fudgemsg.registry import DEFAULT_REGISTRY as _REGISTRY
+'''
+
+class _Writer(object):
+    """Accumulates indented lines of source"""
+
+    def __init__(self):
+        self.lines = []
+        self.indent = 0
+
+    def __call__(self, line=''):
+        if line:
+            self.lines.append('    ' * self.indent + line)
+        else:
+            self.lines.append('')
+
+    def source(self):
+        return '\n'.join(self.lines) + '\n'
+
+def generate(schemas):
+    """Generate python source for a list of message schemas.
+
+    Arguments:
+        schemas: a list of MessageSchema, as returned by `parse_schema`
+
+    Return:
+        The source of a python module defining a class for each schema
+
+    Raises:
+        SchemaError: if a field has an unknown type
+    """
+    classnames = set([schema.classname for schema in schemas])
+    out = _Writer()
+    for line in _PREAMBLE.splitlines():
+        out(line)
+    for schema in schemas:
+        _generate_class(out, schema, classnames)
+    return out.source()
+
+def _constant(classname, attribute, kind):
+    return '_%s_%s_%s'% (classname.upper(), attribute.upper(), kind)
+
+def _generate_class(out, schema, classnames):
+    fields = []
+    for field in schema.fields:
+        if field.type_ in classnames:
+            type_id = types.FUDGEMSG_TYPE_ID
+            nested = field.type_
+        elif field.type_ in _TYPE_IDS_BY_NAME:
+            type_id = _TYPE_IDS_BY_NAME[field.type_]
+            nested = None
+        else:
+            raise SchemaError("Unknown type %s for %s.%s"% \
+                    (field.type_, schema.classname, field.attribute))
+        type_ = DEFAULT_REGISTRY.type_by_id(type_id)
+        header = Field(type_, field.ordinal, field.name, None).encode_header()
+        fields.append((field, type_, nested, header))
+
+    name = schema.classname
+    attributes = [field.attribute for field in schema.fields]
+
+    # Constants
+    out()
+    for field, type_, nested, header in fields:
+        out('%s = _REGISTRY.type_by_id(%d)'% \
+                (_constant(name, field.attribute, 'TYPE'), type_.type_id))
+        code = _STRUCT_CODES.get(type_.type_id)
+        if code is not None:
+            out('%s = _struct.Struct(%r)'% \
+                    (_constant(name, field.attribute, 'STRUCT'), \
+                    '!%ds%s'% (len(header), code)))
+        out('%s = %r'% (_constant(name, field.attribute, 'HEADER'), header))
+
+    out()
+    out('class %s(object):'% name)
+    out.indent += 1
+    out('"""Generated from the %s message schema"""'% name)
+    out('__slots__ = %r'% (tuple(attributes),))
+    out()
+
+    # __init__
+    out('def __init__(self%s):'% ''.join([', %s=None'% a for a in attributes]))
+    out.indent += 1
+    for field in schema.fields:
+        if field.repeated:
+            out('if %s is None:'% field.attribute)
+            out('    %s = []'% field.attribute)
+        out('self.%s = %s'% (field.attribute, field.attribute))
+    if not attributes:
+        out('pass')
+    out.indent -= 1
+    out()
+
+    # Comparison and repr
+    out('def __eq__(self, other):')
+    out('    return self.__class__ is other.__class__ and \\')
+    out('            %s'% ' and \\\n                '.join( \
+            ['self.%s == other.%s'% (a, a) for a in attributes] or ['True']))
+    out()
+    out('def __ne__(self, other):')
+    out('    return not self == other')
+    out()
+    out('def __repr__(self):')
+    out('    return "%s(%s)"%% (%s)'% (name, \
+            ', '.join(['%s=%%r'% a for a in attributes]), \
+            ''.join(['self.%s,'% a for a in attributes])))
+    out()
+
+    _generate_to_fudge(out, name, fields)
+    _generate_from_fudge(out, name, fields)
+    _generate_encode_into(out, name, fields)
+    _generate_decode_from(out, name, fields)
+    out.indent -= 1
+
+def _generate_to_fudge(out, name, fields):
+    out('def to_fudge(self):')
+    out('    """Return this %s as a fudgemsg Message"""'% name)
+    out.indent += 1
+    out('message = _Message()')
+    out('append = message.fields.append')
+    for field, type_, nested, header in fields:
+        value = 'value'
+        if nested:
+            value = 'value.to_fudge()'
+        add = 'append(_Field(%s, %r, %r, %s))'% \
+                (_constant(name, field.attribute, 'TYPE'), field.ordinal, \
+                field.name, value)
+        if field.repeated:
+            out('for value in self.%s:'% field.attribute)
+        else:
+            out('value = self.%s'% field.attribute)
+            out('if value is not None:')
+        out('    ' + add)
+    out('return message')
+    out.indent -= 1
+    out()
+
+def _generate_dispatch(out, name, fields, value_fn):
+    """Generate the if/elif chain matching a field by ordinal, then by
+    name. value_fn(field, nested) is the expression for its value."""
+    def assign(field, nested):
+        value = value_fn(field, nested)
+        if field.repeated:
+            out('    self.%s.append(%s)'% (field.attribute, value))
+        else:
+            out('    self.%s = %s'% (field.attribute, value))
+        out('    continue')
+
+    for field, type_, nested, header in fields:
+        if field.ordinal is not None:
+            out('if ordinal == %r:'% field.ordinal)
+            assign(field, nested)
+    return assign
+
+def _generate_from_fudge(out, name, fields):
+    out('@classmethod')
+    out('def from_fudge(cls, message):')
+    out('    """Build a %s from a fudgemsg Message"""'% name)
+    out.indent += 1
+    out('self = cls()')
+    out('for field in message.fields:')
+    out.indent += 1
+
+    def value_fn(field, nested):
+        if nested:
+            return '%s.from_fudge(field.value)'% nested
+        return 'field.value'
+
+    out('ordinal = field.ordinal')
+    assign = _generate_dispatch(out, name, fields, value_fn)
+    out('name = field.name')
+    for field, type_, nested, header in fields:
+        if field.name is not None:
+            out('if name == %r:'% field.name)
+            assign(field, nested)
+    out.indent -= 1
+    out('return self')
+    out.indent -= 1
+    out()
+
+def _generate_encode_into(out, name, fields):
+    out('def encode_into(self, buffer):')
+    out('    """Encode this %s onto the end of a bytearray"""'% name)
+    out.indent += 1
+    for field, type_, nested, header in fields:
+        header_name = _constant(name, field.attribute, 'HEADER')
+        type_name = _constant(name, field.attribute, 'TYPE')
+        if nested:
+            write = '_codegen.append_message(buffer, %s, value)'% header_name
+        elif type_.type_id in _STRUCT_CODES:
+            write = 'buffer.extend(%s.pack(%s, value))'% \
+                    (_constant(name, field.attribute, 'STRUCT'), header_name)
+        elif type_.type_id == types.INDICATOR_TYPE_ID:
+            write = 'buffer.extend(%s)'% header_name
+        elif type_.is_variable_sized:
+            write = '_codegen.append_variable(buffer, %s, %s.encoder(value))'% \
+                    (header_name, type_name)
+        else:
+            write = 'buffer.extend(%s + %s.encoder(value))'% \
+                    (header_name, type_name)
+        if field.repeated:
+            out('for value in self.%s:'% field.attribute)
+        else:
+            out('value = self.%s'% field.attribute)
+            out('if value is not None:')
+        out('    ' + write)
+    out('return buffer')
+    out.indent -= 1
+    out()
+    out('def encode(self):')
+    out('    """Encode this %s as a Fudge message (str)"""'% name)
+    out('    return str(self.encode_into(bytearray()))')
+    out()
+
+def _generate_decode_from(out, name, fields):
+    out('@classmethod')
+    out('def decode_from(cls, buffer, offset, end):')
+    out('    """Decode a %s in place from buffer[offset:end]"""'% name)
+    out.indent += 1
+    out('self = cls()')
+    out('# Fields in schema order, with the expected headers')
+    for field, type_, nested, header in fields:
+        _generate_expected_field(out, name, field, type_, nested)
+    out('# Anything else')
+    out('while offset < end:')
+    out.indent += 1
+    out('type_, ordinal, name_offset, value_offset, length = \\')
+    out('        _decode_header(buffer, offset, end)')
+    out('offset = value_offset + length')
+
+    def value_fn(field, nested):
+        if nested:
+            return '%s.decode_from(buffer, value_offset, offset)'% nested
+        return '_decode_value(type_, buffer, value_offset, length)'
+
+    assign = _generate_dispatch(out, name, fields, value_fn)
+    if [f for f in fields if f[0].name is not None]:
+        out('if name_offset is None:')
+        out('    continue')
+        out('name = _dec_name_from(buffer, name_offset)[0]')
+        for field, type_, nested, header in fields:
+            if field.name is not None:
+                out('if name == %r:'% field.name)
+                assign(field, nested)
+    out.indent -= 1
+    out('return self')
+    out.indent -= 1
+    out()
+    out('@classmethod')
+    out('def decode(cls, encoded):')
+    out('    """Decode a %s from an encoded Fudge message"""'% name)
+    out('    return cls.decode_from(encoded, 0, len(encoded))')
+    out()
+
+def _generate_expected_field(out, name, field, type_, nested):
+    """Generate the decoding of a field at offset, if it has exactly the
+    header the schema gives it"""
+    header_name = _constant(name, field.attribute, 'HEADER')
+    if field.repeated:
+        store = 'self.%s.append(%%s)'% field.attribute
+    else:
+        store = 'self.%s = %%s'% field.attribute
+
+    if type_.type_id in _STRUCT_CODES:
+        struct_name = _constant(name, field.attribute, 'STRUCT')
+        if field.repeated:
+            out('while offset + %s.size <= end:'% struct_name)
+            out('    header, value = %s.unpack_from(buffer, offset)'% \
+                    struct_name)
+            out('    if header != %s:'% header_name)
+            out('        break')
+        else:
+            out('if offset + %s.size <= end:'% struct_name)
+            out('    header, value = %s.unpack_from(buffer, offset)'% \
+                    struct_name)
+            out('    if header == %s:'% header_name)
+            out.indent += 1
+        out('    ' + store % 'value')
+        out('    offset += %s.size'% struct_name)
+        if not field.repeated:
+            out.indent -= 1
+        return
+
+    match = '_codegen.match_field(buffer, offset, end, %s, %r)'% \
+            (header_name, type_.fixed_size)
+    if nested:
+        value = '%s.decode_from(buffer, value_offset, offset)'% nested
+    else:
+        value = '_decode_value(%s, buffer, value_offset, \\\n' \
+                '            offset - value_offset)'% \
+                _constant(name, field.attribute, 'TYPE')
+    out('found = ' + match)
+    if field.repeated:
+        out('while found is not None:')
+    else:
+        out('if found is not None:')
+    out.indent += 1
+    out('value_offset, offset = found')
+    for line in (store % value).split('\n'):
+        out(line)
+    if field.repeated:
+        out('found = ' + match)
+    out.indent -= 1
+
+def compile_schema(text, module_name='fudgemsg_generated'):
+    """Parse a schema, and generate and execute its classes.
+
+    Arguments:
+        text: the schema (str or unicode)
+        module_name: the name of the new module
+            (Default: 'fudgemsg_generated')
+
+    Return:
+        A new module holding the generated classes. It is not added to
+        sys.modules.
+    """
+    module = imp.new_module(module_name)
+    code = compile(generate(parse_schema(text)), \
+            '<fudgemsg.codegen %s>'% module_name, 'exec')
+    exec code in module.__dict__
+    return module
+
+def main(argv):
+    """Generate python source from a schema file to stdout"""
+    if len(argv) != 2:
+        print >> sys.stderr, "Usage: %s schema"% argv[0]
+        return 1
+    sys.stdout.write(generate(parse_schema(open(argv[1]).read())))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -25,16 +25,37 @@ These are added to Fudge `Message`s in order to encode
 them, and are returned as the contents of decoded Fudge `Message`s
 
 """
+import struct
+
 from fudgemsg import codecs
 from fudgemsg import prefix
-from fudgemsg.registry import DEFAULT_REGISTRY
+from fudgemsg.registry import DEFAULT_REGISTRY, UnknownTypeError
+from fudgemsg.taxonomy.compiled import CompiledTaxonomy
 from fudgemsg import types
 from fudgemsg import utils
 
 import fudgemsg # For message.Message
 
-class Field:
-    """A Concrete field suitable for including into a Fudge Message"""
+_PREFIX_AND_TYPE = struct.Struct('!BB')
+_VALUE_LENGTHS = {
+    1: codecs.BYTE_STRUCT,
+    2: codecs.SHORT_STRUCT,
+    4: codecs.INT_STRUCT,
+}
+_PADDING = ['\x00' * width for width in range(5)]
+# The prefix bits for each width of value length
+_VARIABLE_WIDTH_PREFIX = dict([(width, \
+        prefix.encode_prefix(False, width, False, False)) \
+        for width in (1, 2, 4)])
+
+class Field(object):
+    """A Concrete field suitable for including into a Fudge Message
+
+    Fields are slotted to keep decoded messages compact: on 64-bit
+    CPython 2.7 a Field takes 80 bytes, plus its name and value, where
+    an instance with a __dict__ took 344.
+    """
+    __slots__ = ('type_', 'ordinal', 'name', 'value')
 
     def __init__(self, type_, ordinal, name, value):
         """Create a new Fudge field.
@@ -51,43 +72,50 @@ class Field:
         self.name = name
         self.value = value
 
-    def size(self, taxonomy=None):
+    def size(self, taxonomy=None, sizes=None):
         """Calculate the size that the field will take up in the message.
 
         Arguments:
              taxonomy: A Taxomomy to be used for replacing names with ordinals.
                  (Default : none)
+             sizes: A dict memoizing sub-message sizes and field
+                 identities for a single encode, see `Message.size` and
+                 `encode_identity` (Default : none)
 
         Returns:
              The size in bytes required to encode this field
 
         """
-        has_ordinal = self.ordinal is not None
-        has_name = self.name is not None
-
-        size = 2 # prefix
-        if self.name and taxonomy:
-            if taxonomy.get_ordinal(self.name):
-                has_ordinal = True
-                has_name = False
-        if has_ordinal:
-            size += 2
-        if has_name:
-            # one for size prefix
-            size += 1 + types.size_unicode(self.name)
+        has_ordinal, has_name, identity = self.encode_identity(taxonomy, sizes)
 
+        size = 2 + len(identity) # prefix and type, ordinal and name
         if self.type_.is_variable_sized:
             # We store a variable sized length and then the value itself
-            if self.is_type(types.FUDGEMSG_TYPE_ID):
-                # sub-message, need to be taxonomy aware
-                value_length = self.type_.calc_size(self.value, taxonomy)
-            else:
-                value_length = self.type_.calc_size(self.value)
+            value_length = self.value_size(taxonomy, sizes)
             size += bytes_for_value_length(value_length) + value_length
         else:
             size += self.type_.fixed_size
         return size
 
+    def value_size(self, taxonomy=None, sizes=None):
+        """Calculate the size of the encoded value of a variable
+        sized field, not including its length.
+
+        Arguments:
+             taxonomy: A Taxomomy to be used for replacing names with ordinals.
+                 (Default : none)
+             sizes: A dict memoizing sub-message sizes for a single encode,
+                 see `Message.size` (Default : none)
+
+        Returns:
+             The size in bytes of the value
+
+        """
+        if self.is_type(types.FUDGEMSG_TYPE_ID):
+            # sub-message, need to be taxonomy aware
+            return self.type_.calc_size(self.value, taxonomy, sizes)
+        return self.type_.calc_size(self.value)
+
     def is_type(self, type_id):
         """Return True if this type has ID equal to type_id.
 
@@ -107,52 +135,173 @@ class Field:
         else:
             return "Field[%s-'%s']"% (self.type_, self.value)
 
-    def encode(self, writer, taxonomy=None):
+    def encode(self, writer, taxonomy=None, sizes=None):
         """Encode a Field.
 
         This encodes Field Prefix, Type, Ordinal, Name, Data
 
+        Arguments:
+            writer: the writer object to write the field to
+            taxonomy: A Taxomomy to be used for replacing names with ordinals.
+                (Default : none)
+            sizes: A dict memoizing sub-message sizes and field
+                identities for a single encode, see `Message.size` and
+                `encode_identity` (Default : none)
+
         """
         variable_width = 0
         if self.type_.is_variable_sized:
-            if self.is_type(types.FUDGEMSG_TYPE_ID):
-                # sub-message, need to be taxonomy aware
-                value_length = self.type_.calc_size(self.value, taxonomy)
-            else:
-                value_length = self.type_.calc_size(self.value)
+            value_length = self.value_size(taxonomy, sizes)
             variable_width = bytes_for_value_length(value_length)
 
-        ordinal = self.ordinal
-        name = self.name
-        if taxonomy and self.name:
-            tax_ord = taxonomy.get_ordinal(self.name)
-            if tax_ord:
-                ordinal = tax_ord
-                name = None
-
+        has_ordinal, has_name, identity = self.encode_identity(taxonomy, sizes)
         prefix_byte = prefix.encode_prefix(not self.type_.is_variable_sized, \
-                variable_width, ordinal is not None, name is not None)
+                variable_width, has_ordinal, has_name)
 
         # And write it out
         writer.write(chr(prefix_byte))
         writer.write(codecs.enc_byte(self.type_.type_id))
-        if ordinal is not None:
-            writer.write(codecs.enc_short(ordinal))
-        if name:
-            assert len(name) <= utils.MAX_BYTE
-            writer.write(codecs.enc_name(name))
+        writer.write(identity)
 
         if self.type_.is_variable_sized:
             encode_value_length(value_length, writer)
 
         if self.is_type(types.FUDGEMSG_TYPE_ID):
-            self.value.encode(writer, taxonomy)
+            self.value.encode(writer, taxonomy, sizes)
         else:
             writer.write(self.type_.encoder(self.value))
 
+    def encode_into(self, buffer, taxonomy=None, headers=None):
+        """Encode a Field onto the end of a bytearray.
+
+        No sizing pass is needed: the length of a sub-message is given a
+        one byte slot which is backpatched, and widened if necessary,
+        once the sub-message has been written.
+
+        Arguments:
+            buffer: the bytearray to append the field to
+            taxonomy: A Taxomomy to be used for replacing names with ordinals.
+                (Default : none)
+            headers: A dict memoizing encoded field headers by type,
+                ordinal and name, see `encode_header`. It must only be
+                shared between encodes using the same taxonomy.
+                (Default : none)
+
+        """
+        type_ = self.type_
+        if headers is None:
+            header = self.encode_header(taxonomy)
+        else:
+            key = (type_, self.ordinal, self.name)
+            header = headers.get(key)
+            if header is None:
+                header = headers[key] = self.encode_header(taxonomy)
+
+        start = len(buffer)
+        buffer.extend(header)
+
+        if not type_.is_variable_sized:
+            if type_.encode_into:
+                type_.encode_into(buffer, self.value)
+            else:
+                buffer.extend(type_.encoder(self.value))
+            return
+
+        if type_.type_id == types.FUDGEMSG_TYPE_ID:
+            length_pos = len(buffer)
+            buffer.append(0)
+            self.value.encode_into(buffer, taxonomy, headers)
+            value_length = len(buffer) - length_pos - 1
+            variable_width = bytes_for_value_length(value_length)
+            if variable_width > 1:
+                buffer[length_pos + 1:length_pos + 1] = \
+                        _PADDING[variable_width - 1]
+            encode_value_length_into(value_length, buffer, length_pos, \
+                    variable_width)
+        else:
+            value = type_.encoder(self.value)
+            value_length = len(value)
+            variable_width = bytes_for_value_length(value_length)
+            length_pos = len(buffer)
+            buffer.extend(_PADDING[variable_width])
+            encode_value_length_into(value_length, buffer, length_pos, \
+                    variable_width)
+            buffer.extend(value)
+        buffer[start] |= _VARIABLE_WIDTH_PREFIX[variable_width]
+
+    def encode_header(self, taxonomy=None):
+        """Encode the prefix, type, ordinal and name of the Field.
+
+        The width of a variable sized value is not known until it is
+        encoded, so is left out of the prefix.
+
+        Arguments:
+            taxonomy: A Taxomomy to be used for replacing names with ordinals.
+                (Default : none)
+
+        Return:
+            The encoded header (str)
+        """
+        type_ = self.type_
+        has_ordinal, has_name, identity = self.encode_identity(taxonomy)
+        return _PREFIX_AND_TYPE.pack( \
+                prefix.encode_prefix(not type_.is_variable_sized, 0, \
+                    has_ordinal, has_name), \
+                type_.type_id) + identity
+
+    def encode_identity(self, taxonomy=None, sizes=None):
+        """Encode the ordinal and name of the Field, as they follow its
+        type on the wire.
+
+        A name in the taxonomy is replaced by its ordinal. A
+        `CompiledTaxonomy` hands back the ordinal already encoded.
+
+        Arguments:
+            taxonomy: A Taxomomy to be used for replacing names with ordinals.
+                (Default : none)
+            sizes: A dict memoizing the identity by id() for the length
+                of a single encode, so `size` and `encode` only look the
+                name up once (Default : none)
+
+        Return:
+            (has_ordinal, has_name, encoded)
+        """
+        if sizes is not None:
+            identity = sizes.get(id(self))
+            if identity is not None:
+                return identity
+
+        ordinal = self.ordinal
+        name = self.name
+        identity = None
+        if taxonomy and name:
+            if taxonomy.__class__ is CompiledTaxonomy:
+                encoded = taxonomy.encoded_ordinal(name)
+                if encoded is not None:
+                    identity = (True, False, encoded)
+            else:
+                tax_ord = taxonomy.get_ordinal(name)
+                if tax_ord:
+                    ordinal = tax_ord
+                    name = None
+
+        if identity is None:
+            encoded = []
+            if ordinal is not None:
+                encoded.append(codecs.enc_short(ordinal))
+            if name is not None:
+                utf8 = name.encode('utf-8')
+                assert len(utf8) <= utils.MAX_BYTE
+                encoded.append(chr(len(utf8)))
+                encoded.append(utf8)
+            identity = (ordinal is not None, name is not None, \
+                    ''.join(encoded))
+        if sizes is not None:
+            sizes[id(self)] = identity
+        return identity
 
     @classmethod
-    def decode(cls, encoded, taxonomy=None):
+    def decode(cls, encoded, taxonomy=None, registry=DEFAULT_REGISTRY):
         """Decode a field from a byte array.
 
         Returns:
@@ -166,49 +315,243 @@ class Field:
 
         """
         assert len(encoded) >= 2
+        return cls.decode_from(encoded, 0, len(encoded), taxonomy, registry)
+
+    @classmethod
+    def decode_from(cls, buffer, offset, end, taxonomy=None, \
+            registry=DEFAULT_REGISTRY):
+        """Decode a field in place from a buffer, starting at offset.
+
+        The buffer is walked with an integer cursor rather than being
+        sliced, so only the bytes making up the field's name and value
+        are ever copied out of it.
+
+        Arguments:
+            buffer: the encoded bytes (str, bytearray, mmap or memoryview)
+            offset: the position of the field prefix within buffer
+            end: the position just past the last byte this field may use
+            taxonomy: A Taxonomy used to look up names for
+                ordinals (Default: None)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+
+        Returns:
+            (field, offset).
+
+            field: the field read from the buffer
+            offset: the position just past the end of the field
+
+        Raises:
+            Error: if there is not enough bytes in the buffer for the field.
+
+        """
+        field_type, ordinal, name_offset, pos, value_length = \
+                decode_header(buffer, offset, end, registry)
 
-        # prefix
-        pos = 0
-        fixedwidth, variablewidth, has_ordinal, has_name = \
-                prefix.decode_prefix(ord(encoded[pos]))
-        pos += 1
-        type_id = ord(encoded[pos])
-        # TODO(jamesc) - need to handle user supplied registries
-        field_type = DEFAULT_REGISTRY[type_id]
-        pos += 1
-
-        # ordinal
-        ordinal = None
-        if has_ordinal:
-            ordinal = codecs.dec_short(encoded[pos:])
-            pos += 2
-
-        # name
         name = None
-        if has_name:
-            name_len = ord(encoded[pos])
-            pos += 1 # length encoded as 1 byte
-            name = codecs.dec_unicode(encoded[pos:pos+name_len])
-            pos += name_len
-        elif has_ordinal and taxonomy:
+        if name_offset is not None:
+            name = codecs.dec_name_from(buffer, name_offset)[0]
+        elif ordinal is not None and taxonomy:
             name = taxonomy.get_name(ordinal)
 
-        # value
-        if fixedwidth:
-            value = field_type.decoder(encoded[pos:pos+field_type.fixed_size])
-            pos += field_type.fixed_size
-        else:
-            value_length = decode_value_length(encoded[pos:], variablewidth)
+        value = decode_value(field_type, buffer, pos, value_length, taxonomy, \
+                registry)
+        field = Field(field_type, ordinal, name, value)
+        return field, pos + value_length
+
+
+# Marks a LazyField name or value which has not been decoded yet
+_UNDECODED = object()
 
-            pos += variablewidth
-            if type_id == types.FUDGEMSG_TYPE_ID:
-                value = fudgemsg.message.Message.decode(encoded[pos:pos+value_length], taxonomy)
+class LazyField(Field):
+    """A Field whose name and value are decoded from the underlying
+    buffer only when they are first used.
+
+    These are the fields of a `fudgemsg.message.LazyMessage`.
+    """
+    __slots__ = ('_buffer', '_name_offset', '_value_offset', \
+            '_value_length', '_taxonomy', '_registry', '_name', '_value')
+
+    def __init__(self, type_, ordinal, buffer, name_offset, value_offset, \
+            value_length, taxonomy=None, registry=DEFAULT_REGISTRY):
+        """Create a new lazily decoded Fudge field.
+
+        Arguments:
+            type_ : FieldType
+            ordinal : short, or None
+            buffer: the encoded bytes holding the field
+            name_offset: position of the length prefixed name within
+                buffer, or None if the field has no name
+            value_offset: position of the value within buffer
+            value_length: the length in bytes of the value
+            taxonomy: A Taxonomy used to look up names for
+                ordinals (Default: None)
+            registry: the Registry a sub-message looks field types up in
+                (Default: DEFAULT_REGISTRY)
+
+        """
+        self.type_ = type_
+        self.ordinal = ordinal
+        self._buffer = buffer
+        self._name_offset = name_offset
+        self._value_offset = value_offset
+        self._value_length = value_length
+        self._taxonomy = taxonomy
+        self._registry = registry
+        self._name = _UNDECODED
+        self._value = _UNDECODED
+
+    def _get_name(self):
+        if self._name is _UNDECODED:
+            if self._name_offset is not None:
+                self._name = codecs.dec_name_from(self._buffer, \
+                        self._name_offset)[0]
+            elif self.ordinal is not None and self._taxonomy:
+                self._name = self._taxonomy.get_name(self.ordinal)
             else:
-                value = field_type.decoder(encoded[pos:pos+value_length])
-            pos += value_length
+                self._name = None
+        return self._name
 
-        field = Field(field_type, ordinal, name, value)
-        return field, pos
+    def _set_name(self, name):
+        self._name = name
+
+    name = property(_get_name, _set_name)
+
+    def _get_value(self):
+        if self._value is _UNDECODED:
+            if self.type_.type_id == types.FUDGEMSG_TYPE_ID:
+                self._value = fudgemsg.message.LazyMessage(self._buffer, \
+                        self._value_offset, \
+                        self._value_offset + self._value_length, \
+                        self._taxonomy, self._registry)
+            else:
+                self._value = decode_value(self.type_, self._buffer, \
+                        self._value_offset, self._value_length)
+        return self._value
+
+    def _set_value(self, value):
+        self._value = value
+
+    value = property(_get_value, _set_value)
+
+    def value_size(self, taxonomy=None, sizes=None):
+        """Calculate the size of the encoded value of a variable
+        sized field, see `Field.value_size`.
+
+        A value which has not been decoded yet is sized from the buffer,
+        so sizing (and so len()) doesn't decode it.
+        """
+        if self._value is _UNDECODED and \
+                self.type_.type_id != types.FUDGEMSG_TYPE_ID:
+            return self._value_length
+        return Field.value_size(self, taxonomy, sizes)
+
+    @classmethod
+    def decode_from(cls, buffer, offset, end, taxonomy=None, \
+            registry=DEFAULT_REGISTRY):
+        """Scan a field in place from a buffer, starting at offset.
+
+        Only the field header is decoded, see `Field.decode_from`.
+
+        Returns:
+            (field, offset).
+
+            field: the lazily decoded field
+            offset: the position just past the end of the field
+
+        """
+        field_type, ordinal, name_offset, pos, value_length = \
+                decode_header(buffer, offset, end, registry)
+        field = LazyField(field_type, ordinal, buffer, name_offset, pos, \
+                value_length, taxonomy, registry)
+        return field, pos + value_length
+
+def decode_header(buffer, offset, end, registry=DEFAULT_REGISTRY):
+    """Decode the header of a field in place, without touching
+    its name or value.
+
+    Type ids which are not in the registry decode as opaque byte
+    strings if the field is variable width, see `Registry.unknown_type`.
+
+    Arguments:
+        buffer: the encoded bytes (str, bytearray, mmap or memoryview)
+        offset: the position of the field prefix within buffer
+        end: the position just past the last byte this field may use
+        registry: the Registry to look the field type up in
+            (Default: DEFAULT_REGISTRY)
+
+    Return:
+        (field_type, ordinal, name_offset, value_offset, value_length)
+
+        name_offset: the position of the length prefixed name, or None
+            if the field has no name
+
+    Raises:
+        Error: if there is not enough bytes in the buffer for the field.
+        UnknownTypeError: if the field is fixed width and its type is
+            not in the registry, so its size is unknown
+
+    """
+    assert end - offset >= 2
+
+    # prefix and type
+    prefix_byte, type_id = _PREFIX_AND_TYPE.unpack_from(buffer, offset)
+    fixedwidth, variablewidth, has_ordinal, has_name = \
+            prefix.decode_prefix(prefix_byte)
+    field_type = registry.types_by_index[type_id]
+    if field_type is None:
+        if fixedwidth:
+            raise UnknownTypeError("Unknown fixed width type : %s"% type_id)
+        field_type = registry.unknown_type(type_id)
+    pos = offset + 2
+
+    # ordinal
+    ordinal = None
+    if has_ordinal:
+        ordinal, pos = codecs.dec_short_from(buffer, pos)
+
+    # name
+    name_offset = None
+    if has_name:
+        name_offset = pos
+        pos += 1 + codecs.dec_byte_from(buffer, pos)[0]
+
+    # value
+    if fixedwidth:
+        value_length = field_type.fixed_size
+    else:
+        value_length = decode_value_length_from(buffer, pos, variablewidth)
+        pos += variablewidth
+    assert pos + value_length <= end
+
+    return field_type, ordinal, name_offset, pos, value_length
+
+def decode_value(field_type, buffer, offset, length, taxonomy=None, \
+        registry=DEFAULT_REGISTRY):
+    """Decode the value of a field in place.
+
+    Arguments:
+        field_type: the FieldType of the value
+        buffer: the encoded bytes (str, bytearray, mmap or memoryview)
+        offset: the position of the value within buffer
+        length: the length in bytes of the value
+        taxonomy: A Taxonomy used to look up names for
+            ordinals in a sub-message (Default: None)
+        registry: the Registry a sub-message looks field types up in
+            (Default: DEFAULT_REGISTRY)
+
+    Return:
+        The decoded value
+
+    """
+    if field_type.type_id == types.FUDGEMSG_TYPE_ID:
+        return fudgemsg.message.Message.decode_from(buffer, offset, \
+                offset + length, taxonomy, registry)
+    elif field_type.decode_from:
+        return field_type.decode_from(buffer, offset, length)
+    else:
+        return field_type.decoder(codecs.slice_bytes(buffer, offset, \
+                offset + length))
 
 def bytes_for_value_length(length):
     """For a value length, calculate how many
@@ -249,6 +592,21 @@ def encode_value_length(value_length, writer):
     else:
         writer.write(codecs.enc_int(value_length))
 
+def encode_value_length_into(value_length, buffer, offset, width):
+    """Write the length of a value as a var_width length into
+    a slot already reserved in a bytearray.
+
+    Arguments:
+        value_length: the length in bytes of the value object
+        buffer: the bytearray to write the length into
+        offset: the position of the reserved slot within buffer
+        width: the width of the slot (1, 2 or 4), see
+            `bytes_for_value_length`
+
+    """
+    assert width in (1, 2, 4)
+    _VALUE_LENGTHS[width].pack_into(buffer, offset, value_length)
+
 def decode_value_length(encoded, width):
     """Decode the length of a value from a
     var_width length.
@@ -271,3 +629,22 @@ def decode_value_length(encoded, width):
         return codecs.dec_short(encoded[0:2])
     else:
         return codecs.dec_int(encoded[0:4])
+
+def decode_value_length_from(buffer, offset, width):
+    """Decode the length of a value from a var_width length
+    held at offset within buffer.
+
+    Arguments:
+        buffer: The buffer to read from
+        offset: The position of the length within buffer
+        width:  The number of bytes to read (0, 1, 2, 4)
+
+    Return:
+        The decoded value length
+
+    """
+    assert width in (0, 1, 2, 4)
+
+    if width == 0:
+        return 0
+    return _VALUE_LENGTHS[width].unpack_from(buffer, offset)[0]
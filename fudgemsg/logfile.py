@@ -0,0 +1,379 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Append-only log files of Fudge Envelopes with random access.
+
+The data file is the envelopes one after another, so it can still be
+read with `stream.read_envelopes`. Alongside it, <path>.idx holds an
+8 byte header ('!4sHH': magic 'FIDX', version, reserved) then one
+fixed size entry per envelope ('!Qq': offset in the data file,
+timestamp), so the Nth envelope is found without scanning.
+
+Timestamps are integers chosen by the writer, typically nanoseconds
+since the epoch, or NO_TIMESTAMP.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+
+from fudgemsg.message import Envelope, HEADER_SIZE, HEADER_STRUCT, \
+        encode_many
+from fudgemsg.registry import DEFAULT_REGISTRY
+
+INDEX_MAGIC = 'FIDX'
+INDEX_VERSION = 1
+INDEX_HEADER_STRUCT = struct.Struct('!4sHH')
+INDEX_ENTRY_STRUCT = struct.Struct('!Qq')
+
+NO_TIMESTAMP = -(1 << 63)
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+def index_filename(filename):
+    """Return the path of the index of a log file."""
+    return filename + '.idx'
+
+def _map(filename):
+    """Map a file read-only, or return '' if it is empty."""
+    reader = open(filename, 'rb')
+    try:
+        if not os.fstat(reader.fileno()).st_size:
+            return ''
+        return mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        reader.close()
+
+
+class LogWriter(object):
+    """Appends Envelopes to a log file and its index.
+
+    Writes are buffered, the envelope data always being written before
+    the index entries for it. Opening an existing log appends to it,
+    first indexing any envelopes the index does not cover, so a plain
+    recording of concatenated envelopes can be opened as a log, and
+    dropping a trailing envelope a crash left half written.
+    """
+    def __init__(self, filename, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Open a log file for appending, creating it if necessary.
+
+        Arguments:
+            filename: the path of the data file
+            buffer_size: how many bytes of envelopes to buffer before
+                writing them out (Default: DEFAULT_BUFFER_SIZE)
+
+        Raises:
+            ValueError: if the file holds something other than envelopes
+        """
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self._data = open(filename, 'a+b')
+        self._index = open(index_filename(filename), 'a+b')
+        self._buffer = bytearray()
+        self._entries = bytearray()
+        # Taxonomy -> field header cache, see encode_many
+        self._headers = {}
+        try:
+            self._recover()
+        except:
+            self._data.close()
+            self._index.close()
+            raise
+
+    def _recover(self):
+        """Find where to append, indexing any complete envelopes in the
+        data file which the index does not cover, such as those of a
+        recording made without one, and truncating any envelope or
+        index entry which was not completely written."""
+        index_size = os.fstat(self._index.fileno()).st_size
+        if index_size < INDEX_HEADER_STRUCT.size:
+            self._index.truncate(0)
+            self._index.write(INDEX_HEADER_STRUCT.pack(INDEX_MAGIC, \
+                    INDEX_VERSION, 0))
+            self._index.flush()
+            index_size = INDEX_HEADER_STRUCT.size
+        else:
+            self._index.seek(0)
+            _check_index_header(self._index.read(INDEX_HEADER_STRUCT.size), \
+                    self.filename)
+        count = (index_size - INDEX_HEADER_STRUCT.size) // \
+                INDEX_ENTRY_STRUCT.size
+        data_size = os.fstat(self._data.fileno()).st_size
+
+        # Walk back to the last entry whose envelope is all there
+        end = 0
+        while count:
+            self._index.seek(INDEX_HEADER_STRUCT.size + \
+                    (count - 1) * INDEX_ENTRY_STRUCT.size)
+            offset = INDEX_ENTRY_STRUCT.unpack( \
+                    self._index.read(INDEX_ENTRY_STRUCT.size))[0]
+            size = self._envelope_size(offset, data_size)
+            if size is not None:
+                end = offset + size
+                break
+            count -= 1
+        self._index.truncate(INDEX_HEADER_STRUCT.size + \
+                count * INDEX_ENTRY_STRUCT.size)
+
+        # Then forward over the envelopes written after it
+        while True:
+            size = self._envelope_size(end, data_size)
+            if size is None:
+                break
+            self._entries.extend(INDEX_ENTRY_STRUCT.pack(end, NO_TIMESTAMP))
+            end += size
+            count += 1
+
+        # Drop a trailing envelope which runs past the end of the file
+        self._data.truncate(end)
+        self._offset = end
+        self.count = count
+        self.flush()
+
+    def _envelope_size(self, offset, data_size):
+        """Return the size of the envelope at offset in the data file,
+        or None if it runs past the end of the file.
+
+        Raises:
+            ValueError: if the header has an impossible size
+        """
+        if offset + HEADER_SIZE > data_size:
+            return None
+        self._data.seek(offset)
+        size = HEADER_STRUCT.unpack(self._data.read(HEADER_SIZE))[3]
+        if size < HEADER_SIZE:
+            raise ValueError("Corrupt envelope header at %d in %s"% \
+                    (offset, self.filename))
+        if offset + size > data_size:
+            return None
+        return size
+
+    def append(self, envelope, timestamp=NO_TIMESTAMP, taxonomy_id=0):
+        """Append an Envelope to the log.
+
+        Arguments:
+            envelope: the Envelope to append
+            timestamp: an integer to index it by, see `LogReader.find`
+                (Default: NO_TIMESTAMP)
+            taxonomy_id: the id of the Taxonomy to encode with (Default: 0)
+
+        Return:
+            The index of the envelope in the log
+        """
+        start = len(self._buffer)
+        encode_many((envelope,), self._buffer, taxonomy_id, self._headers)
+        return self._add_entry(len(self._buffer) - start, timestamp)
+
+    def append_encoded(self, encoded, timestamp=NO_TIMESTAMP):
+        """Append an already encoded Envelope to the log.
+
+        Arguments:
+            encoded: the encoded Envelope (str, bytearray or buffer)
+            timestamp: an integer to index it by (Default: NO_TIMESTAMP)
+
+        Return:
+            The index of the envelope in the log
+        """
+        assert len(encoded) >= HEADER_SIZE and \
+                HEADER_STRUCT.unpack_from(encoded, 0)[3] == len(encoded)
+        self._buffer.extend(encoded)
+        return self._add_entry(len(encoded), timestamp)
+
+    def _add_entry(self, size, timestamp):
+        self._entries.extend(INDEX_ENTRY_STRUCT.pack(self._offset, timestamp))
+        self._offset += size
+        self.count += 1
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+        return self.count - 1
+
+    def flush(self):
+        """Write out the buffered envelopes and their index entries."""
+        if self._buffer:
+            self._data.write(self._buffer)
+            self._data.flush()
+            del self._buffer[:]
+        if self._entries:
+            self._index.write(self._entries)
+            self._index.flush()
+            del self._entries[:]
+
+    def close(self):
+        """Flush and close the log."""
+        try:
+            self.flush()
+        finally:
+            self._data.close()
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _check_index_header(header, filename):
+    if len(header) < INDEX_HEADER_STRUCT.size:
+        raise ValueError("Not a Fudge log index : %s"% filename)
+    magic, version, _ = INDEX_HEADER_STRUCT.unpack_from(header, 0)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        raise ValueError("Not a Fudge log index : %s"% filename)
+
+
+class LogReader(object):
+    """Random access to the Envelopes in a log file.
+
+    The data file and its index are memory mapped, and envelopes are
+    decoded in place from the mapping. Envelopes appended after the
+    log was opened are not seen until `refresh` is called.
+
+    LazyMessages read from the log refer to the mapping, so must not be
+    used after the reader is closed.
+    """
+    def __init__(self, filename, taxonomy_resolver=None, lazy=False, \
+            registry=DEFAULT_REGISTRY):
+        """Open a log file for reading.
+
+        Arguments:
+            filename: the path of the data file
+            taxonomy_resolver: used to find the Taxonomy named in each
+                envelope header (Default: None)
+            lazy: decode messages as `LazyMessage`s (Default: False)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+
+        Raises:
+            ValueError: if the index is not a log index
+        """
+        self.filename = filename
+        self.taxonomy_resolver = taxonomy_resolver
+        self.lazy = lazy
+        self.registry = registry
+        self._data = self._index = ''
+        self.refresh()
+
+    def refresh(self):
+        """Remap the log, to see any envelopes appended since it was
+        opened."""
+        self.close()
+        self._index = _map(index_filename(self.filename))
+        _check_index_header(self._index, self.filename)
+        self._data = _map(self.filename)
+        count = (len(self._index) - INDEX_HEADER_STRUCT.size) // \
+                INDEX_ENTRY_STRUCT.size
+        # Only entries whose envelopes have been written out
+        while count and not self._complete(self._entry(count - 1)[0]):
+            count -= 1
+        self._count = count
+
+    def _complete(self, offset):
+        data = self._data
+        return offset + HEADER_SIZE <= len(data) and \
+                offset + HEADER_STRUCT.unpack_from(data, offset)[3] <= len(data)
+
+    def _entry(self, n):
+        return INDEX_ENTRY_STRUCT.unpack_from(self._index, \
+                INDEX_HEADER_STRUCT.size + n * INDEX_ENTRY_STRUCT.size)
+
+    def _position(self, n):
+        if n < 0:
+            n += self._count
+        if not 0 <= n < self._count:
+            raise IndexError("Log index out of range : %d"% n)
+        return n
+
+    def offset(self, n):
+        """Return the offset of the Nth envelope in the data file."""
+        return self._entry(self._position(n))[0]
+
+    def timestamp(self, n):
+        """Return the timestamp of the Nth envelope, or None if it was
+        appended without one."""
+        timestamp = self._entry(self._position(n))[1]
+        if timestamp == NO_TIMESTAMP:
+            return None
+        return timestamp
+
+    def raw(self, n):
+        """Return the encoded Nth envelope as a zero-copy read-only
+        buffer onto the mapping, for forwarding without decoding."""
+        offset = self.offset(n)
+        size = HEADER_STRUCT.unpack_from(self._data, offset)[3]
+        return buffer(self._data, offset, size)
+
+    def __getitem__(self, n):
+        """Decode the Nth envelope, from the end if n is negative."""
+        return Envelope.decode_from(self._data, self.offset(n), \
+                self.taxonomy_resolver, self.lazy, self.registry)[0]
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return self.read_from(0)
+
+    def read_from(self, n):
+        """Generate the envelopes from the Nth to the end of the log."""
+        if n >= self._count:
+            return
+        data = self._data
+        offset = self.offset(n)
+        end = self._entry(self._count - 1)[0]
+        while offset <= end:
+            envelope, offset = Envelope.decode_from(data, offset, \
+                    self.taxonomy_resolver, self.lazy, self.registry)
+            yield envelope
+
+    def find(self, timestamp):
+        """Return the index of the first envelope with a timestamp at
+        or after a given one, or len(self) if there is none. Timestamps
+        must have been appended in order.
+
+        Arguments:
+            timestamp: the timestamp to search for
+        """
+        return bisect.bisect_left(_Timestamps(self), timestamp)
+
+    def close(self):
+        """Unmap the log."""
+        for mapped in (self._data, self._index):
+            if not isinstance(mapped, str):
+                mapped.close()
+        self._data = self._index = ''
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _Timestamps(object):
+    """The timestamps of a log as a sequence, for bisect."""
+    def __init__(self, reader):
+        self._reader = reader
+
+    def __len__(self):
+        return len(self._reader)
+
+    def __getitem__(self, n):
+        return self._reader._entry(n)[1]
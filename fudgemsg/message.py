@@ -21,20 +21,31 @@
 
 import struct
 
-from fudgemsg.field import Field
+from fudgemsg.field import Field, LazyField
 from fudgemsg import registry
 
 HEADER_PACKING = "!BBhl"
+HEADER_STRUCT = struct.Struct(HEADER_PACKING)
+HEADER_SIZE = HEADER_STRUCT.size
+_HEADER_PADDING = '\x00' * HEADER_SIZE
 
 class Message(object):
     """A Fudge Message.
 
+    Messages are slotted, taking 88 bytes plus their fields list on
+    64-bit CPython 2.7.
+
     """
+    __slots__ = ('fields', 'registry', '_by_name', '_by_ordinal', \
+            '_indexed')
 
-    def __init__(self, registry=registry.Registry()):
+    def __init__(self, registry=registry.DEFAULT_REGISTRY):
         self.fields = []
         self.registry = registry
-
+        # name -> [Field], ordinal -> [Field]; built on first lookup
+        self._by_name = None
+        self._by_ordinal = None
+        self._indexed = 0
 
     def __str__(self):
         return "Message[fields=%s]"% self.fields
@@ -42,48 +53,235 @@ class Message(object):
     def __len__(self):
         return self.size()
 
-    def size(self, taxonomy=None):
-        """Compute the size for the fields in the message."""
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __getitem__(self, key):
+        """Return the first field with a given ordinal (if key is an
+        integer) or name.
+
+        Raises:
+            KeyError: if there is no such field
+        """
+        if isinstance(key, (int, long)):
+            fields = self._ordinal_index().get(key)
+        else:
+            fields = self._name_index().get(key)
+        if not fields:
+            raise KeyError(key)
+        return fields[0]
+
+    def get(self, name, default=None):
+        """Return the first field with a given name.
+
+        Arguments:
+            name: the name of the field
+            default: returned if there is no such field (Default: None)
+        """
+        fields = self._name_index().get(name)
+        if fields:
+            return fields[0]
+        return default
+
+    def get_by_ordinal(self, ordinal, default=None):
+        """Return the first field with a given ordinal.
+
+        Arguments:
+            ordinal: the ordinal of the field
+            default: returned if there is no such field (Default: None)
+        """
+        fields = self._ordinal_index().get(ordinal)
+        if fields:
+            return fields[0]
+        return default
+
+    def get_all(self, name):
+        """Return a list of all the fields with a given name, in order."""
+        return list(self._name_index().get(name, ()))
+
+    def _name_index(self):
+        if self._by_name is None or self._indexed != len(self.fields):
+            self._build_indexes()
+        return self._by_name
+
+    def _ordinal_index(self):
+        if self._by_ordinal is None or self._indexed != len(self.fields):
+            self._build_indexes()
+        return self._by_ordinal
+
+    def _build_indexes(self):
+        """Index the fields by name and ordinal, for the lookup methods.
+
+        The indexes are dropped whenever a field is added, and are
+        rebuilt if fields has changed length under them."""
+        by_name = {}
+        by_ordinal = {}
+        for field in self.fields:
+            if field.name is not None:
+                by_name.setdefault(field.name, []).append(field)
+            if field.ordinal is not None:
+                by_ordinal.setdefault(field.ordinal, []).append(field)
+        self._by_name = by_name
+        self._by_ordinal = by_ordinal
+        self._indexed = len(self.fields)
+
+    def size(self, taxonomy=None, sizes=None):
+        """Compute the size for the fields in the message.
+
+        Arguments:
+            taxonomy: A Taxomomy to be used for replacing names with ordinals.
+                (Default : none)
+            sizes: A dict memoizing message sizes by id() for the length
+                of a single encode, so each sub-message is only sized
+                once however deep it is nested. Fields keep their
+                encoded identities in it too, see
+                `Field.encode_identity`. (Default : none)
+        """
+        if sizes is not None:
+            try:
+                return sizes[id(self)]
+            except KeyError:
+                pass
         size = 0
         for field in self.fields:
-            size = size + field.size(taxonomy)
+            size = size + field.size(taxonomy, sizes)
+        if sizes is not None:
+            sizes[id(self)] = size
         return size
 
     def add(self, value, name=None, ordinal=None, type_=None, classname=None):
         """Add a new value to the message"""
-        if not type_:
-            # Try and work it out
-            type_ = self.registry.type_by_class(value, classname=classname)
-
-        type_ = self.registry.narrow(type_, value)
+        if type_:
+            type_ = self.registry.narrow(type_, value)
+        elif classname:
+            type_ = self.registry.narrow( \
+                    self.registry.type_by_class(value, classname), value)
+        else:
+            # Work it out, skipping narrowing for types which never narrow
+            type_ = self.registry.narrowed_type(value)
         self._add_field(Field(type_, ordinal, name, value),)
 
     def _add_field(self, field):
         self.fields.append(field)
+        self._by_name = None
+        self._by_ordinal = None
+
+    def encode(self, writer, taxonomy=None, sizes=None):
+        """Encode the fields of the message to writer.
+
+        Arguments:
+            writer: the writer object to write the fields to
+            taxonomy: A Taxomomy to be used for replacing names with ordinals.
+                (Default : none)
+            sizes: A dict of already computed message sizes, see `size`.
+                A fresh one is used if not given. (Default : none)
+        """
+        if sizes is None:
+            sizes = {}
+        for field in self.fields:
+            field.encode(writer, taxonomy, sizes)
 
-    def encode(self, writer, taxonomy=None):
+    def encode_into(self, buffer, taxonomy=None, headers=None):
+        """Encode the fields of the message onto the end of a bytearray.
+
+        Arguments:
+            buffer: the bytearray to append the fields to
+            taxonomy: A Taxomomy to be used for replacing names with ordinals.
+                (Default : none)
+            headers: A dict memoizing encoded field headers, see
+                `Field.encode_into` (Default : none)
+
+        Return:
+            buffer
+        """
         for field in self.fields:
-            field.encode(writer, taxonomy)
+            field.encode_into(buffer, taxonomy, headers)
+        return buffer
+
+    @classmethod
+    def decode(cls, encoded, taxonomy=None, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Decode a message from a byte array holding just its fields."""
+        return cls.decode_from(encoded, 0, len(encoded), taxonomy, registry)
 
     @classmethod
-    def decode(cls, encoded, taxonomy=None):
-        message = Message()
-        while encoded:
-            next_field, num_read = Field.decode(encoded, taxonomy)
+    def decode_from(cls, buffer, offset, end, taxonomy=None, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Decode the fields held in buffer[offset:end] into a message.
+
+        The buffer is never sliced, each field is decoded in place so the
+        cost is linear in the size of the message.
+
+        Arguments:
+            buffer: the encoded bytes (str, bytearray, mmap or memoryview)
+            offset: the position of the first field within buffer
+            end: the position just past the last field
+            taxonomy: A Taxonomy used to look up names for
+                ordinals (Default: None)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+
+        Return:
+            The decoded Message
+        """
+        message = Message(registry)
+        while offset < end:
+            next_field, offset = Field.decode_from(buffer, offset, end, \
+                    taxonomy, registry)
             message._add_field(next_field)
-            encoded = encoded[num_read:]
         return message
 
+class LazyMessage(Message):
+    """A Fudge Message decoded on demand.
+
+    Construction only scans the field boundaries in the buffer; each
+    field's name and value, including any sub-message, is decoded when
+    first used. The buffer must not be changed while the message is
+    in use.
+
+    """
+    __slots__ = ()
+
+    def __init__(self, buffer, offset=0, end=None, taxonomy=None, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Scan the fields held in buffer[offset:end].
+
+        Arguments:
+            buffer: the encoded bytes (str, bytearray, mmap or memoryview)
+            offset: the position of the first field within buffer
+                (Default: 0)
+            end: the position just past the last field (Default: the
+                end of buffer)
+            taxonomy: A Taxonomy used to look up names for
+                ordinals (Default: None)
+        """
+        Message.__init__(self, registry)
+        if end is None:
+            end = len(buffer)
+        while offset < end:
+            next_field, offset = LazyField.decode_from(buffer, offset, end, \
+                    taxonomy, registry)
+            self._add_field(next_field)
+
+    @classmethod
+    def decode_from(cls, buffer, offset, end, taxonomy=None, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Lazily decode the fields held in buffer[offset:end]."""
+        return LazyMessage(buffer, offset, end, taxonomy, registry)
+
 class Envelope(object):
     """A Fudge envelope.
 
     This contains a message, and holds the metadata for the message (Schema
     Version and Taxonomy used)"""
+    __slots__ = ('message', 'schema_version', 'directives', \
+            'taxonomy_resolver')
+
     def __init__(self, message, directives=0, schema_version=0, taxonomy_resolver=None):
         self.message = message
         self.schema_version = schema_version
         self.directives = directives
-        self.taxonomy_resolver = None
+        self.taxonomy_resolver = taxonomy_resolver
 
     def __str__(self):
         return "Envelope(directives=%r, schema version=%r)"% \
@@ -95,27 +293,163 @@ class Envelope(object):
         taxonomy = None
         if taxonomy_id:
             taxonomy = self.taxonomy_resolver.resolve_taxonomy(taxonomy_id)
-        size = self.message.size(taxonomy) + struct.calcsize(HEADER_PACKING)
+        sizes = {}
+        size = self.message.size(taxonomy, sizes) + HEADER_SIZE
 
         writer.write(struct.pack(HEADER_PACKING, self.directives, \
                 self.schema_version, taxonomy_id, size))
 
-        self.message.encode(writer, taxonomy)
+        self.message.encode(writer, taxonomy, sizes)
+
+    def encode_into(self, buffer=None, taxonomy_id=0, headers=None):
+        """Encode an envelope onto the end of a bytearray.
+
+        The header is reserved up front and its size backpatched once the
+        message has been written, so the whole envelope is produced in a
+        single pass with no intermediate strings.
+
+        Arguments:
+            buffer: the bytearray to append the envelope to. A new one
+                is created if not given. (Default: None)
+            taxonomy_id: the id of the Taxonomy to encode with (Default: 0)
+            headers: A dict memoizing encoded field headers, see
+                `Field.encode_into` (Default: None)
+
+        Return:
+            buffer
+        """
+        if buffer is None:
+            buffer = bytearray()
+
+        taxonomy = None
+        if taxonomy_id:
+            taxonomy = self.taxonomy_resolver.resolve_taxonomy(taxonomy_id)
+
+        start = len(buffer)
+        buffer.extend(_HEADER_PADDING)
+        self.message.encode_into(buffer, taxonomy, headers)
+        HEADER_STRUCT.pack_into(buffer, start, self.directives, \
+                self.schema_version, taxonomy_id, len(buffer) - start)
+        return buffer
 
     @classmethod
-    def decode(cls, encoded, taxonomy_resolver=None):
+    def decode(cls, encoded, taxonomy_resolver=None, lazy=False, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Decode an envelope from a byte array.
+
+        Arguments:
+            encoded: the encoded bytes (str, bytearray, mmap or memoryview)
+            taxonomy_resolver: used to find the Taxonomy named in the
+                header (Default: None)
+            lazy: decode the message as a `LazyMessage`, which only
+                decodes fields when they are used (Default: False)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+
+        Return:
+            The decoded Envelope
+        """
+        envelope, end = cls.decode_from(encoded, 0, taxonomy_resolver, lazy, \
+                registry)
+        return envelope
+
+    @classmethod
+    def decode_from(cls, buffer, offset=0, taxonomy_resolver=None, \
+            lazy=False, registry=registry.DEFAULT_REGISTRY):
+        """Decode an envelope in place from a buffer, starting at offset.
+
+        The envelope is framed by the size in its header, so the buffer
+        may hold further data after it.
+
+        Arguments:
+            buffer: the encoded bytes (str, bytearray, mmap or memoryview)
+            offset: the position of the envelope header within buffer
+                (Default: 0)
+            taxonomy_resolver: used to find the Taxonomy named in the
+                header (Default: None)
+            lazy: decode the message as a `LazyMessage`, which only
+                decodes fields when they are used (Default: False)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+
+        Return:
+            (envelope, offset)
+
+            envelope: the decoded Envelope
+            offset: the position just past the end of the envelope
+        """
         # TODO(jamesc) - throw exception on message length < 8
-        assert len(encoded) >= 8
+        assert len(buffer) - offset >= HEADER_SIZE
         (directives, schema_version, taxonomy_id, size) = \
-                struct.unpack(HEADER_PACKING, encoded[:8])
-        width = size - struct.calcsize(HEADER_PACKING)
+                HEADER_STRUCT.unpack_from(buffer, offset)
+        assert size >= HEADER_SIZE and len(buffer) - offset >= size
 
-        # TODO(jamesc) - assert doesn't work for submsg
-        # assert len(encoded) == width + 8
         taxonomy = None
-        if taxonomy_resolver:
-            taxonomy = taxonomy_resolver.resolve_taxonomy[taxonomy_id]
+        if taxonomy_id and taxonomy_resolver is not None:
+            taxonomy = taxonomy_resolver.resolve_taxonomy(taxonomy_id)
 
-        message = Message.decode(encoded[8:], taxonomy=taxonomy)
+        if lazy:
+            message_class = LazyMessage
+        else:
+            message_class = Message
+        message = message_class.decode_from(buffer, offset + HEADER_SIZE, \
+                offset + size, taxonomy, registry)
         envelope = Envelope(message, directives, schema_version, taxonomy_resolver)
-        return envelope
\ No newline at end of file
+        return envelope, offset + size
+
+def encode_many(envelopes, buffer=None, taxonomy_id=0, headers=None):
+    """Encode a sequence of envelopes into one contiguous bytearray.
+
+    The encoded header of each distinct field (type, ordinal and name)
+    is built once per taxonomy and reused for every envelope in the
+    batch, and the taxonomy is resolved once per resolver rather than
+    per envelope.
+
+    Arguments:
+        envelopes: the Envelopes to encode
+        buffer: the bytearray to append the envelopes to. Pass the same
+            one, emptied with `del buffer[:]`, to reuse its storage
+            between batches. A new one is created if not given.
+            (Default: None)
+        taxonomy_id: the id of the Taxonomy to encode with (Default: 0)
+        headers: A dict of encoded field header caches to reuse between
+            batches, as filled in by a previous call. It maps each
+            Taxonomy used (None for no taxonomy) to its headers, see
+            `Field.encode_into`, and grows with the number of distinct
+            fields encoded. (Default: None)
+
+    Return:
+        (buffer, offsets)
+
+        buffer: the bytearray holding the encoded envelopes
+        offsets: the position of each envelope within buffer; each
+            ends where the next starts, the last at len(buffer)
+    """
+    if buffer is None:
+        buffer = bytearray()
+    if headers is None:
+        headers = {}
+
+    offsets = []
+    taxonomies = {}
+    for envelope in envelopes:
+        taxonomy = None
+        if taxonomy_id:
+            resolver = envelope.taxonomy_resolver
+            try:
+                taxonomy = taxonomies[id(resolver)]
+            except KeyError:
+                taxonomy = taxonomies[id(resolver)] = \
+                        resolver.resolve_taxonomy(taxonomy_id)
+        # Resolvers may map taxonomy_id to different taxonomies, whose
+        # headers differ
+        taxonomy_headers = headers.get(taxonomy)
+        if taxonomy_headers is None:
+            taxonomy_headers = headers[taxonomy] = {}
+        start = len(buffer)
+        offsets.append(start)
+        buffer.extend(_HEADER_PADDING)
+        envelope.message.encode_into(buffer, taxonomy, taxonomy_headers)
+        HEADER_STRUCT.pack_into(buffer, start, envelope.directives, \
+                envelope.schema_version, taxonomy_id, len(buffer) - start)
+    return buffer, offsets
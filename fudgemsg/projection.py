@@ -0,0 +1,205 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Projections: decode only the fields a consumer asks for.
+
+A `Projection` is built once from the paths of the wanted fields, each
+a dotted string of names into sub-messages, an ordinal, or a tuple
+mixing names and ordinals. Decoding walks the field headers only,
+skipping every other field by its encoded length without decoding its
+name or value, so the cost does not depend on the size of what is
+skipped.
+
+    >>> projection = Projection([u'instrument.id', u'bid', u'ask'])
+    >>> message = projection.decode(encoded)
+
+Fields are matched by ordinal if they carry one, and otherwise by name,
+their UTF-8 bytes being compared with the wanted names as they lie in
+the buffer. With a taxonomy, fields sent as ordinals match by the name
+it gives them too.
+"""
+
+from fudgemsg import codecs
+from fudgemsg.field import Field, decode_header, decode_value
+from fudgemsg.message import Message, Envelope, HEADER_STRUCT, HEADER_SIZE
+from fudgemsg import registry
+from fudgemsg import types
+
+def _path_segments(path):
+    """Split a path into its names and ordinals."""
+    if isinstance(path, basestring):
+        return [unicode(name) for name in path.split('.')]
+    if isinstance(path, (int, long)):
+        return [path]
+    segments = []
+    for segment in path:
+        if isinstance(segment, basestring):
+            segments.append(unicode(segment))
+        else:
+            segments.append(segment)
+    return segments
+
+
+class Projection(object):
+    """
+    The set of fields, possibly within sub-messages, to decode from
+    messages.
+    """
+    __slots__ = ('_by_ordinal', '_by_name', '_by_utf8')
+
+    def __init__(self, paths=()):
+        """Create a new Projection.
+
+        Arguments:
+            paths: the wanted fields, each a dotted string of names, an
+                ordinal, or a tuple of names and ordinals. Naming a
+                sub-message keeps all of it; naming a field within it
+                keeps only what is named.
+        """
+        # name or ordinal -> sub-Projection, or None to keep the field
+        # whole
+        self._by_ordinal = {}
+        self._by_name = {}
+        # the UTF-8 encoded name -> as _by_name
+        self._by_utf8 = {}
+        for path in paths:
+            self._add(_path_segments(path))
+
+    def _add(self, segments):
+        key = segments[0]
+        if isinstance(key, unicode):
+            by_key = self._by_name
+        else:
+            by_key = self._by_ordinal
+        if len(segments) == 1:
+            by_key[key] = None
+        elif key not in by_key:
+            by_key[key] = Projection([segments[1:]])
+        elif by_key[key] is not None:
+            by_key[key]._add(segments[1:])
+        if isinstance(key, unicode):
+            self._by_utf8[key.encode('utf-8')] = by_key[key]
+
+    def _match(self, buffer, ordinal, name_offset, taxonomy):
+        """Return (matched, sub-projection) for a field header."""
+        if ordinal is not None and ordinal in self._by_ordinal:
+            return True, self._by_ordinal[ordinal]
+        if name_offset is not None:
+            length = codecs.BYTE_STRUCT.unpack_from(buffer, name_offset)[0]
+            utf8 = codecs.slice_bytes(buffer, name_offset + 1, \
+                    name_offset + 1 + length)
+            if utf8 in self._by_utf8:
+                return True, self._by_utf8[utf8]
+        elif ordinal is not None and taxonomy:
+            name = taxonomy.get_name(ordinal)
+            if name in self._by_name:
+                return True, self._by_name[name]
+        return False, None
+
+    def decode_from(self, buffer, offset, end, taxonomy=None, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Decode the projected fields held in buffer[offset:end].
+
+        Arguments:
+            buffer: the encoded bytes (str, bytearray, mmap or memoryview)
+            offset: the position of the first field within buffer
+            end: the position just past the last field
+            taxonomy: A Taxonomy used to look up names for
+                ordinals (Default: None)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+
+        Return:
+            A Message holding only the projected fields, in the order
+            they were encoded
+        """
+        message = Message(registry)
+        while offset < end:
+            field_type, ordinal, name_offset, pos, value_length = \
+                    decode_header(buffer, offset, end, registry)
+            offset = pos + value_length
+            matched, projection = self._match(buffer, ordinal, name_offset, \
+                    taxonomy)
+            if not matched:
+                continue
+
+            if projection is None:
+                value = decode_value(field_type, buffer, pos, value_length, \
+                        taxonomy, registry)
+            elif field_type.type_id == types.FUDGEMSG_TYPE_ID:
+                value = projection.decode_from(buffer, pos, offset, \
+                        taxonomy, registry)
+            else:
+                # A path into a field which is not a sub-message
+                continue
+
+            if name_offset is not None:
+                name = codecs.dec_name_from(buffer, name_offset)[0]
+            elif ordinal is not None and taxonomy:
+                name = taxonomy.get_name(ordinal)
+            else:
+                name = None
+            message._add_field(Field(field_type, ordinal, name, value))
+        return message
+
+    def decode(self, encoded, taxonomy=None, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Decode the projected fields of a message from a byte array
+        holding just its fields."""
+        return self.decode_from(encoded, 0, len(encoded), taxonomy, registry)
+
+    def decode_envelope_from(self, buffer, offset=0, taxonomy_resolver=None, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Decode an envelope in place, keeping only the projected fields
+        of its message.
+
+        Arguments:
+            buffer: the encoded bytes (str, bytearray, mmap or memoryview)
+            offset: the position of the envelope header within buffer
+                (Default: 0)
+            taxonomy_resolver: used to find the Taxonomy named in the
+                envelope header (Default: None)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+
+        Return:
+            (envelope, offset), offset being just past the end of the
+            envelope
+        """
+        assert len(buffer) - offset >= HEADER_SIZE
+        (directives, schema_version, taxonomy_id, size) = \
+                HEADER_STRUCT.unpack_from(buffer, offset)
+        assert size >= HEADER_SIZE and len(buffer) - offset >= size
+
+        taxonomy = None
+        if taxonomy_id and taxonomy_resolver is not None:
+            taxonomy = taxonomy_resolver.resolve_taxonomy(taxonomy_id)
+
+        message = self.decode_from(buffer, offset + HEADER_SIZE, \
+                offset + size, taxonomy, registry)
+        envelope = Envelope(message, directives, schema_version, \
+                taxonomy_resolver)
+        return envelope, offset + size
+
+    def decode_envelope(self, encoded, taxonomy_resolver=None, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Decode an envelope, keeping only the projected fields of its
+        message."""
+        return self.decode_envelope_from(encoded, 0, taxonomy_resolver, \
+                registry)[0]
@@ -19,10 +19,51 @@
 
 """A Registry, storing Fudge FieldTypes."""
 
+import inspect
+
 from fudgemsg import codecs
 from fudgemsg import types
 from fudgemsg import utils
 
+# The big-endian numpy dtypes used for the primitive array types when a
+# Registry holds them as numpy.ndarrays
+NUMPY_ARRAY_DTYPES = {
+    types.SHORTARRAY_TYPE_ID : '>i2',
+    types.INTARRAY_TYPE_ID : '>i4',
+    types.LONGARRAY_TYPE_ID : '>i8',
+    types.FLOATARRAY_TYPE_ID : '>f4',
+    types.DOUBLEARRAY_TYPE_ID : '>f8',
+}
+
+# Array type used for ndarrays, by (dtype.kind, dtype.itemsize).
+# Element types with no exact Fudge equivalent are widened.
+_ARRAY_TYPE_BY_DTYPE = {
+    ('i', 1) : types.SHORTARRAY_TYPE_ID,
+    ('i', 2) : types.SHORTARRAY_TYPE_ID,
+    ('i', 4) : types.INTARRAY_TYPE_ID,
+    ('i', 8) : types.LONGARRAY_TYPE_ID,
+    ('u', 1) : types.SHORTARRAY_TYPE_ID,
+    ('u', 2) : types.INTARRAY_TYPE_ID,
+    ('u', 4) : types.LONGARRAY_TYPE_ID,
+    ('f', 4) : types.FLOATARRAY_TYPE_ID,
+    ('f', 8) : types.DOUBLEARRAY_TYPE_ID,
+}
+
+NDARRAY_CLASSNAME = 'numpy.ndarray'
+
+# The fixed width byte array types
+_FIXED_BYTEARRAY_TYPE_IDS = (
+    types.BYTEARRAY4_TYPE_ID,
+    types.BYTEARRAY8_TYPE_ID,
+    types.BYTEARRAY16_TYPE_ID,
+    types.BYTEARRAY20_TYPE_ID,
+    types.BYTEARRAY32_TYPE_ID,
+    types.BYTEARRAY64_TYPE_ID,
+    types.BYTEARRAY128_TYPE_ID,
+    types.BYTEARRAY256_TYPE_ID,
+    types.BYTEARRAY512_TYPE_ID,
+)
+
 class UnknownTypeError(Exception):
     """An Unknown Type has been used
 
@@ -36,8 +77,12 @@ class FieldType(object):
 
     TODO(jamesc)- proper objects rather than this dispatch style?
     """
+    __slots__ = ('type_id', 'classname', 'is_variable_sized', 'fixed_size', \
+            'encoder', 'decoder', 'calc_size', 'encode_into', 'decode_from')
+
     def __init__(self, type_id, class_, is_variable_sized, fixed_size,
-                 encoder=None, decoder=None, calc_size=None):
+                 encoder=None, decoder=None, calc_size=None, encode_into=None,
+                 decode_from=None):
         """Create a new Field type.
 
         Arguments:
@@ -54,6 +99,13 @@ class FieldType(object):
         calc_size : if is_variable_sized is True, calculate the size needed
                 to hold this object
             def size(object) -> num_bytes
+
+        encode_into : Optionally, append an object to the end of a bytearray
+                without building an intermediate string
+            def encode_into(bytearray, object)
+        decode_from : Optionally, decode an object in place from a buffer
+                without copying its bytes out first
+            def decode_from(buffer, offset, length) -> object
         """
         self.type_id = type_id
         if class_:
@@ -68,6 +120,8 @@ class FieldType(object):
         self.encoder = encoder
         self.decoder = decoder
         self.calc_size = calc_size
+        self.encode_into = encode_into
+        self.decode_from = decode_from
 
         if self.is_variable_sized:
             assert self.calc_size
@@ -98,9 +152,29 @@ class Registry(object):
     """A Fudge Type registry.
 
     """
-    def __init__(self):
+    def __init__(self, numpy_arrays=False, raw_datetimes=False):
+        """Create a new Registry holding the standard Fudge types.
+
+        Arguments:
+            numpy_arrays: hold primitive arrays as numpy.ndarrays,
+                see `use_numpy_arrays` (Default: False)
+            raw_datetimes: hold dates and times as integers,
+                see `use_raw_datetimes` (Default: False)
+        """
         self.types_by_id = {}
+        # FieldTypes indexed by type id, None where unknown, so decoding
+        # can look types up by the type byte directly
+        self.types_by_index = [None] * 256
         self.types_by_class = {}
+        self._unknown_types = {}
+        self.numpy_arrays = False
+        self.raw_datetimes = False
+        # class -> (FieldType or None, narrowing function or None),
+        # see _class_type
+        self._class_cache = {}
+        # type id -> narrowing function, filled in once the standard
+        # types are added, see _build_narrowing_tables
+        self._narrower_fns = {}
 
         self._add(FieldType(types.INDICATOR_TYPE_ID, 'fudgemsg.types.Indicator', \
                 False, 0, \
@@ -109,41 +183,53 @@ class Registry(object):
         self._add(FieldType(types.BOOLEAN_TYPE_ID, bool, False, 1, \
                 codecs.enc_bool, codecs.dec_bool))
         self._add(FieldType(types.BYTE_TYPE_ID, int, False, 1, \
-                codecs.enc_byte, codecs.dec_byte))
+                codecs.enc_byte, codecs.dec_byte, \
+                encode_into=codecs.appender(codecs.BYTE_STRUCT), \
+                decode_from=codecs.reader(codecs.BYTE_STRUCT)))
         self._add(FieldType(types.SHORT_TYPE_ID, int, False, 2, \
-                codecs.enc_short, codecs.dec_short))
+                codecs.enc_short, codecs.dec_short, \
+                encode_into=codecs.appender(codecs.SHORT_STRUCT), \
+                decode_from=codecs.reader(codecs.SHORT_STRUCT)))
         self._add(FieldType(types.INT_TYPE_ID, 'int', False, 4, \
-                codecs.enc_int, codecs.dec_int))
+                codecs.enc_int, codecs.dec_int, \
+                encode_into=codecs.appender(codecs.INT_STRUCT), \
+                decode_from=codecs.reader(codecs.INT_STRUCT)))
         self._add(FieldType(types.LONG_TYPE_ID, long, False, 8, \
-                codecs.enc_long, codecs.dec_long))
+                codecs.enc_long, codecs.dec_long, \
+                encode_into=codecs.appender(codecs.LONG_STRUCT), \
+                decode_from=codecs.reader(codecs.LONG_STRUCT)))
 
         self._add(FieldType(types.BYTEARRAY_TYPE_ID, str, True, 0, \
                 codecs.enc_str, codecs.dec_str, types.size_str))
         self._add(FieldType(types.SHORTARRAY_TYPE_ID, None, True, 0, \
-                lambda x : codecs.enc_array(codecs.enc_short, x), \
-                lambda x : codecs.dec_array(codecs.dec_short, 2, x), \
-                lambda x : 2 * len(x)))
+                codecs.enc_short_array, codecs.dec_short_array, \
+                lambda x : 2 * len(x), \
+                decode_from=codecs.dec_short_array_from))
         self._add(FieldType(types.INTARRAY_TYPE_ID, None, True, 0, \
-                lambda x : codecs.enc_array(codecs.enc_int, x), \
-                lambda x : codecs.dec_array(codecs.dec_int, 4, x), \
-                lambda x : 4 * len(x)))
+                codecs.enc_int_array, codecs.dec_int_array, \
+                lambda x : 4 * len(x), \
+                decode_from=codecs.dec_int_array_from))
         self._add(FieldType(types.LONGARRAY_TYPE_ID, None, True, 0, \
-                lambda x : codecs.enc_array(codecs.enc_long, x), \
-                lambda x : codecs.dec_array(codecs.dec_long, 8, x), \
-                lambda x : 8 * len(x)))
+                codecs.enc_long_array, codecs.dec_long_array, \
+                lambda x : 8 * len(x), \
+                decode_from=codecs.dec_long_array_from))
 
         self._add(FieldType(types.FLOAT_TYPE_ID, float, False, 4, \
-                codecs.enc_float, codecs.dec_float))
+                codecs.enc_float, codecs.dec_float, \
+                encode_into=codecs.appender(codecs.FLOAT_STRUCT), \
+                decode_from=codecs.reader(codecs.FLOAT_STRUCT)))
         self._add(FieldType(types.DOUBLE_TYPE_ID, None, False, 8, \
-                codecs.enc_double, codecs.dec_double))
+                codecs.enc_double, codecs.dec_double, \
+                encode_into=codecs.appender(codecs.DOUBLE_STRUCT), \
+                decode_from=codecs.reader(codecs.DOUBLE_STRUCT)))
         self._add(FieldType(types.FLOATARRAY_TYPE_ID, None, True, 0, \
-                lambda x : codecs.enc_array(codecs.enc_float, x), \
-                lambda x : codecs.dec_array(codecs.dec_float, 4, x), \
-                lambda x : 4 * len(x)))
+                codecs.enc_float_array, codecs.dec_float_array, \
+                lambda x : 4 * len(x), \
+                decode_from=codecs.dec_float_array_from))
         self._add(FieldType(types.DOUBLEARRAY_TYPE_ID, None, True, 0, \
-                lambda x : codecs.enc_array(codecs.enc_double, x), \
-                lambda x : codecs.dec_array(codecs.dec_double, 8, x), \
-                lambda x : 8 * len(x)))
+                codecs.enc_double_array, codecs.dec_double_array, \
+                lambda x : 8 * len(x), \
+                decode_from=codecs.dec_double_array_from))
 
         self._add(FieldType(types.STRING_TYPE_ID, unicode, True, 0, \
                 codecs.enc_unicode, codecs.dec_unicode, types.size_unicode))
@@ -152,7 +238,8 @@ class Registry(object):
         self._add(FieldType(types.FUDGEMSG_TYPE_ID, \
                 'fudgemsg.message.Message', True,  0, \
                 None, None, \
-                calc_size = lambda x, taxonomy : x.size(taxonomy=taxonomy)))
+                calc_size = lambda x, taxonomy, sizes=None : \
+                        x.size(taxonomy=taxonomy, sizes=sizes)))
 
         self._add(FieldType(types.BYTEARRAY4_TYPE_ID, str, False, 4, \
                 codecs.enc_str, codecs.dec_str))
@@ -173,33 +260,107 @@ class Registry(object):
         self._add(FieldType(types.BYTEARRAY512_TYPE_ID, str, False, 512, \
                 codecs.enc_str, codecs.dec_str))
 
-
-        self._narrower_fns = {
+        self._add(FieldType(types.DATE_TYPE_ID, 'datetime.date', False, 4, \
+                codecs.enc_date, codecs.dec_date, \
+                decode_from=codecs.dec_date_from))
+        self._add(FieldType(types.TIME_TYPE_ID, 'datetime.time', False, 8, \
+                codecs.enc_time, codecs.dec_time, \
+                decode_from=codecs.dec_time_from))
+        self._add(FieldType(types.DATETIME_TYPE_ID, 'datetime.datetime', \
+                False, 12, codecs.enc_datetime, codecs.dec_datetime, \
+                decode_from=codecs.dec_datetime_from))
+
+        self._narrower_fns.update({
             types.BYTE_TYPE_ID: self._narrow_int,
             types.SHORT_TYPE_ID: self._narrow_int,
             types.INT_TYPE_ID: self._narrow_int,
             types.LONG_TYPE_ID: self._narrow_int,
 
             types.BYTEARRAY_TYPE_ID: self._narrow_str,
-            types.BYTEARRAY4_TYPE_ID: self._narrow_str,
-            types.BYTEARRAY8_TYPE_ID: self._narrow_str,
-            types.BYTEARRAY16_TYPE_ID: self._narrow_str,
-            types.BYTEARRAY20_TYPE_ID: self._narrow_str,
-            types.BYTEARRAY32_TYPE_ID: self._narrow_str,
-            types.BYTEARRAY64_TYPE_ID: self._narrow_str,
-            types.BYTEARRAY128_TYPE_ID: self._narrow_str,
-            types.BYTEARRAY256_TYPE_ID: self._narrow_str,
-            types.BYTEARRAY512_TYPE_ID: self._narrow_str,
-
-        }
+        })
+        for type_id in _FIXED_BYTEARRAY_TYPE_IDS:
+            self._narrower_fns[type_id] = self._narrow_str
+        self._build_narrowing_tables()
+
+        if numpy_arrays:
+            self.use_numpy_arrays()
+        if raw_datetimes:
+            self.use_raw_datetimes()
 
     def __getitem__(self, key):
         return self.types_by_id[key]
 
     def _add(self, field_type):
         self.types_by_id[field_type.type_id] = field_type
+        self.types_by_index[field_type.type_id] = field_type
         if field_type.classname:
             self.types_by_class[field_type.classname] = field_type
+        self._class_cache.clear()
+        if field_type.type_id in self._narrower_fns:
+            self._build_narrowing_tables()
+
+    def _build_narrowing_tables(self):
+        """Look up the types that integers and byte arrays narrow to,
+        so replacing one of them also changes what values narrow to."""
+        # Byte arrays narrow to the fixed width type of their length
+        self._bytearray_by_length = {}
+        for type_id in _FIXED_BYTEARRAY_TYPE_IDS:
+            field_type = self[type_id]
+            self._bytearray_by_length[field_type.fixed_size] = field_type
+        self._byte_type = self[types.BYTE_TYPE_ID]
+        self._short_type = self[types.SHORT_TYPE_ID]
+        self._int_type = self[types.INT_TYPE_ID]
+        self._long_type = self[types.LONG_TYPE_ID]
+        self._bytearray_type = self[types.BYTEARRAY_TYPE_ID]
+
+    def register_type(self, field_type):
+        """Add a custom Fudge type, to be used for encoding and decoding.
+
+        An existing type with the same type id or classname is replaced.
+
+        Arguments:
+           field_type: the FieldType to add. Its type_id must be less
+               than 256."""
+        assert 0 <= field_type.type_id <= utils.MAX_BYTE
+        self._add(field_type)
+        self._unknown_types.pop(field_type.type_id, None)
+
+    def unknown_type(self, type_id):
+        """Return a FieldType for a variable width type id which is not
+        in the registry.
+
+        Values of the type are held as opaque byte strings, and encode
+        back to the same bytes under the same type id.
+
+        Arguments:
+           type_id: the Fudge Type ID
+
+        Return:
+          The FieldType"""
+        try:
+            return self._unknown_types[type_id]
+        except KeyError:
+            field_type = FieldType(type_id, None, True, 0, \
+                    codecs.enc_str, codecs.dec_str, types.size_str)
+            self._unknown_types[type_id] = field_type
+            return field_type
+
+    def register_class(self, class_, type_id):
+        """Map a python class, and its subclasses, to a Fudge type.
+
+        Use this rather than changing types_by_class directly, which
+        would leave stale entries in the lookup cache.
+
+        Arguments:
+           class_: the class, or its full name
+           type_id: the Fudge Type ID to hold its instances
+
+        Raise:
+          UnknownTypeError: if type_id is not in the registry"""
+        if not isinstance(class_, basestring):
+            class_ = fullname(class_)
+        self.types_by_class[class_] = self.type_by_id(type_id)
+        self._class_cache.clear()
 
     def type_by_id(self, type_id):
         """Given a type_id return the Fudge FieldType which
@@ -222,6 +383,10 @@ class Registry(object):
         """Given a value and an optional class return the Fudge FieldType which
         can hold it.
 
+        Without a classname the type is found from the value's class, or
+        failing that its nearest registered base class, and cached by
+        class.
+
         Arguments:
            value: the object to find a class for
            classname: The name of class we wish to map to. (default: None)
@@ -231,47 +396,205 @@ class Registry(object):
 
         Raise:
           UnknownTypeError if we can't find a suitable class in the registry"""
-        if not classname:
-            classname = fullname(value.__class__)
+        if classname:
+            try:
+                return self.types_by_class[classname]
+            except KeyError:
+                pass
+            if self.numpy_arrays and classname == NDARRAY_CLASSNAME:
+                return self.type_by_dtype(value.dtype)
+            raise UnknownTypeError("No type mapping for class : %s"%classname)
+
         try:
+            field_type = self._class_cache[value.__class__][0]
+        except KeyError:
+            field_type = self._class_type(value)[0]
+        if field_type is None:
+            raise UnknownTypeError("No type mapping for class : %s"% \
+                    fullname(value.__class__))
+        return field_type
 
-            return self.types_by_class[classname]
+    def narrowed_type(self, value):
+        """Return the narrowest Fudge FieldType which can hold a value.
+
+        This is `narrow(type_by_class(value), value)`, with both the
+        lookup and whether the type can be narrowed at all cached by
+        class.
+
+        Raise:
+          UnknownTypeError if we can't find a suitable class in the registry"""
+        try:
+            field_type, narrow_fn = self._class_cache[value.__class__]
         except KeyError:
-            raise UnknownTypeError("No type mapping for class : %s"%classname)
+            field_type, narrow_fn = self._class_type(value)
+        if narrow_fn is not None:
+            return narrow_fn(value)
+        if field_type is None:
+            raise UnknownTypeError("No type mapping for class : %s"% \
+                    fullname(value.__class__))
+        return field_type
+
+    def _class_type(self, value):
+        """Find the FieldType for the class of value, and how to narrow it,
+        caching them unless they depend on more than the class.
+
+        Return:
+            (field_type, narrow_fn), with field_type None if there is
+            no mapping
+        """
+        class_ = value.__class__
+        for base in inspect.getmro(class_):
+            classname = fullname(base)
+            if self.numpy_arrays and classname == NDARRAY_CLASSNAME:
+                # Depends on the dtype
+                field_type = self.type_by_dtype(value.dtype)
+                return field_type, self._narrower_fns.get(field_type.type_id)
+            try:
+                field_type = self.types_by_class[classname]
+            except KeyError:
+                continue
+            entry = (field_type, self._narrower_fns.get(field_type.type_id))
+            break
+        else:
+            entry = (None, None)
+        self._class_cache[class_] = entry
+        return entry
+
+    def type_by_dtype(self, dtype):
+        """Given a numpy dtype return the Fudge array FieldType which
+        can hold an ndarray of it.
+
+        Arguments:
+           dtype: the numpy.dtype of the array elements
+
+        Return:
+          A FieldType for a primitive array
+
+        Raise:
+          UnknownTypeError if there is no array type for the dtype"""
+        try:
+            return self[_ARRAY_TYPE_BY_DTYPE[(dtype.kind, dtype.itemsize)]]
+        except KeyError:
+            raise UnknownTypeError("No array type for dtype : %s"%dtype)
+
+    def use_numpy_arrays(self):
+        """Hold the primitive array types as numpy.ndarrays.
+
+        Once enabled, ndarrays can be added to messages with their array
+        type picked from their dtype, and short[], int[], long[], float[]
+        and double[] fields decode as big-endian ndarrays viewing the
+        encoded buffer directly rather than as lists.
+
+        Raise:
+          ImportError if numpy is not available"""
+        if codecs.numpy is None:
+            raise ImportError("numpy is required for numpy arrays")
+        for type_id, dtype in NUMPY_ARRAY_DTYPES.items():
+            encoder, decoder, decode_from, calc_size = \
+                    codecs.numpy_array_codecs(dtype)
+            self._add(FieldType(type_id, None, True, 0, encoder, decoder, \
+                    calc_size, decode_from=decode_from))
+        self.numpy_arrays = True
+
+    def use_raw_datetimes(self):
+        """Hold dates and times as integers rather than datetime objects.
+
+        Once enabled, date fields decode as their packed
+        (year << 9 | month << 5 | day) integer, time fields as nanoseconds
+        since midnight and datetime fields as nanoseconds since
+        1970-01-01 UTC. These compare and sort as the values they hold,
+        keep the full nanosecond accuracy and cost no object construction.
+        They must be added to messages with an explicit type_, since an
+        integer would otherwise be encoded as one."""
+        self._add(FieldType(types.DATE_TYPE_ID, None, False, 4, \
+                codecs.enc_raw_date, codecs.dec_raw_date, \
+                decode_from=codecs.dec_raw_date_from))
+        self._add(FieldType(types.TIME_TYPE_ID, None, False, 8, \
+                codecs.enc_raw_time, codecs.dec_raw_time, \
+                decode_from=codecs.dec_raw_time_from))
+        self._add(FieldType(types.DATETIME_TYPE_ID, None, False, 12, \
+                codecs.enc_raw_datetime, codecs.dec_raw_datetime, \
+                decode_from=codecs.dec_raw_datetime_from))
+        for classname in ('datetime.date', 'datetime.time', \
+                'datetime.datetime'):
+            self.types_by_class.pop(classname, None)
+        self._class_cache.clear()
+        self.raw_datetimes = True
 
     def narrow(self, type_, value):
         """Narrow a type if the value can fit into a smaller type."""
+        narrow_fn = self._narrower_fns.get(type_.type_id)
+        if narrow_fn is None:
+            return type_
+        return narrow_fn(value)
+
+    def narrow_column(self, type_, values):
+        """Return the narrowest type which can hold every one of a
+        sequence of values.
 
-        if type_.type_id not in self._narrower_fns:
+        Integers narrow to the smallest integer type covering their
+        range, and byte arrays to a fixed width type if they all have
+        the same length. Other types are returned unchanged.
+
+        Arguments:
+           type_: the FieldType of the values
+           values: a sequence of values
+
+        Return:
+          A FieldType"""
+        narrow_fn = self._narrower_fns.get(type_.type_id)
+        if narrow_fn is None or not values:
             return type_
-        return self._narrower_fns[type_.type_id](value)
+        if narrow_fn == self._narrow_int:
+            return self._int_range_type(min(values), max(values))
+        length = len(values[0])
+        for value in values:
+            if len(value) != length:
+                return self._bytearray_type
+        return self._narrow_str(values[0])
+
+    def int_array_type(self, values):
+        """Return the smallest primitive array type which can hold a
+        sequence of integers.
+
+        Fudge has no byte array of integers, so short[] is the smallest.
+
+        Arguments:
+           values: a sequence of integers
+
+        Return:
+          The short[], int[] or long[] FieldType"""
+        if not values:
+            return self[types.SHORTARRAY_TYPE_ID]
+        field_type = self._int_range_type(min(values), max(values))
+        if field_type is self._long_type:
+            return self[types.LONGARRAY_TYPE_ID]
+        elif field_type is self._int_type:
+            return self[types.INTARRAY_TYPE_ID]
+        return self[types.SHORTARRAY_TYPE_ID]
+
+    def _int_range_type(self, low, high):
+        """The smallest integer type holding every value in [low, high]"""
+        if utils.MIN_BYTE <= low and high <= utils.MAX_BYTE:
+            return self._byte_type
+        elif utils.MIN_SHORT <= low and high <= utils.MAX_SHORT:
+            return self._short_type
+        elif utils.MIN_INT <= low and high <= utils.MAX_INT:
+            return self._int_type
+        else:
+            return self._long_type
 
     def _narrow_int(self, value):
-        if value >= utils.MIN_BYTE and value <= utils.MAX_BYTE:
-            return self[types.BYTE_TYPE_ID]
-        elif value >= utils.MIN_SHORT and value <= utils.MAX_SHORT:
-            return self[types.SHORT_TYPE_ID]
-        elif value >= utils.MIN_INT and value <= utils.MAX_INT:
-            return self[types.INT_TYPE_ID]
+        if utils.MIN_BYTE <= value <= utils.MAX_BYTE:
+            return self._byte_type
+        elif utils.MIN_SHORT <= value <= utils.MAX_SHORT:
+            return self._short_type
+        elif utils.MIN_INT <= value <= utils.MAX_INT:
+            return self._int_type
         else:
-            return self[types.LONG_TYPE_ID]
+            return self._long_type
 
     def _narrow_str(self, value):
-
-        fixed_bytelen = {
-                4: self[types.BYTEARRAY4_TYPE_ID],
-                8: self[types.BYTEARRAY8_TYPE_ID],
-                16: self[types.BYTEARRAY16_TYPE_ID],
-                20: self[types.BYTEARRAY20_TYPE_ID],
-                32: self[types.BYTEARRAY32_TYPE_ID],
-                64: self[types.BYTEARRAY64_TYPE_ID],
-                128: self[types.BYTEARRAY128_TYPE_ID],
-                256: self[types.BYTEARRAY256_TYPE_ID],
-                512: self[types.BYTEARRAY512_TYPE_ID],
-            }
-        array_len = len(value)
-        if array_len in fixed_bytelen:
-            return fixed_bytelen[array_len]
-        return self[types.BYTEARRAY_TYPE_ID]
+        return self._bytearray_by_length.get(len(value), self._bytearray_type)
 
 DEFAULT_REGISTRY = Registry()
@@ -0,0 +1,146 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Incremental reading of Fudge Envelopes from byte streams.
+
+Envelopes are framed by the size held in their 8 byte header, so they
+can be picked out of a stream of arbitrarily sized chunks, such as
+those read from a socket or file.
+"""
+
+from fudgemsg import codecs
+from fudgemsg.message import Envelope, HEADER_SIZE, HEADER_STRUCT
+from fudgemsg.registry import DEFAULT_REGISTRY
+
+DEFAULT_CHUNK_SIZE = 65536
+
+class EnvelopeReader(object):
+    """Frame and decode Envelopes from chunks of a byte stream.
+
+    Chunks are appended to a single buffer as they are fed in. Each
+    complete envelope is copied out of it once and decoded, and only
+    the trailing partial envelope, if any, is ever moved, so the data
+    already buffered is not re-copied as more arrives.
+    """
+
+    def __init__(self, taxonomy_resolver=None, lazy=False, \
+            registry=DEFAULT_REGISTRY):
+        """Create a new EnvelopeReader.
+
+        Arguments:
+            taxonomy_resolver: used to find the Taxonomy named in each
+                envelope header (Default: None)
+            lazy: decode messages as `LazyMessage`s (Default: False)
+            registry: the Registry to look field types up in
+                (Default: DEFAULT_REGISTRY)
+        """
+        self._buffer = bytearray()
+        self._taxonomy_resolver = taxonomy_resolver
+        self._lazy = lazy
+        self._registry = registry
+        # Raised by the next feed or check
+        self._error = None
+
+    def feed(self, data):
+        """Add a chunk of the stream.
+
+        If the stream holds something which cannot be decoded after
+        some envelopes which can, those envelopes are returned and the
+        error is raised by the next call to `feed` or `check`. An
+        envelope which fails to decode is dropped from the buffer, but
+        the bytes from an invalid header onwards cannot be framed and
+        stay in it.
+
+        Arguments:
+            data: the next bytes from the stream (str or bytearray)
+
+        Return:
+            A list of the Envelopes completed by this chunk, in order
+
+        Raises:
+            ValueError: if an envelope header holds an impossible size
+            Whatever decoding an envelope raises
+        """
+        buffer = self._buffer
+        buffer.extend(data)
+        self.check()
+
+        envelopes = []
+        start = 0
+        available = len(buffer)
+        try:
+            while available - start >= HEADER_SIZE:
+                size = HEADER_STRUCT.unpack_from(buffer, start)[3]
+                if size < HEADER_SIZE:
+                    raise ValueError("Invalid envelope size : %s"% size)
+                if available - start < size:
+                    break
+                encoded = codecs.slice_bytes(buffer, start, start + size)
+                start += size
+                envelopes.append(Envelope.decode(encoded, \
+                        self._taxonomy_resolver, self._lazy, self._registry))
+        except Exception as exc:
+            if not envelopes:
+                del buffer[:start]
+                raise
+            self._error = exc
+        if start:
+            del buffer[:start]
+        return envelopes
+
+    def check(self):
+        """Raise the error found after the envelopes last returned by
+        `feed`, if there was one."""
+        error = self._error
+        if error is not None:
+            self._error = None
+            raise error
+
+    def pending(self):
+        """Return the number of bytes buffered towards the next envelope"""
+        return len(self._buffer)
+
+def read_envelopes(stream, chunk_size=DEFAULT_CHUNK_SIZE, \
+        taxonomy_resolver=None, lazy=False, registry=DEFAULT_REGISTRY):
+    """Generate the Envelopes read from a file or socket.
+
+    Arguments:
+        stream: a socket, or a file-like object opened in binary mode
+        chunk_size: the most bytes to read at a time
+            (Default: DEFAULT_CHUNK_SIZE)
+        taxonomy_resolver: used to find the Taxonomy named in each
+            envelope header (Default: None)
+        lazy: decode messages as `LazyMessage`s (Default: False)
+        registry: the Registry to look field types up in
+            (Default: DEFAULT_REGISTRY)
+
+    Raises:
+        ValueError: if the stream ends part way through an envelope
+    """
+    read = getattr(stream, 'recv', None) or stream.read
+    reader = EnvelopeReader(taxonomy_resolver, lazy, registry)
+    while True:
+        data = read(chunk_size)
+        if not data:
+            break
+        for envelope in reader.feed(data):
+            yield envelope
+    reader.check()
+    if reader.pending():
+        raise ValueError("Stream ended within an envelope")
@@ -0,0 +1,156 @@
+#
+# Copyright CERN, 2010.
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""A TaxonomyResolver which loads taxonomies on demand.
+
+"""
+
+import collections
+import threading
+
+DEFAULT_MAX_SIZE = 256
+
+class CachingTaxonomyResolver(object):
+    """
+    A thread-safe taxonomy resolver which loads taxonomies on first use
+    and keeps the most recently used of them.
+
+    Taxonomies are fetched by calling `loader(taxonomy_id)`, which
+    returns a Taxonomy or None if there is no taxonomy with that id.
+    Loads are made without holding the cache lock, and concurrent
+    requests for an id already being loaded wait for that load rather
+    than starting another. Ids with no taxonomy are not cached, so the
+    loader is asked again next time.
+
+    A resolver is pickled as its loader and max_size, with an empty
+    cache, so it can be handed to worker processes if the loader can.
+    """
+    def __init__(self, loader, max_size=DEFAULT_MAX_SIZE):
+        """Create a new CachingTaxonomyResolver.
+
+        Arguments:
+            loader: called as loader(taxonomy_id) to fetch a Taxonomy
+                which is not cached, returning None if there is none
+            max_size: the most taxonomies to cache, the least recently
+                used being evicted first (default: DEFAULT_MAX_SIZE)
+        """
+        assert max_size > 0
+        self._loader = loader
+        self.max_size = max_size
+        self._init_cache()
+
+    def _init_cache(self):
+        self._lock = threading.Lock()
+        # taxonomy_id -> Taxonomy, least recently used first
+        self._cache = collections.OrderedDict()
+        # taxonomy_id -> _Load in progress
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        return (self._loader, self.max_size)
+
+    def __setstate__(self, state):
+        self._loader, self.max_size = state
+        self._init_cache()
+
+    def resolve_taxonomy(self, taxonomy_id):
+        """Return the taxonomy for a given ID, loading it if it is not
+        cached.
+
+        Arguments:
+            taxonomy_id : the id of the Taxonomy we look for
+
+        Returns:
+            A `Taxonomy` if one exists for that id, else None
+
+        Raises:
+            Whatever the loader raises. Threads which were waiting on a
+            failed load retry it themselves.
+        """
+        while True:
+            with self._lock:
+                try:
+                    taxonomy = self._cache.pop(taxonomy_id)
+                except KeyError:
+                    pass
+                else:
+                    self._cache[taxonomy_id] = taxonomy
+                    self.hits += 1
+                    return taxonomy
+                load = self._loading.get(taxonomy_id)
+                if load is None:
+                    load = self._loading[taxonomy_id] = _Load()
+                    self.misses += 1
+                    break
+            load.done.wait()
+            if not load.failed:
+                return load.taxonomy
+
+        try:
+            load.taxonomy = self._loader(taxonomy_id)
+            load.failed = False
+        finally:
+            with self._lock:
+                del self._loading[taxonomy_id]
+                if load.taxonomy is not None:
+                    self._cache[taxonomy_id] = load.taxonomy
+                    while len(self._cache) > self.max_size:
+                        self._cache.popitem(last=False)
+                        self.evictions += 1
+            load.done.set()
+        return load.taxonomy
+
+    def invalidate(self, taxonomy_id=None):
+        """Drop a taxonomy from the cache, so it is loaded again on
+        next use.
+
+        Arguments:
+            taxonomy_id: the id to drop, or None to drop them all
+                (default: None)
+        """
+        with self._lock:
+            if taxonomy_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(taxonomy_id, None)
+
+    def __contains__(self, taxonomy_id):
+        """Return True if the taxonomy for an id is cached."""
+        with self._lock:
+            return taxonomy_id in self._cache
+
+    def __len__(self):
+        """Return the number of cached taxonomies."""
+        with self._lock:
+            return len(self._cache)
+
+
+class _Load(object):
+    """A load in progress, shared with the threads waiting on it."""
+    __slots__ = ('done', 'taxonomy', 'failed')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.taxonomy = None
+        self.failed = True
@@ -0,0 +1,97 @@
+#
+# Copyright CERN, 2010.
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""An immutable taxonomy compiled for fast lookups."""
+
+from fudgemsg import codecs
+from fudgemsg import utils
+
+class CompiledTaxonomy(object):
+    """
+    An immutable taxonomy compiled for encoding and decoding.
+
+    Ordinals are looked up by indexing a tuple of names, names by a
+    single dict lookup with no exception handling, and the encoded
+    ordinal of each name is computed once up front for
+    `Field.encode_identity`.
+    """
+    __slots__ = ('get_ordinal', '_names', '_base', '_size', \
+            '_encoded_ordinals')
+
+    def __init__(self, taxonomy_map=None):
+        """Create a new CompiledTaxonomy
+
+        Arguments:
+           taxonomy_map:  A map of short -> string with the
+           mapping of ordinal to name."""
+        taxonomy_map = dict(taxonomy_map or {})
+        by_name = {}
+        encoded_ordinals = {}
+        for ordinal, name in taxonomy_map.iteritems():
+            assert utils.MIN_SHORT <= ordinal <= utils.MAX_SHORT
+            assert len(name.encode('utf-8')) <= utils.MAX_BYTE
+            by_name[name] = ordinal
+            # As with get_ordinal, encoders never replace a name by 0
+            if ordinal:
+                encoded_ordinals[name] = codecs.enc_short(ordinal)
+
+        if taxonomy_map:
+            self._base = min(taxonomy_map)
+            names = [None] * (max(taxonomy_map) - self._base + 1)
+            for ordinal, name in taxonomy_map.iteritems():
+                names[ordinal - self._base] = name
+            self._names = tuple(names)
+        else:
+            self._base = 0
+            self._names = ()
+        self._size = len(taxonomy_map)
+        self._encoded_ordinals = encoded_ordinals
+
+        # get_ordinal(name) : the ordinal for a name, or None if the
+        # name is not in the taxonomy
+        self.get_ordinal = by_name.get
+
+    def get_name(self, ordinal):
+        """Return the name for a given ordinal.
+
+        Arguments:
+            ordinal : the ordinal to look up (short)
+
+        Returns:
+            The name as a unicode string, or None if the ordinal is not
+            in the taxonomy"""
+        index = ordinal - self._base
+        if 0 <= index < len(self._names):
+            return self._names[index]
+        return None
+
+    def encoded_ordinal(self, name):
+        """Return the encoded ordinal for a name, ready to be written
+        in place of the name.
+
+        Returns:
+            The big-endian short (str), or None if the name is not in
+            the taxonomy, or has the ordinal 0"""
+        return self._encoded_ordinals.get(name)
+
+    def __len__(self):
+        """Return the number of elements in the taxonomy."""
+        return self._size
@@ -0,0 +1,197 @@
+#
+# Copyright CERN, 2010.
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Learn a taxonomy from the messages actually being sent.
+
+"""
+
+from fudgemsg.message import Envelope
+from fudgemsg.taxonomy.map import Taxonomy
+from fudgemsg import types
+from fudgemsg import utils
+
+class TaxonomyLearner(object):
+    """
+    Learns the taxonomy which would most shrink a sample of messages.
+
+    A field name costs 1 + len(name) bytes on the wire, and a taxonomy
+    ordinal 2, so each occurrence of a name saves len(name) - 1 bytes
+    when a taxonomy replaces it (or 1 + len(name) if the field carries
+    an ordinal anyway). Names are ranked by the total saving over the
+    sample, in effect frequency x length.
+
+    Ordinals which fields carry explicitly are never given to other
+    names, since decoding with the taxonomy would then misname those
+    fields. A name always sent with the same explicit ordinal is mapped
+    to that ordinal; one seen with different ordinals is left out.
+    """
+    def __init__(self, sample_every=1):
+        """Create a new TaxonomyLearner.
+
+        Arguments:
+            sample_every: only look at every nth message passed to
+                `observe`, to bound the cost on busy topics (default: 1)
+        """
+        assert sample_every >= 1
+        self.sample_every = sample_every
+        self.seen = 0
+        self.messages = 0
+        self.observed_bytes = 0
+        # name -> total bytes saved by replacing it with an ordinal
+        self._savings = {}
+        # name -> the explicit ordinal sent with it
+        self._name_ordinals = {}
+        # names sent with different explicit ordinals
+        self._clashes = set()
+        self._explicit_ordinals = set()
+
+    def observe(self, message, size=None):
+        """Sample a message.
+
+        Arguments:
+            message: the Message to sample
+            size: its encoded size, if known (default: computed)
+        """
+        if not self._sample():
+            return
+        if size is None:
+            size = message.size()
+        self.observed_bytes += size
+        self._observe_fields(message)
+
+    def observe_encoded(self, encoded, taxonomy_resolver=None):
+        """Sample an encoded Envelope.
+
+        Arguments:
+            encoded: the encoded Envelope (str)
+            taxonomy_resolver: used to find the names of fields already
+                encoded with a taxonomy (default: None)
+        """
+        if not self._sample():
+            return
+        envelope = Envelope.decode(encoded, taxonomy_resolver)
+        self.observed_bytes += len(encoded)
+        self._observe_fields(envelope.message)
+
+    def _sample(self):
+        """Count a message, returning True if it is to be sampled."""
+        self.seen += 1
+        if (self.seen - 1) % self.sample_every:
+            return False
+        self.messages += 1
+        return True
+
+    def _observe_fields(self, message):
+        savings = self._savings
+        name_ordinals = self._name_ordinals
+        for field in message.fields:
+            name, ordinal = field.name, field.ordinal
+            if ordinal is not None:
+                self._explicit_ordinals.add(ordinal)
+            if name:
+                saving = 1 + len(name.encode('utf-8'))
+                if ordinal is None:
+                    saving -= 2
+                savings[name] = savings.get(name, 0) + saving
+                if ordinal is not None:
+                    known = name_ordinals.setdefault(name, ordinal)
+                    # A taxonomy ordinal of 0 is never used by encoders
+                    if known != ordinal or ordinal == 0:
+                        self._clashes.add(name)
+            if field.type_.type_id == types.FUDGEMSG_TYPE_ID:
+                self._observe_fields(field.value)
+
+    def ranked_names(self):
+        """Return the names which a taxonomy could replace, with the
+        bytes each would have saved over the sample, best first.
+
+        Return:
+            A list of (saving, name)
+        """
+        ranked = [(saving, name) for name, saving in self._savings.iteritems() \
+                if saving > 0 and name not in self._clashes]
+        ranked.sort(key=lambda entry: (-entry[0], entry[1]))
+        return ranked
+
+    def learn(self, max_size=None):
+        """Return the taxonomy which saves the most over the sample,
+        see `learn_map`.
+
+        Return:
+            A `map.Taxonomy`
+        """
+        return Taxonomy(self.learn_map(max_size))
+
+    def learn_map(self, max_size=None):
+        """Return the ordinal -> name map of the taxonomy which saves
+        the most over the sample.
+
+        Names sent with an explicit ordinal keep it, and the others are
+        given ordinals from 1 up which no field has been seen to carry.
+
+        Arguments:
+            max_size: the most names to include (default: no limit
+                beyond the available ordinals)
+
+        Return:
+            A dict of short -> unicode string
+        """
+        taxonomy_map = {}
+        next_ordinal = 1
+        for saving, name in self.ranked_names():
+            if max_size is not None and len(taxonomy_map) >= max_size:
+                break
+            ordinal = self._name_ordinals.get(name)
+            if ordinal in taxonomy_map:
+                # Shared with a better ranked name
+                continue
+            if ordinal is None:
+                while next_ordinal in self._explicit_ordinals:
+                    next_ordinal += 1
+                if next_ordinal > utils.MAX_SHORT:
+                    continue
+                ordinal = next_ordinal
+                next_ordinal += 1
+            taxonomy_map[ordinal] = name
+        return taxonomy_map
+
+    def projected_saving(self, taxonomy):
+        """Return the bytes a taxonomy would have saved over the sample.
+
+        Arguments:
+            taxonomy: the taxonomy to project, typically from `learn`
+
+        Return:
+            (observed bytes, bytes saved)
+        """
+        saved = 0
+        for saving, name in self.ranked_names():
+            if taxonomy.get_ordinal(name):
+                saved += saving
+        return self.observed_bytes, saved
+
+    def report(self, taxonomy):
+        """Return a human readable summary of the projected saving of a
+        taxonomy (str)."""
+        observed, saved = self.projected_saving(taxonomy)
+        percent = 100.0 * saved / observed if observed else 0.0
+        return "%d names, %d messages, %d bytes, %d bytes saved (%.1f%%)"% \
+                (len(taxonomy), self.messages, observed, saved, percent)
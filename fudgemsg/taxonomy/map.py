@@ -76,6 +76,14 @@ class Taxonomy(object):
         except KeyError:
             return None
             
+    def compile(self):
+        """Return an immutable CompiledTaxonomy with the same mapping,
+        for faster encoding and decoding.
+
+        Later changes to this Taxonomy are not seen by it."""
+        from fudgemsg.taxonomy.compiled import CompiledTaxonomy
+        return CompiledTaxonomy(self._by_ordinal)
+
     def __len__(self):
         """Return the number of elements in the map.""" 
         return len(self._by_ordinal)
@@ -0,0 +1,232 @@
+#
+# Copyright CERN, 2010.
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""A taxonomy read in place from a memory mapped file.
+
+The file is written once by `write_taxonomy` and can then be mapped by
+any number of processes, which share the one page cached copy and
+start up in constant time however large it is.
+
+File layout (all integers big-endian):
+
+    header:        '!4sHHI'  magic 'FTAX', version, reserved, count
+    ordinal index: count * '!hxxI'  ordinal, name offset; sorted by ordinal
+    name index:    count * '!Ihxx'  name offset, ordinal; sorted by the
+                                    UTF-8 bytes of the name
+    names:         count * (length byte, UTF-8 bytes)
+
+Name offsets are from the start of the file.
+"""
+
+import mmap
+import os
+import struct
+
+MAGIC = 'FTAX'
+VERSION = 1
+
+HEADER_STRUCT = struct.Struct('!4sHHI')
+ORDINAL_ENTRY_STRUCT = struct.Struct('!hxxI')
+NAME_ENTRY_STRUCT = struct.Struct('!Ihxx')
+ENTRY_SIZE = 8
+
+def write_taxonomy(taxonomy_map, writer):
+    """Write a taxonomy file.
+
+    Arguments:
+        taxonomy_map: A map of short -> unicode string with the mapping
+            of ordinal to name, as for `map.Taxonomy`
+        writer: the file-like object to write to
+    """
+    entries = []
+    for ordinal, name in taxonomy_map.iteritems():
+        utf8 = name.encode('utf-8')
+        assert len(utf8) <= 255
+        entries.append((ordinal, utf8))
+    count = len(entries)
+
+    offset = HEADER_STRUCT.size + 2 * ENTRY_SIZE * count
+    name_offsets = {}
+    names = []
+    for ordinal, utf8 in sorted(entries):
+        name_offsets[ordinal] = offset
+        names.append(chr(len(utf8)) + utf8)
+        offset += 1 + len(utf8)
+
+    writer.write(HEADER_STRUCT.pack(MAGIC, VERSION, 0, count))
+    for ordinal, utf8 in sorted(entries):
+        writer.write(ORDINAL_ENTRY_STRUCT.pack(ordinal, name_offsets[ordinal]))
+    for utf8, ordinal in sorted((utf8, ordinal) for ordinal, utf8 in entries):
+        writer.write(NAME_ENTRY_STRUCT.pack(name_offsets[ordinal], ordinal))
+    writer.write(''.join(names))
+
+def save_taxonomy(taxonomy_map, filename):
+    """Write a taxonomy file to a path, see `write_taxonomy`.
+
+    The file is written alongside and renamed into place, so processes
+    mapping an older version keep a consistent view of it."""
+    temp = '%s.tmp%d'% (filename, os.getpid())
+    writer = open(temp, 'wb')
+    try:
+        write_taxonomy(taxonomy_map, writer)
+    finally:
+        writer.close()
+    os.rename(temp, filename)
+
+
+class MappedTaxonomy(object):
+    """
+    A taxonomy resolved directly from a memory mapped taxonomy file.
+
+    Ordinals and names are found by binary search of the sorted indexes
+    in the file. The names and ordinals looked up are remembered, so
+    only the part of the taxonomy actually used is ever held in memory.
+    """
+    def __init__(self, filename):
+        """Map a taxonomy file.
+
+        Arguments:
+            filename: the path of a file written by `write_taxonomy`
+
+        Raises:
+            ValueError: if the file is not a taxonomy file
+        """
+        self.filename = filename
+        reader = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            reader.close()
+        if len(self._map) < HEADER_STRUCT.size or \
+                self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError("Not a Fudge taxonomy file : %s"% filename)
+        _, version, _, self._count = HEADER_STRUCT.unpack_from(self._map, 0)
+        if version != VERSION:
+            self._map.close()
+            raise ValueError("Unsupported taxonomy file version %d : %s"% \
+                    (version, filename))
+        self._name_index = HEADER_STRUCT.size + ENTRY_SIZE * self._count
+        self._names = {}
+        self._ordinals = {}
+
+    def _read_name(self, offset):
+        mapped = self._map
+        return mapped[offset + 1:offset + 1 + ord(mapped[offset])]
+
+    def get_name(self, ordinal):
+        """Return the name for a given ordinal.
+
+        Arguments:
+            ordinal : the ordinal to look up (short)
+
+        Returns:
+            The name as a unicode string, or None if the ordinal is not
+            in the taxonomy"""
+        try:
+            return self._names[ordinal]
+        except KeyError:
+            pass
+        mapped = self._map
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry, offset = ORDINAL_ENTRY_STRUCT.unpack_from(mapped, \
+                    HEADER_STRUCT.size + ENTRY_SIZE * middle)
+            if entry < ordinal:
+                low = middle + 1
+            elif entry > ordinal:
+                high = middle
+            else:
+                name = self._names[ordinal] = \
+                        self._read_name(offset).decode('utf-8')
+                return name
+        return None
+
+    def get_ordinal(self, name):
+        """Return the ordinal for a given name.
+
+        Arguments:
+            name : the name to look up (unicode string)
+
+        Returns:
+            The ordinal as a short, or None if the name is not in the
+            taxonomy"""
+        try:
+            return self._ordinals[name]
+        except KeyError:
+            pass
+        utf8 = name.encode('utf-8')
+        mapped = self._map
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            offset, ordinal = NAME_ENTRY_STRUCT.unpack_from(mapped, \
+                    self._name_index + ENTRY_SIZE * middle)
+            entry = self._read_name(offset)
+            if entry < utf8:
+                low = middle + 1
+            elif entry > utf8:
+                high = middle
+            else:
+                self._ordinals[name] = ordinal
+                return ordinal
+        return None
+
+    def close(self):
+        """Unmap the file."""
+        self._map.close()
+
+    def __reduce__(self):
+        # Processes map the file for themselves
+        return (MappedTaxonomy, (self.filename,))
+
+    def __len__(self):
+        """Return the number of elements in the taxonomy."""
+        return self._count
+
+
+class MappedTaxonomyLoader(object):
+    """
+    A loader for `CachingTaxonomyResolver` which maps the taxonomy
+    file for an id from a directory.
+
+    It pickles as its directory and pattern, so resolvers using it can
+    be passed to worker processes.
+    """
+    def __init__(self, directory, pattern='%d.ftax'):
+        """Create a new MappedTaxonomyLoader.
+
+        Arguments:
+            directory: the directory holding the taxonomy files
+            pattern: the file name of a taxonomy, formatted with its id
+                (default: '%d.ftax')
+        """
+        self.directory = directory
+        self.pattern = pattern
+
+    def __call__(self, taxonomy_id):
+        """Return the MappedTaxonomy for an id, or None if it has no
+        file."""
+        filename = os.path.join(self.directory, self.pattern% taxonomy_id)
+        if not os.path.exists(filename):
+            return None
+        return MappedTaxonomy(filename)
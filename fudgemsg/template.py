@@ -0,0 +1,344 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Message templates: precompiled encoders and decoders for messages of
+a fixed shape.
+
+A `MessageTemplate` is declared once with the name, ordinal and type of
+each field, and then encodes and decodes tuples of values, skipping the
+type lookup, narrowing and Field objects of the general path.  Field
+headers are encoded when the template is built, and each run of
+consecutive numeric or boolean fields is packed and unpacked, headers
+and all, with a single `struct.Struct`.
+
+    >>> trade = MessageTemplate([(u'id', None, types.LONG_TYPE_ID),
+    ...                          (u'price', None, types.DOUBLE_TYPE_ID),
+    ...                          (u'ticker', None, types.STRING_TYPE_ID)])
+    >>> encoded = trade.encode((1234, 99.5, u'IBM'))
+    >>> trade.decode(encoded)
+    (1234, 99.5, u'IBM')
+
+The encoding is the same as for the equivalent Message, so a template
+decodes messages encoded by other means as long as they have exactly
+its shape, and raises ValueError otherwise.
+"""
+
+import struct
+
+from fudgemsg import codecs
+from fudgemsg.field import Field, _VARIABLE_WIDTH_PREFIX, _PADDING, \
+        bytes_for_value_length, encode_value_length_into, \
+        decode_value_length_from, decode_value
+from fudgemsg.message import Message, HEADER_STRUCT, HEADER_SIZE, \
+        _HEADER_PADDING
+from fudgemsg import registry
+from fudgemsg import types
+
+# The struct format character for each type which can be packed
+# in a run of fixed width fields
+_STRUCT_CODES = {
+    types.BOOLEAN_TYPE_ID : '?',
+    types.BYTE_TYPE_ID : 'B',
+    types.SHORT_TYPE_ID : 'h',
+    types.INT_TYPE_ID : 'i',
+    types.LONG_TYPE_ID : 'q',
+    types.FLOAT_TYPE_ID : 'f',
+    types.DOUBLE_TYPE_ID : 'd',
+}
+
+# Mask off the value width bits of a prefix
+_WIDTH_MASK = 0xff ^ _VARIABLE_WIDTH_PREFIX[4]
+
+class _StructRun(object):
+    """A run of consecutive fields packed with one Struct"""
+    __slots__ = ('start', 'stop', 'struct', 'headers')
+
+    def __init__(self, start, stop, struct_, headers):
+        self.start = start
+        self.stop = stop
+        self.struct = struct_
+        self.headers = headers
+
+class _OtherField(object):
+    """A field encoded on its own"""
+    __slots__ = ('index', 'header', 'type_', 'template')
+
+    def __init__(self, index, header, type_, template):
+        self.index = index
+        self.header = header
+        self.type_ = type_
+        self.template = template
+
+class MessageTemplate(object):
+    """The compiled encoder and decoder for a fixed message shape."""
+
+    def __init__(self, fields, taxonomy=None, \
+            registry=registry.DEFAULT_REGISTRY):
+        """Compile a new MessageTemplate.
+
+        Arguments:
+            fields: a sequence of (name, ordinal, type_) for each field,
+                where name or ordinal may be None, and type_ is a
+                FieldType, a Fudge type id, or a MessageTemplate for a
+                sub-message whose value is itself a tuple
+            taxonomy: A Taxomomy to be used for replacing names with
+                ordinals. (Default : none)
+            registry: the Registry to look type ids up in, and to decode
+                and build general sub-messages with
+                (Default: DEFAULT_REGISTRY)
+        """
+        self.fields = []
+        self.taxonomy = taxonomy
+        self.registry = registry
+        self._segments = []
+
+        run = None
+        for index, (name, ordinal, type_) in enumerate(fields):
+            template = None
+            if isinstance(type_, MessageTemplate):
+                template = type_
+                type_ = registry.type_by_id(types.FUDGEMSG_TYPE_ID)
+            elif isinstance(type_, (int, long)):
+                type_ = registry.type_by_id(type_)
+            self.fields.append((name, ordinal, type_))
+            header = Field(type_, ordinal, name, None).encode_header(taxonomy)
+
+            code = _STRUCT_CODES.get(type_.type_id)
+            if code is None:
+                run = None
+                self._segments.append(_OtherField(index, header, type_, \
+                        template))
+            else:
+                if run is None:
+                    run = [index, '!', []]
+                    self._segments.append(run)
+                run[1] += '%ds%s' % (len(header), code)
+                run[2].append(header)
+                # Placeholder for the value
+                run[2].append(None)
+
+        for i, segment in enumerate(self._segments):
+            if isinstance(segment, list):
+                start, format, headers = segment
+                self._segments[i] = _StructRun(start, \
+                        start + len(headers) // 2, struct.Struct(format), \
+                        headers)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def encode_into(self, buffer, values):
+        """Encode a message of this shape onto the end of a bytearray.
+
+        Arguments:
+            buffer: the bytearray to append the message to
+            values: a sequence holding the value of each field, in order
+
+        Return:
+            buffer
+        """
+        assert len(values) == len(self.fields)
+        for segment in self._segments:
+            if segment.__class__ is _StructRun:
+                args = list(segment.headers)
+                args[1::2] = values[segment.start:segment.stop]
+                buffer.extend(segment.struct.pack(*args))
+                continue
+
+            type_ = segment.type_
+            value = values[segment.index]
+            start = len(buffer)
+            buffer.extend(segment.header)
+            if not type_.is_variable_sized:
+                if type_.encode_into:
+                    type_.encode_into(buffer, value)
+                else:
+                    buffer.extend(type_.encoder(value))
+                continue
+
+            length_pos = len(buffer)
+            if segment.template is not None or \
+                    type_.type_id == types.FUDGEMSG_TYPE_ID:
+                buffer.append(0)
+                if segment.template is not None:
+                    segment.template.encode_into(buffer, value)
+                else:
+                    value.encode_into(buffer, self.taxonomy)
+                value_length = len(buffer) - length_pos - 1
+                width = bytes_for_value_length(value_length)
+                if width > 1:
+                    buffer[length_pos + 1:length_pos + 1] = _PADDING[width - 1]
+            else:
+                value = type_.encoder(value)
+                value_length = len(value)
+                width = bytes_for_value_length(value_length)
+                buffer.extend(_PADDING[width])
+                buffer.extend(value)
+            encode_value_length_into(value_length, buffer, length_pos, width)
+            buffer[start] |= _VARIABLE_WIDTH_PREFIX[width]
+        return buffer
+
+    def encode(self, values):
+        """Encode a message of this shape.
+
+        Arguments:
+            values: a sequence holding the value of each field, in order
+
+        Return:
+            The encoded message (str)
+        """
+        return str(self.encode_into(bytearray(), values))
+
+    def encode_envelope_into(self, buffer, values, directives=0, \
+            schema_version=0, taxonomy_id=0):
+        """Encode an envelope holding a message of this shape onto the
+        end of a bytearray.
+
+        Arguments:
+            buffer: the bytearray to append the envelope to
+            values: a sequence holding the value of each field, in order
+            directives: the envelope directives (Default: 0)
+            schema_version: the envelope schema version (Default: 0)
+            taxonomy_id: the id of the template's Taxonomy (Default: 0)
+
+        Return:
+            buffer
+        """
+        start = len(buffer)
+        buffer.extend(_HEADER_PADDING)
+        self.encode_into(buffer, values)
+        HEADER_STRUCT.pack_into(buffer, start, directives, schema_version, \
+                taxonomy_id, len(buffer) - start)
+        return buffer
+
+    def decode_from(self, buffer, offset=0, end=None):
+        """Decode a message of this shape in place from a buffer.
+
+        Arguments:
+            buffer: the encoded bytes (str, bytearray, mmap or memoryview)
+            offset: the position of the first field within buffer
+                (Default: 0)
+            end: the position just past the last field (Default: the
+                end of buffer)
+
+        Return:
+            A tuple holding the value of each field, in order
+
+        Raises:
+            ValueError: if the message does not have the template's shape
+        """
+        if end is None:
+            end = len(buffer)
+        values = []
+        for segment in self._segments:
+            if segment.__class__ is _StructRun:
+                size = segment.struct.size
+                if offset + size > end:
+                    raise ValueError("Message does not match template")
+                unpacked = segment.struct.unpack_from(buffer, offset)
+                if list(unpacked[0::2]) != segment.headers[0::2]:
+                    raise ValueError("Message does not match template")
+                values.extend(unpacked[1::2])
+                offset += size
+                continue
+
+            header = segment.header
+            type_ = segment.type_
+            pos = offset + len(header)
+            if pos > end or \
+                    codecs.slice_bytes(buffer, offset + 1, pos) != header[1:]:
+                raise ValueError("Message does not match template")
+            prefix_byte = codecs.dec_byte_from(buffer, offset)[0] & 0xff
+            if prefix_byte & _WIDTH_MASK != ord(header[0]):
+                raise ValueError("Message does not match template")
+
+            if type_.is_variable_sized:
+                width = (0, 1, 2, 4)[(prefix_byte & 0x60) >> 5]
+                length = decode_value_length_from(buffer, pos, width)
+                pos += width
+            else:
+                length = type_.fixed_size
+            if pos + length > end:
+                raise ValueError("Message does not match template")
+
+            if segment.template is not None:
+                values.append(segment.template.decode_from(buffer, pos, \
+                        pos + length))
+            else:
+                values.append(decode_value(type_, buffer, pos, length, \
+                        self.taxonomy, self.registry))
+            offset = pos + length
+
+        if offset != end:
+            raise ValueError("Message does not match template")
+        return tuple(values)
+
+    def decode(self, encoded):
+        """Decode a message of this shape.
+
+        Arguments:
+            encoded: the encoded message (str, bytearray, mmap or
+                memoryview)
+
+        Return:
+            A tuple holding the value of each field, in order
+        """
+        return self.decode_from(encoded, 0, len(encoded))
+
+    def decode_envelope_from(self, buffer, offset=0):
+        """Decode an envelope holding a message of this shape in place.
+
+        Return:
+            (values, offset)
+
+            values: a tuple holding the value of each field, in order
+            offset: the position just past the end of the envelope
+        """
+        assert len(buffer) - offset >= HEADER_SIZE
+        size = HEADER_STRUCT.unpack_from(buffer, offset)[3]
+        assert size >= HEADER_SIZE and len(buffer) - offset >= size
+        return self.decode_from(buffer, offset + HEADER_SIZE, \
+                offset + size), offset + size
+
+    def to_message(self, values):
+        """Build the general Message for a tuple of values.
+
+        The fields keep the template's types, rather than being narrowed.
+
+        Arguments:
+            values: a sequence holding the value of each field, in order
+
+        Return:
+            The Message
+        """
+        assert len(values) == len(self.fields)
+        message = Message(self.registry)
+        for segment in self._segments:
+            if segment.__class__ is _StructRun:
+                for index in range(segment.start, segment.stop):
+                    name, ordinal, type_ = self.fields[index]
+                    message._add_field(Field(type_, ordinal, name, \
+                            values[index]))
+                continue
+            name, ordinal, type_ = self.fields[segment.index]
+            value = values[segment.index]
+            if segment.template is not None:
+                value = segment.template.to_message(value)
+            message._add_field(Field(type_, ordinal, name, value))
+        return message
@@ -15,4 +15,11 @@
 # KIND, either express or implied. See the License for the
 # specific language governing permissions and limitations
 # under the License.
-#
\ No newline at end of file
+#
+from fudgemsg.message import Envelope, Message
+
+def make_envelope(value):
+    """Return an Envelope holding value in a single field, 'value'."""
+    message = Message()
+    message.add(value, name=u'value')
+    return Envelope(message, schema_version=1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# Copyrigh CERN, 2010.
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import calendar
+import datetime
+import unittest
+
+from fudgemsg.message import Envelope, Message
+from fudgemsg import registry
+from fudgemsg import types
+
+class TestDateTimes(unittest.TestCase):
+    def setUp(self):
+        foo = open('fudgemsg/tests/data/dateTimes.dat', 'r')
+        self.encoded = foo.read()
+        foo.close()
+
+    def values(self, envelope):
+        return dict((f.name, f.value) for f in envelope.message.fields)
+
+    def test_decode(self):
+        values = self.values(Envelope.decode(self.encoded))
+        utc = types.UTC
+        plus_1h = types.fixed_offset(60)
+
+        # Reduced accuracy dates fill in the first month and day
+        self.assertEquals(datetime.date(2010, 1, 1), values[u'date-Year'])
+        self.assertEquals(datetime.date(2010, 3, 1), values[u'date-Month'])
+        self.assertEquals(datetime.date(2010, 3, 4), values[u'date-Day'])
+
+        self.assertEquals(datetime.time(11, 0, tzinfo=utc), \
+                values[u'time-Hour-UTC'])
+        self.assertEquals(datetime.time(11, 12, 13, 987000, tzinfo=utc), \
+                values[u'time-Milli-UTC'])
+        self.assertEquals(datetime.time(11, 12, 13, 987654, tzinfo=utc), \
+                values[u'time-Nano-UTC'])
+        self.assertEquals(None, values[u'time-Nano'].tzinfo)
+        self.assertEquals(datetime.time(11, 12, 13, 987654, tzinfo=plus_1h), \
+                values[u'time-Nano-+1h'])
+
+        self.assertEquals(datetime.datetime(1000, 1, 1), \
+                values[u'datetime-Millenia'])
+        self.assertEquals(datetime.datetime(1900, 1, 1), \
+                values[u'datetime-Century'])
+        self.assertEquals(datetime.datetime(2010, 3, 4, 11, 12, 13, 987654), \
+                values[u'datetime-Nano'])
+        self.assertEquals(datetime.datetime(2010, 3, 4, 10, 12, 13, 987654, \
+                tzinfo=utc), values[u'datetime-Nano-+1h'])
+
+    def test_decode_raw(self):
+        values = self.values(Envelope.decode(self.encoded, \
+                registry=registry.Registry(raw_datetimes=True)))
+
+        self.assertEquals(2010 << 9, values[u'date-Year'])
+        self.assertEquals((2010 << 9) | (3 << 5) | 4, values[u'date-Day'])
+        self.assertTrue(values[u'date-Month'] < values[u'date-Day'])
+
+        self.assertEquals(11 * 3600 * 10**9, values[u'time-Hour-UTC'])
+        self.assertEquals(40333987654321, values[u'time-Nano-UTC'])
+
+        epoch = calendar.timegm((2010, 3, 4, 11, 12, 13)) * 10**9 + 987654321
+        self.assertEquals(epoch, values[u'datetime-Nano-UTC'])
+        self.assertEquals(epoch, values[u'datetime-Nano'])
+        self.assertEquals(epoch - 3600 * 10**9, values[u'datetime-Nano-+1h'])
+        self.assertEquals(calendar.timegm((1900, 1, 1, 0, 0, 0)) * 10**9, \
+                values[u'datetime-Century'])
+
+    def test_roundtrip(self):
+        m = Message()
+        m.add(datetime.date(2010, 3, 4), name=u'date')
+        m.add(datetime.time(11, 12, 13, 987654, tzinfo=types.fixed_offset(-90)),
+                name=u'time')
+        m.add(datetime.datetime(2010, 3, 4, 11, 12, 13, 987654), \
+                name=u'datetime')
+        self.assertEquals([types.DATE_TYPE_ID, types.TIME_TYPE_ID, \
+                types.DATETIME_TYPE_ID], [f.type_.type_id for f in m.fields])
+
+        encoded = Envelope(m).encode_into()
+        self.assertEquals(self.values(Envelope(m)), \
+                self.values(Envelope.decode(str(encoded))))
+
+    def test_roundtrip_raw(self):
+        raw = registry.Registry(raw_datetimes=True)
+        self.assertTrue(raw.raw_datetimes)
+        m = Message()
+        for name, type_id, value in ( \
+                (u'date', types.DATE_TYPE_ID, (2010 << 9) | (3 << 5) | 4), \
+                (u'time', types.TIME_TYPE_ID, 40333987654321), \
+                (u'datetime', types.DATETIME_TYPE_ID, 1267701133987654321), \
+                (u'before', types.DATETIME_TYPE_ID, -1)):
+            m.add(value, name=name, type_=raw[type_id])
+
+        encoded = str(Envelope(m).encode_into())
+        self.assertEquals(self.values(Envelope(m)), \
+                self.values(Envelope.decode(encoded, registry=raw)))
+        self.assertEquals(datetime.datetime(1969, 12, 31, 23, 59, 59, 999999, \
+                tzinfo=types.UTC), \
+                self.values(Envelope.decode(encoded))[u'before'])
+
+    def test_timezone_units(self):
+        m = Message()
+        m.add(datetime.time(11, tzinfo=types.fixed_offset(10)))
+        self.assertRaises(ValueError, Envelope(m).encode_into)
+
+    def test_fixed_offset(self):
+        self.assertTrue(types.fixed_offset(0) is types.UTC)
+        self.assertEquals(datetime.timedelta(minutes=-90), \
+                types.fixed_offset(-90).utcoffset(None))
+        self.assertEquals('UTC-01:30', types.fixed_offset(-90).tzname(None))
@@ -117,3 +117,53 @@ class TestDeeperMsg(unittest.TestCase):
 
         self.assertEquals(len(expected), len(bytes))
         self.assertEquals(expected, bytes)
+
+    def test_encode_into_matches_encode(self):
+        """The single pass bytearray encoder gives identical output"""
+        for name in ('deeper_fudge_msg', 'subMsg', 'allNames', \
+                'allOrdinals', 'fixedWidthByteArrays', \
+                'variableWidthColumnSizes'):
+            foo = open('fudgemsg/tests/data/%s.dat'% name, 'r')
+            expected = foo.read()
+            foo.close()
+
+            e = Envelope.decode(expected)
+            self.assertEquals(expected, str(e.encode_into()))
+
+    def test_unknown_type(self):
+        """Fields of unknown types survive a decode and encode"""
+        foo = open('fudgemsg/tests/data/unknown.dat', 'r')
+        expected = foo.read()
+        foo.close()
+
+        e = Envelope.decode(expected)
+        f = e.message.fields[0]
+        self.assertEquals(200, f.type_.type_id)
+        self.assertEquals(u'unknown', f.name)
+        self.assertEquals('\x00' * 10, f.value)
+        self.assertEquals(expected, str(e.encode_into()))
+
+    def assertSameMessage(self, expected, actual):
+        self.assertEquals(len(expected.fields), len(list(actual)))
+        for f1, f2 in zip(expected, actual):
+            self.assertEquals(f1.type_, f2.type_)
+            self.assertEquals(f1.ordinal, f2.ordinal)
+            self.assertEquals(f1.name, f2.name)
+            if f1.is_type(types.FUDGEMSG_TYPE_ID):
+                self.assertSameMessage(f1.value, f2.value)
+            else:
+                self.assertEquals(f1.value, f2.value)
+
+    def test_lazy_decode_deeper(self):
+        """A lazily decoded message matches an eagerly decoded one, and
+        re-encodes to the same bytes"""
+        foo = open('fudgemsg/tests/data/deeper_fudge_msg.dat', 'r')
+        expected = foo.read()
+        foo.close()
+
+        eager = Envelope.decode(expected)
+        lazy = Envelope.decode(expected, lazy=True)
+        self.assertSameMessage(eager.message, lazy.message)
+
+        lazy = Envelope.decode(expected, lazy=True)
+        self.assertEquals(expected, str(lazy.encode_into()))
@@ -96,3 +96,20 @@ class TestSubMsg(unittest.TestCase):
         self.assertEquals(None, sub2.fields[1].name)
         self.assertEquals(828, sub2.fields[1].ordinal)
         self.assertAlmostEquals(82.769997, sub2.fields[1].value, 6)
+
+    def test_decode_submsg_buffers(self):
+        """Decode from a bytearray and a memoryview as well as a str"""
+        file = open('fudgemsg/tests/data/subMsg.dat', 'r')
+        bytes = file.read()
+        file.close()
+
+        for buf in (bytearray(bytes), memoryview(bytes)):
+            e = Envelope.decode(buf)
+            m = e.message
+            self.assertEquals(2, len(m.fields))
+            sub1 = m.fields[0].value
+            self.assertEquals(u'bibble', sub1.fields[0].name)
+            self.assertEquals(u'fibble', sub1.fields[0].value)
+            self.assertEquals(u'Blibble', sub1.fields[1].value)
+            sub2 = m.fields[1].value
+            self.assertEquals(9837438, sub2.fields[0].value)
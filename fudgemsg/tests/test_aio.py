@@ -0,0 +1,168 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import unittest
+
+from nose.plugins.skip import SkipTest
+
+try:
+    from fudgemsg import aio
+    from fudgemsg.aio import asyncio
+except ImportError:
+    aio = None
+
+from fudgemsg.tests import make_envelope
+
+class FakeTransport(object):
+    def __init__(self):
+        self.written = []
+        self.paused = False
+        self.closed = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+    def close(self):
+        self.closed = True
+
+class TestAio(unittest.TestCase):
+    def setUp(self):
+        if aio is None:
+            raise SkipTest("asyncio/trollius is not available")
+        self.loop = asyncio.new_event_loop()
+        self.values = [u'foo', u'x' * 300, u'', u'bar']
+        self.encoded = ''.join([str(make_envelope(v).encode_into()) \
+                for v in self.values])
+
+    def tearDown(self):
+        self.loop.close()
+
+    def wait(self, future):
+        return self.loop.run_until_complete(future)
+
+    def receive_all(self, queue):
+        values = []
+        while True:
+            try:
+                envelope = self.wait(queue.receive())
+            except EOFError:
+                return values
+            values.append(envelope.message.fields[0].value)
+
+    def test_protocol_receive(self):
+        protocol = aio.EnvelopeProtocol(loop=self.loop)
+        protocol.connection_made(FakeTransport())
+        for start in range(0, len(self.encoded), 5):
+            protocol.data_received(self.encoded[start:start + 5])
+        protocol.connection_lost(None)
+        self.assertEquals(self.values, self.receive_all(protocol))
+
+    def test_protocol_waiting_receive(self):
+        protocol = aio.EnvelopeProtocol(loop=self.loop)
+        protocol.connection_made(FakeTransport())
+        future = protocol.receive()
+        self.assertFalse(future.done())
+        protocol.data_received(self.encoded)
+        self.assertEquals(u'foo', future.result().message.fields[0].value)
+
+    def test_protocol_truncated(self):
+        protocol = aio.EnvelopeProtocol(loop=self.loop)
+        protocol.connection_made(FakeTransport())
+        protocol.data_received(self.encoded[:-1])
+        protocol.connection_lost(None)
+        self.assertEquals(self.values[:-1], \
+                [self.wait(protocol.receive()).message.fields[0].value \
+                        for i in range(3)])
+        self.assertRaises(ValueError, self.wait, protocol.receive())
+
+    def test_protocol_error_after_envelopes(self):
+        """Envelopes before an undecodable header are still delivered"""
+        transport = FakeTransport()
+        protocol = aio.EnvelopeProtocol(loop=self.loop)
+        protocol.connection_made(transport)
+        protocol.data_received(self.encoded + '\x00' * 8)
+        self.assertTrue(transport.closed)
+        self.assertEquals(self.values, \
+                [self.wait(protocol.receive()).message.fields[0].value \
+                        for i in range(4)])
+        self.assertRaises(ValueError, self.wait, protocol.receive())
+
+    def test_protocol_pauses_reading(self):
+        transport = FakeTransport()
+        protocol = aio.EnvelopeProtocol(max_queued=2, loop=self.loop)
+        protocol.connection_made(transport)
+        protocol.data_received(self.encoded)
+        self.assertTrue(transport.paused)
+        self.wait(protocol.receive())
+        self.wait(protocol.receive())
+        self.assertTrue(transport.paused)
+        self.wait(protocol.receive())
+        self.assertFalse(transport.paused)
+
+    def test_protocol_send_batches(self):
+        transport = FakeTransport()
+        protocol = aio.EnvelopeProtocol(loop=self.loop)
+        protocol.connection_made(transport)
+        for value in self.values:
+            protocol.send(make_envelope(value))
+        self.assertEquals([], transport.written)
+        self.wait(protocol.drain())
+        self.assertEquals([self.encoded], transport.written)
+
+    def test_protocol_drain_waits(self):
+        protocol = aio.EnvelopeProtocol(loop=self.loop)
+        protocol.connection_made(FakeTransport())
+        protocol.pause_writing()
+        waiter = protocol.drain()
+        self.assertFalse(waiter.done())
+        protocol.resume_writing()
+        self.assertTrue(waiter.done())
+
+    def test_stream_reader(self):
+        stream = asyncio.StreamReader(loop=self.loop)
+        stream.feed_data(self.encoded)
+        stream.feed_eof()
+        reader = aio.EnvelopeStreamReader(stream, chunk_size=7, \
+                loop=self.loop)
+        self.assertEquals(self.values, self.receive_all(reader))
+
+    def test_stream_reader_truncated(self):
+        stream = asyncio.StreamReader(loop=self.loop)
+        stream.feed_data(self.encoded[:10])
+        stream.feed_eof()
+        reader = aio.EnvelopeStreamReader(stream, loop=self.loop)
+        self.assertRaises(ValueError, self.wait, reader.receive())
+
+    def test_anext(self):
+        stream = asyncio.StreamReader(loop=self.loop)
+        stream.feed_data(self.encoded)
+        stream.feed_eof()
+        reader = aio.EnvelopeStreamReader(stream, loop=self.loop)
+        self.assertTrue(reader.__aiter__() is reader)
+        for value in self.values:
+            envelope = self.wait(reader.__anext__())
+            self.assertEquals(value, envelope.message.fields[0].value)
+        self.assertRaises(aio._StopAsyncIteration, self.wait, \
+                reader.__anext__())
@@ -0,0 +1,135 @@
+#
+# Copyright CERN, 2010.
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import pickle
+import threading
+import unittest
+
+from fudgemsg.message import Envelope, Message
+from fudgemsg.taxonomy.cachingresolver import CachingTaxonomyResolver
+from fudgemsg.taxonomy.map import Taxonomy
+
+def load_taxonomy(taxonomy_id):
+    if taxonomy_id < 0:
+        return None
+    return Taxonomy({taxonomy_id : u'foo'})
+
+class TestCachingResolver(unittest.TestCase):
+    def test_lru(self):
+        loads = []
+        def loader(taxonomy_id):
+            loads.append(taxonomy_id)
+            return load_taxonomy(taxonomy_id)
+
+        tr = CachingTaxonomyResolver(loader, max_size=2)
+        self.assertEquals(0, len(tr))
+        t1 = tr.resolve_taxonomy(1)
+        self.assertEquals(u'foo', t1.get_name(1))
+        self.assertTrue(t1 is tr.resolve_taxonomy(1))
+        tr.resolve_taxonomy(2)
+        tr.resolve_taxonomy(1)
+        tr.resolve_taxonomy(3)     # evicts 2, the least recently used
+
+        self.assertEquals([1, 2, 3], loads)
+        self.assertTrue(1 in tr)
+        self.assertFalse(2 in tr)
+        self.assertEquals(2, len(tr))
+        self.assertEquals((2, 3, 1), (tr.hits, tr.misses, tr.evictions))
+
+        tr.resolve_taxonomy(2)
+        self.assertEquals([1, 2, 3, 2], loads)
+
+        tr.invalidate(3)
+        self.assertFalse(3 in tr)
+        tr.invalidate()
+        self.assertEquals(0, len(tr))
+
+    def test_missing_not_cached(self):
+        loads = []
+        def loader(taxonomy_id):
+            loads.append(taxonomy_id)
+            return None
+
+        tr = CachingTaxonomyResolver(loader)
+        self.assertEquals(None, tr.resolve_taxonomy(1))
+        self.assertEquals(None, tr.resolve_taxonomy(1))
+        self.assertEquals([1, 1], loads)
+        self.assertEquals(0, len(tr))
+
+    def test_failed_load(self):
+        def loader(taxonomy_id):
+            raise IOError("unavailable")
+
+        tr = CachingTaxonomyResolver(loader)
+        self.assertRaises(IOError, tr.resolve_taxonomy, 1)
+        self.assertRaises(IOError, tr.resolve_taxonomy, 1)
+        self.assertEquals(0, len(tr))
+
+    def test_concurrent_loads(self):
+        started = threading.Event()
+        release = threading.Event()
+        loads = []
+        def loader(taxonomy_id):
+            loads.append(taxonomy_id)
+            started.set()
+            release.wait()
+            return load_taxonomy(taxonomy_id)
+
+        tr = CachingTaxonomyResolver(loader)
+        results = []
+        def resolve():
+            results.append(tr.resolve_taxonomy(7))
+
+        threads = [threading.Thread(target=resolve) for i in range(8)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals([7], loads)
+        self.assertEquals(8, len(results))
+        for taxonomy in results:
+            self.assertTrue(taxonomy is results[0])
+        self.assertEquals(1, tr.misses)
+
+    def test_pickle(self):
+        tr = CachingTaxonomyResolver(load_taxonomy, max_size=3)
+        tr.resolve_taxonomy(1)
+        copy = pickle.loads(pickle.dumps(tr))
+        self.assertEquals(3, copy.max_size)
+        self.assertEquals(0, len(copy))
+        self.assertEquals(u'foo', copy.resolve_taxonomy(2).get_name(2))
+
+    def test_envelope(self):
+        tr = CachingTaxonomyResolver(load_taxonomy)
+        message = Message()
+        message.add(u'x', name=u'foo')
+        envelope = Envelope(message, taxonomy_resolver=tr)
+        self.assertTrue(tr is envelope.taxonomy_resolver)
+
+        encoded = str(envelope.encode_into(taxonomy_id=5))
+        self.assertTrue('foo' not in encoded)
+        decoded = Envelope.decode(encoded, taxonomy_resolver=tr)
+        self.assertEquals(u'foo', decoded.message.fields[0].name)
+        self.assertEquals(5, decoded.message.fields[0].ordinal)
+        self.assertEquals((1, 1), (tr.hits, tr.misses))
@@ -113,3 +113,51 @@ class codecsTests(unittest.TestCase):
         # as int                                                                  
         self.assertEquals('\x00\x00\x00\x01\x00\x00\x00\x04\x00\x00\x01\x00', enc_array(enc_int, val))
         self.assertEquals(val, dec_array(dec_int, 4, '\x00\x00\x00\x01\x00\x00\x00\x04\x00\x00\x01\x00'))
+
+    def test_from_offset(self):
+        encoded = '\xff' + enc_byte(7) + enc_short(utils.MIN_SHORT) + \
+                enc_int(utils.MIN_INT) + enc_long(utils.MAX_LONG) + \
+                enc_float(1.0) + enc_double(2.0) + enc_bool(True) + \
+                enc_name('abc')
+
+        for buf in (encoded, bytearray(encoded), memoryview(encoded)):
+            self.assertEquals((7, 2), dec_byte_from(buf, 1))
+            self.assertEquals((utils.MIN_SHORT, 4), dec_short_from(buf, 2))
+            self.assertEquals((utils.MIN_INT, 8), dec_int_from(buf, 4))
+            self.assertEquals((utils.MAX_LONG, 16), dec_long_from(buf, 8))
+            self.assertEquals((1.0, 20), dec_float_from(buf, 16))
+            self.assertEquals((2.0, 28), dec_double_from(buf, 20))
+            self.assertEquals((True, 29), dec_bool_from(buf, 28))
+            self.assertEquals((u'abc', 33), dec_name_from(buf, 29))
+            self.assertEquals((u'ab', 32), dec_unicode_from(buf, 30, 2))
+
+    def test_signed_decode(self):
+        self.assertEquals(-1, dec_short('\xff\xff'))
+        self.assertEquals(-1, dec_int('\xff\xff\xff\xff'))
+        self.assertEquals(-1, dec_long('\xff' * 8))
+        self.assertEquals(255, dec_byte('\xff'))
+        self.assertEquals(False, dec_bool(bytearray('\x00')))
+
+    def test_typed_arrays(self):
+        val = [1, 4, 256]
+        self.assertEquals('\x00\x01\x00\x04\x01\x00', enc_short_array(val))
+        self.assertEquals(val, dec_short_array('\x00\x01\x00\x04\x01\x00'))
+        self.assertEquals(enc_array(enc_int, val), enc_int_array(val))
+        self.assertEquals(val, dec_int_array(enc_int_array(val)))
+        self.assertEquals(enc_array(enc_long, val), enc_long_array(val))
+        self.assertEquals(val, dec_long_array(enc_long_array(val)))
+
+        doubles = [x / 10.0 for x in range(16)]
+        self.assertEquals(enc_array(enc_double, doubles), \
+                enc_double_array(doubles))
+        self.assertEquals(doubles, dec_double_array(enc_double_array(doubles)))
+        self.assertEquals([0.5, 1.0], dec_float_array(enc_float_array([0.5, 1.0])))
+
+        self.assertEquals('', enc_double_array([]))
+        self.assertEquals([], dec_double_array(''))
+        self.assertRaises(AssertionError, dec_double_array, '\x00' * 9)
+
+    def test_typed_arrays_from(self):
+        encoded = bytearray('\xff' + enc_short_array([1, -1, 3]))
+        self.assertEquals([1, -1, 3], dec_short_array_from(encoded, 1, 6))
+        self.assertEquals([-1], dec_short_array_from(encoded, 3, 2))
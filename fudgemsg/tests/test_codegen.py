@@ -0,0 +1,113 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import unittest
+
+from fudgemsg import codegen
+from fudgemsg.message import Message
+
+SCHEMA = '''
+# Trades and their fills
+message Trade {
+    long id = 1;
+    double price;
+    string ticker [name="Ticker"];
+    repeated Fill fills = 4;
+    boolean flag;
+    indicator done;
+}
+
+message Fill {
+    int quantity = 1;
+    double price = 2 [name=""];
+}
+'''
+
+class TestCodegen(unittest.TestCase):
+    def setUp(self):
+        self.module = codegen.compile_schema(SCHEMA)
+        Trade, Fill = self.module.Trade, self.module.Fill
+        self.trade = Trade(id=1234, price=99.5, ticker=u'IBM', \
+                fills=[Fill(10, 99.25), Fill(20, 99.75)], flag=True)
+
+    def test_parse(self):
+        schemas = codegen.parse_schema(SCHEMA)
+        self.assertEquals(['Trade', 'Fill'], [s.classname for s in schemas])
+        ticker = schemas[0].fields[2]
+        self.assertEquals(u'Ticker', ticker.name)
+        self.assertEquals(None, ticker.ordinal)
+        self.assertTrue(schemas[0].fields[3].repeated)
+        self.assertEquals(None, schemas[1].fields[1].name)
+        self.assertEquals(2, schemas[1].fields[1].ordinal)
+
+    def test_parse_errors(self):
+        for text in ('message Foo {', 'long id;', 'message Foo { long; }', \
+                '}', 'message A { message B {} }'):
+            self.assertRaises(codegen.SchemaError, codegen.parse_schema, text)
+        self.assertRaises(codegen.SchemaError, codegen.compile_schema, \
+                'message A { Unknown b; }')
+
+    def test_slotted(self):
+        self.assertRaises(AttributeError, setattr, self.trade, 'foo', 1)
+        self.assertEquals([], self.module.Trade().fills)
+
+    def test_encode_matches_message(self):
+        encoded = self.trade.encode()
+        message = self.trade.to_fudge()
+        self.assertEquals(str(message.encode_into(bytearray())), encoded)
+
+    def test_roundtrip(self):
+        Trade = self.module.Trade
+        encoded = self.trade.encode()
+        self.assertEquals(self.trade, Trade.decode(encoded))
+        self.assertEquals(self.trade, Trade.from_fudge(Message.decode(encoded)))
+        self.assertEquals(u'IBM', Message.decode(encoded)[u'Ticker'].value)
+
+    def test_decode_by_name_and_narrowed(self):
+        message = Message()
+        message.add(5, name=u'id')
+        message.add(u'extra', name=u'unknown')
+        message.add(7, ordinal=99)
+        trade = self.module.Trade.decode(str(message.encode_into(bytearray())))
+        self.assertEquals(5, trade.id)
+        self.assertEquals(None, trade.price)
+
+    def test_decode_out_of_order(self):
+        message = self.trade.to_fudge()
+        message.fields.reverse()
+        encoded = str(message.encode_into(bytearray()))
+        trade = self.module.Trade.decode(encoded)
+        self.trade.fills.reverse()
+        self.assertEquals(self.trade, trade)
+
+    def test_repr(self):
+        self.assertEquals('Fill(quantity=1, price=None)', \
+                repr(self.module.Fill(1)))
+
+    def test_unsigned_byte(self):
+        """Bytes are unsigned, as for Message"""
+        module = codegen.compile_schema('message T { byte flags = 1; }')
+        T = module.T
+        encoded = T(flags=200).encode()
+        self.assertEquals(200, T.decode(encoded).flags)
+        self.assertEquals(200, Message.decode(encoded).fields[0].value)
+
+        message = Message()
+        message.add(200, name=u'flags', ordinal=1)
+        self.assertEquals(encoded, str(message.encode_into(bytearray())))
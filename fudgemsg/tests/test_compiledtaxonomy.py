@@ -0,0 +1,86 @@
+#
+# Copyright CERN, 2010.
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+
+import cStringIO
+import unittest
+
+from fudgemsg.message import Message
+from fudgemsg.taxonomy.compiled import CompiledTaxonomy
+from fudgemsg.taxonomy.map import Taxonomy
+
+class TestCompiledTaxomomy(unittest.TestCase):
+
+    def test_simple(self):
+        t = CompiledTaxonomy({ 1 : u'foo', 2 : u'bar'})
+        self.assertEquals(u'foo', t.get_name(1))
+        self.assertEquals(1, t.get_ordinal(u'foo'))
+
+        self.assertEquals(u'bar', t.get_name(2))
+        self.assertEquals(2, t.get_ordinal(u'bar'))
+
+        self.assertEquals(2, len(t))
+
+    def test_not_exists(self):
+        t = CompiledTaxonomy({-3 : u'foo', 5 : u'bar'})
+
+        self.assertEquals(u'foo', t.get_name(-3))
+        self.assertEquals(None, t.get_name(-4))
+        self.assertEquals(None, t.get_name(0))
+        self.assertEquals(None, t.get_name(6))
+        self.assertEquals(None, t.get_ordinal(u'baz'))
+        self.assertEquals(None, t.encoded_ordinal(u'baz'))
+
+    def test_empty_map(self):
+        t = CompiledTaxonomy()
+
+        self.assertEquals(0, len(t))
+        self.assertEquals(None, t.get_name(2))
+        self.assertEquals(None, t.get_ordinal(u'foo'))
+
+    def test_encoded(self):
+        t = CompiledTaxonomy({258 : u'caf\xe9', 0 : u'zero'})
+        self.assertEquals('\x01\x02', t.encoded_ordinal(u'caf\xe9'))
+        self.assertEquals(None, t.encoded_ordinal(u'zero'))
+
+    def test_compile(self):
+        t = Taxonomy({1 : u'foo', 2 : u'bar'})
+        compiled = t.compile()
+        self.assertEquals(len(t), len(compiled))
+        for ordinal in range(4):
+            self.assertEquals(t.get_name(ordinal), compiled.get_name(ordinal))
+
+        message = Message()
+        message.add(u'x', name=u'foo')
+        message.add(u'y', name=u'baz')
+        self.assertEquals(message.encode_into(bytearray(), t), \
+                message.encode_into(bytearray(), compiled))
+        self.assertEquals(message.size(t), message.size(compiled))
+
+        for taxonomy in (t, compiled):
+            output = cStringIO.StringIO()
+            message.encode(output, taxonomy)
+            self.assertEquals(str(message.encode_into(bytearray(), t)), \
+                    output.getvalue())
+
+        decoded = Message.decode(str(message.encode_into(bytearray(), t)), \
+                compiled)
+        self.assertEquals([u'foo', u'baz'], [f.name for f in decoded.fields])
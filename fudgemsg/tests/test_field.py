@@ -275,3 +275,13 @@ class TestField(unittest.TestCase):
        self.encodeEquals('200f18' + '300e000003' + u'foo'.encode('hex') \
                                   + '300e000203' + u'bar'.encode('hex') \
                                   + '300e000303' + u'baz'.encode('hex'), f)
+
+    def test_compact(self):
+        """Fields, messages and envelopes have no per-instance __dict__"""
+        f = Field(BYTE_FIELD, None, None, 0x01)
+        self.assertFalse(hasattr(f, '__dict__'))
+        self.assertFalse(hasattr(BYTE_FIELD, '__dict__'))
+        m = message.Message()
+        self.assertFalse(hasattr(m, '__dict__'))
+        self.assertFalse(hasattr(message.Envelope(m), '__dict__'))
+        self.assertRaises(AttributeError, setattr, f, 'foo', 1)
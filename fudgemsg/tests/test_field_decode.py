@@ -60,6 +60,45 @@ class testField(unittest.TestCase):
         self.assertEquals(8, len(f.value))
         self.assertEquals(BYTES[:8], f.value)
 
+    def test_unknown_type(self):
+        """Unknown variable width types decode as opaque bytes"""
+        encoded = ('20c803' + 'abcdef' + '8002' + '07').decode('hex')
+        (f, num_bytes) = Field.decode(encoded)
+        self.assertEquals(6, num_bytes)
+        self.assertEquals(0xc8, f.type_.type_id)
+        self.assertEquals('\xab\xcd\xef', f.value)
+        buffer = bytearray()
+        f.encode_into(buffer)
+        self.assertEquals(encoded[:6], str(buffer))
+
+        # Which is shared, but not a registered type
+        self.assertTrue(f.type_ is REGISTRY.unknown_type(0xc8))
+        self.assertRaises(registry.UnknownTypeError, REGISTRY.type_by_id, 0xc8)
+
+        # Fixed width types can't be skipped
+        self.assertRaises(registry.UnknownTypeError, Field.decode, \
+                '80c8abcd'.decode('hex'))
+
+    def test_custom_registry(self):
+        custom = registry.Registry()
+        custom.register_type(registry.FieldType(0xc8, None, False, 2, \
+                codecs.enc_short, codecs.dec_short))
+        encoded = ('80c8' + '0102').decode('hex')
+        (f, num_bytes) = Field.decode(encoded, registry=custom)
+        self.assertEquals(4, num_bytes)
+        self.assertEquals(0x0102, f.value)
+        self.assertRaises(registry.UnknownTypeError, Field.decode, encoded)
+
+        m = message.Message.decode(('200f04' + '80c80102').decode('hex'), \
+                registry=custom)
+        self.assertTrue(m.registry is custom)
+        self.assertEquals(0x0102, m.fields[0].value.fields[0].value)
+        self.assertTrue(m.fields[0].value.registry is custom)
+
+        lazy = message.LazyMessage(('200f04' + '80c80102').decode('hex'), \
+                registry=custom)
+        self.assertEquals(0x0102, lazy.fields[0].value.fields[0].value)
+
     def test_fixedlen_bytearrays_submsg(self):
         """Test we decode fixed length byte arrays"""
 
@@ -116,3 +155,25 @@ class testField(unittest.TestCase):
 
         m = f.value
         self.assertEquals(3, len(m.fields))
+
+    def test_decode_from_offset(self):
+        """Decode fields in place from the middle of a buffer"""
+        encoded = ('ffff' + '300e000103' + u'foo'.encode('hex') \
+                          + '9002000101').decode('hex')
+
+        for buf in (encoded, bytearray(encoded), memoryview(encoded)):
+            (f, pos) = Field.decode_from(buf, 2, len(buf))
+            self.assertEquals(10, pos)
+            self.assertEquals(1, f.ordinal)
+            self.assertEquals(u'foo', f.value)
+
+            (f, pos) = Field.decode_from(buf, pos, len(buf))
+            self.assertEquals(15, pos)
+            self.assertEquals(1, f.ordinal)
+            self.assertEquals(1, f.value)
+
+    def test_decode_from_overrun(self):
+        """A value running past the end of the field is an error"""
+        encoded = '200e05666f6f'.decode('hex')
+        self.assertRaises(AssertionError, Field.decode_from, encoded, 0, \
+                len(encoded))
@@ -0,0 +1,210 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fudgemsg.logfile import *
+from fudgemsg.message import HEADER_STRUCT
+from fudgemsg.stream import read_envelopes
+from fudgemsg.taxonomy.map import Taxonomy
+from fudgemsg.tests import make_envelope
+
+def values(envelopes):
+    return [e.message.fields[0].value for e in envelopes]
+
+class TestLogFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'day.log')
+        self.values = [u'foo', u'x' * 300, u'', u'bar']
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, values, buffer_size=DEFAULT_BUFFER_SIZE, start=0):
+        writer = LogWriter(self.filename, buffer_size)
+        for i, value in enumerate(values):
+            self.assertEquals(start + i, \
+                    writer.append(make_envelope(value), timestamp=i * 10))
+        writer.close()
+
+    def test_random_access(self):
+        self.write(self.values, buffer_size=100)
+        reader = LogReader(self.filename)
+        self.assertEquals(4, len(reader))
+        self.assertEquals(u'bar', reader[3].message.fields[0].value)
+        self.assertEquals(u'foo', reader[-4].message.fields[0].value)
+        self.assertEquals(1, reader[1].schema_version)
+        self.assertRaises(IndexError, reader.__getitem__, 4)
+        self.assertEquals(0, reader.offset(0))
+        self.assertEquals(20, reader.timestamp(2))
+
+        self.assertEquals(self.values, values(reader))
+        self.assertEquals(self.values[2:], values(reader.read_from(2)))
+        self.assertEquals([], values(reader.read_from(4)))
+
+        self.assertEquals(str(make_envelope(u'bar').encode_into()), \
+                str(reader.raw(3)))
+
+        # The data file is a plain stream of envelopes
+        self.assertEquals(self.values, \
+                values(read_envelopes(open(self.filename, 'rb'))))
+        reader.close()
+
+    def test_find(self):
+        self.write(self.values)
+        reader = LogReader(self.filename, lazy=True)
+        self.assertEquals(0, reader.find(-5))
+        self.assertEquals(1, reader.find(10))
+        self.assertEquals(2, reader.find(11))
+        self.assertEquals(4, reader.find(31))
+        self.assertEquals(u'', reader[reader.find(15)].message[u'value'].value)
+        reader.close()
+
+    def test_append_existing(self):
+        self.write(self.values[:2])
+        self.write(self.values[2:], start=2)
+        writer = LogWriter(self.filename)
+        writer.append_encoded(str(make_envelope(u'baz').encode_into()))
+        writer.close()
+
+        reader = LogReader(self.filename)
+        self.assertEquals(self.values + [u'baz'], values(reader))
+        self.assertEquals(None, reader.timestamp(4))
+        reader.close()
+
+    def test_empty(self):
+        LogWriter(self.filename).close()
+        reader = LogReader(self.filename)
+        self.assertEquals(0, len(reader))
+        self.assertEquals([], list(reader))
+        self.assertEquals(0, reader.find(0))
+        reader.close()
+
+    def test_refresh(self):
+        writer = LogWriter(self.filename)
+        writer.append(make_envelope(u'foo'))
+        writer.flush()
+        reader = LogReader(self.filename)
+        writer.append(make_envelope(u'bar'))
+        writer.close()
+        self.assertEquals(1, len(reader))
+        reader.refresh()
+        self.assertEquals([u'foo', u'bar'], values(reader))
+        reader.close()
+
+    def test_recover(self):
+        self.write(self.values)
+        size = os.path.getsize(self.filename)
+        # A crash part way through the last envelope
+        data = open(self.filename, 'r+b')
+        data.truncate(size - 2)
+        data.close()
+
+        reader = LogReader(self.filename)
+        self.assertEquals(self.values[:3], values(reader))
+        reader.close()
+
+        self.write([u'baz'], start=3)
+        reader = LogReader(self.filename)
+        self.assertEquals(self.values[:3] + [u'baz'], values(reader))
+        reader.close()
+
+    def test_unindexed_recording(self):
+        """A plain stream of envelopes is indexed, not truncated"""
+        data = open(self.filename, 'wb')
+        for value in self.values:
+            data.write(str(make_envelope(value).encode_into()))
+        size = data.tell()
+        data.write(str(make_envelope(u'partial').encode_into())[:-3])
+        data.close()
+
+        writer = LogWriter(self.filename)
+        self.assertEquals(4, writer.count)
+        writer.append(make_envelope(u'baz'), timestamp=5)
+        writer.close()
+
+        reader = LogReader(self.filename)
+        self.assertEquals(self.values + [u'baz'], values(reader))
+        self.assertEquals(size, reader.offset(4))
+        self.assertEquals(None, reader.timestamp(3))
+        self.assertEquals(5, reader.timestamp(4))
+        reader.close()
+
+    def test_index_behind_data(self):
+        """Envelopes written after the last index entry are indexed"""
+        self.write(self.values[:2])
+        data = open(self.filename, 'ab')
+        for value in self.values[2:]:
+            data.write(str(make_envelope(value).encode_into()))
+        data.close()
+
+        LogWriter(self.filename).close()
+        reader = LogReader(self.filename)
+        self.assertEquals(self.values, values(reader))
+        self.assertEquals(10, reader.timestamp(1))
+        self.assertEquals(None, reader.timestamp(2))
+        reader.close()
+
+    def test_corrupt_header(self):
+        """A corrupt header before the end of the file is an error, and
+        nothing is truncated"""
+        self.write(self.values[:2])
+        data = open(self.filename, 'ab')
+        data.write(str(make_envelope(u'foo').encode_into()))
+        data.write(HEADER_STRUCT.pack(0, 0, 0, 3))
+        data.write(str(make_envelope(u'bar').encode_into()))
+        data.close()
+        size = os.path.getsize(self.filename)
+
+        self.assertRaises(ValueError, LogWriter, self.filename)
+        self.assertEquals(size, os.path.getsize(self.filename))
+
+    def test_taxonomies(self):
+        """Resolvers mapping the id to different taxonomies do not share
+        headers"""
+        class Resolver(object):
+            def __init__(self, ordinal):
+                self.taxonomy = Taxonomy({ordinal : u'value'})
+            def resolve_taxonomy(self, taxonomy_id):
+                return self.taxonomy
+
+        writer = LogWriter(self.filename)
+        for ordinal in (5, 9):
+            envelope = make_envelope(u'foo')
+            envelope.taxonomy_resolver = Resolver(ordinal)
+            writer.append(envelope, taxonomy_id=1)
+        writer.close()
+
+        reader = LogReader(self.filename)
+        self.assertEquals([5, 9], \
+                [e.message.fields[0].ordinal for e in reader])
+        reader.close()
+
+    def test_bad_index(self):
+        self.write(self.values)
+        index = open(index_filename(self.filename), 'r+b')
+        index.write('XXXX')
+        index.close()
+        self.assertRaises(ValueError, LogReader, self.filename)
+        self.assertRaises(ValueError, LogWriter, self.filename)
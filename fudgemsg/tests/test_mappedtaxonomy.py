@@ -0,0 +1,108 @@
+#
+# Copyright CERN, 2010.
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import cStringIO
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from fudgemsg.message import Envelope, Message
+from fudgemsg.taxonomy.cachingresolver import CachingTaxonomyResolver
+from fudgemsg.taxonomy.mapped import *
+
+class TestMappedTaxonomy(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, '1.ftax')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_simple(self):
+        names = dict((i * 3 - 300, u'name%d'% i) for i in range(500))
+        names[7] = u'caf\xe9'
+        save_taxonomy(names, self.filename)
+
+        t = MappedTaxonomy(self.filename)
+        self.assertEquals(len(names), len(t))
+        for ordinal, name in names.items():
+            self.assertEquals(name, t.get_name(ordinal))
+            self.assertEquals(ordinal, t.get_ordinal(name))
+        # and again from memory
+        self.assertEquals(u'caf\xe9', t.get_name(7))
+        self.assertEquals(7, t.get_ordinal(u'caf\xe9'))
+        t.close()
+
+    def test_not_exists(self):
+        save_taxonomy({1 : u'foo'}, self.filename)
+        t = MappedTaxonomy(self.filename)
+        self.assertEquals(None, t.get_name(2))
+        self.assertEquals(None, t.get_name(-1))
+        self.assertEquals(None, t.get_ordinal(u'bar'))
+        self.assertEquals(None, t.get_ordinal(u'fo'))
+        t.close()
+
+    def test_empty_map(self):
+        save_taxonomy({}, self.filename)
+        t = MappedTaxonomy(self.filename)
+        self.assertEquals(0, len(t))
+        self.assertEquals(None, t.get_name(2))
+        self.assertEquals(None, t.get_ordinal(u'foo'))
+        t.close()
+
+    def test_format(self):
+        writer = cStringIO.StringIO()
+        write_taxonomy({2 : u'b', 1 : u'ab'}, writer)
+        self.assertEquals('FTAX\x00\x01\x00\x00\x00\x00\x00\x02' \
+                '\x00\x01\x00\x00\x00\x00\x00\x2c' \
+                '\x00\x02\x00\x00\x00\x00\x00\x2f' \
+                '\x00\x00\x00\x2c\x00\x01\x00\x00' \
+                '\x00\x00\x00\x2f\x00\x02\x00\x00' \
+                '\x02ab\x01b', writer.getvalue())
+
+    def test_bad_file(self):
+        writer = open(self.filename, 'wb')
+        writer.write('not a taxonomy')
+        writer.close()
+        self.assertRaises(ValueError, MappedTaxonomy, self.filename)
+
+    def test_pickle(self):
+        save_taxonomy({1 : u'foo'}, self.filename)
+        t = pickle.loads(pickle.dumps(MappedTaxonomy(self.filename)))
+        self.assertEquals(u'foo', t.get_name(1))
+
+    def test_loader(self):
+        save_taxonomy({5 : u'foo'}, self.filename)
+        tr = CachingTaxonomyResolver(MappedTaxonomyLoader(self.directory))
+        self.assertEquals(None, tr.resolve_taxonomy(2))
+
+        message = Message()
+        message.add(u'x', name=u'foo')
+        encoded = str(Envelope(message, taxonomy_resolver=tr).encode_into( \
+                taxonomy_id=1))
+        self.assertTrue('foo' not in encoded)
+        decoded = Envelope.decode(encoded, taxonomy_resolver=tr)
+        self.assertEquals(u'foo', decoded.message.fields[0].name)
+        self.assertEquals(5, decoded.message.fields[0].ordinal)
+
+        copy = pickle.loads(pickle.dumps(tr))
+        self.assertEquals(5, copy.resolve_taxonomy(1).get_ordinal(u'foo'))
@@ -22,7 +22,10 @@
 import unittest
 import cStringIO
 
-from fudgemsg.message import Envelope, Message
+from fudgemsg.message import Envelope, Message, LazyMessage, encode_many
+from fudgemsg import field
+from fudgemsg.field import Field
+from fudgemsg.taxonomy.map import Taxonomy
 from fudgemsg.types import INDICATOR
 
 from nose.plugins.skip import SkipTest
@@ -105,3 +108,238 @@ class messageTests(unittest.TestCase):
         message.encode(writer)
         bytes = writer.getvalue()
         m = Message.decode(bytes)
+
+    def test_nested_sizes_computed_once(self):
+        """Each sub-message is only sized once per encode, however deeply
+        nested it is"""
+        calls = []
+        class CountingField(Field):
+            __slots__ = ()
+            def size(self, taxonomy=None, sizes=None):
+                calls.append(1)
+                return Field.size(self, taxonomy, sizes)
+
+        leaf = Message()
+        leaf.add(u'foo', name=u'bar')
+        f = leaf.fields.pop()
+        leaf._add_field(CountingField(f.type_, f.ordinal, f.name, f.value))
+
+        message = leaf
+        for i in range(5):
+            parent = Message()
+            parent.add(message, name=u'sub')
+            message = parent
+
+        e = Envelope(message)
+        e.encode(self._output)
+        self.assertEquals(1, len(calls))
+        self.assertEquals(8 + 5 * 7 + 10, len(self._output.getvalue()))
+
+        sizes = {}
+        self.assertEquals(5 * 7 + 10, message.size(None, sizes))
+        # The 6 message sizes, and the identity of each of their fields
+        self.assertEquals(6, len([size for size in sizes.values() \
+                if isinstance(size, int)]))
+        self.assertEquals(12, len(sizes))
+        self.assertEquals(10, sizes[id(leaf)])
+
+    def test_encode_into_backpatches_lengths(self):
+        """Sub-message length slots are widened as needed"""
+        for length in (10, 300, 40000):
+            sub = Message()
+            sub.add('x' * length, name=u'bytes')
+            message = Message()
+            message.add(sub, name=u'sub')
+            message.add(True, name=u'after')
+
+            e = Envelope(message)
+            e.encode(self._output)
+            expected = self._output.getvalue()
+            self._output.reset()
+            self._output.truncate()
+
+            buffer = bytearray('prefix')
+            self.assertTrue(buffer is e.encode_into(buffer))
+            self.assertEquals('prefix' + expected, str(buffer))
+
+    def test_encode_into_taxonomy(self):
+        t = Taxonomy({1 : u'foo', 2 : u'bar'})
+        message = Message()
+        message.add(u'x', name=u'foo')
+        message.add(u'y', name=u'baz')
+
+        message.encode(self._output, t)
+        self.assertEquals(self._output.getvalue(), \
+                str(message.encode_into(bytearray(), t)))
+
+    def test_encode_looks_names_up_once(self):
+        """Sizing and encoding share one taxonomy lookup per field"""
+        class CountingTaxonomy(Taxonomy):
+            lookups = 0
+            def get_ordinal(self, name):
+                CountingTaxonomy.lookups += 1
+                return Taxonomy.get_ordinal(self, name)
+        t = CountingTaxonomy({1 : u'foo'})
+
+        class Resolver(object):
+            def resolve_taxonomy(self, taxonomy_id):
+                return t
+        sub = Message()
+        sub.add(u'z', name=u'foo')
+        message = Message()
+        message.add(u'x', name=u'foo')
+        message.add(u'y', name=u'bar')
+        message.add(sub, name=u'sub')
+
+        Envelope(message, taxonomy_resolver=Resolver()).encode(self._output, \
+                taxonomy_id=1)
+        self.assertEquals(4, CountingTaxonomy.lookups)
+        self.assertEquals(self._output.getvalue(), str(Envelope(message, \
+                taxonomy_resolver=Resolver()).encode_into(taxonomy_id=1)))
+
+    def test_encode_many(self):
+        envelopes = []
+        for i in range(5):
+            sub = Message()
+            sub.add(u'x' * (i * 100), name=u'pad')
+            message = Message()
+            message.add(i, name=u'id', ordinal=1)
+            message.add(sub, name=u'sub')
+            envelopes.append(Envelope(message, schema_version=i))
+
+        headers = {}
+        buffer, offsets = encode_many(envelopes, bytearray('xx'), \
+                headers=headers)
+        self.assertEquals(5, len(offsets))
+        self.assertEquals(2, offsets[0])
+        self.assertEquals([None], headers.keys())
+        self.assertEquals(3, len(headers[None]))
+        ends = offsets[1:] + [len(buffer)]
+        for envelope, start, end in zip(envelopes, offsets, ends):
+            self.assertEquals(str(envelope.encode_into()), \
+                    str(buffer[start:end]))
+
+        # The headers can be reused for the next batch
+        again, offsets = encode_many(envelopes, headers=headers)
+        self.assertEquals(buffer[2:], again)
+        self.assertEquals(3, len(headers[None]))
+
+    def test_encode_many_taxonomy(self):
+        class Resolver(object):
+            calls = 0
+            def resolve_taxonomy(self, taxonomy_id):
+                Resolver.calls += 1
+                return Taxonomy({1 : u'foo'})
+        resolver = Resolver()
+        envelopes = []
+        for value in (u'a', u'b', u'c'):
+            message = Message()
+            message.add(value, name=u'foo')
+            envelopes.append(Envelope(message))
+            envelopes[-1].taxonomy_resolver = resolver
+
+        buffer, offsets = encode_many(envelopes, taxonomy_id=3)
+        self.assertEquals(1, Resolver.calls)
+        self.assertEquals(str(envelopes[0].encode_into(taxonomy_id=3)), \
+                str(buffer[:offsets[1]]))
+
+    def test_encode_many_resolvers(self):
+        """Resolvers mapping the id to different taxonomies do not share
+        headers"""
+        class Resolver(object):
+            def __init__(self, ordinal):
+                self.taxonomy = Taxonomy({ordinal : u'foo'})
+            def resolve_taxonomy(self, taxonomy_id):
+                return self.taxonomy
+        envelopes = []
+        for ordinal in (5, 9):
+            message = Message()
+            message.add(u'x', name=u'foo')
+            envelopes.append(Envelope(message, \
+                    taxonomy_resolver=Resolver(ordinal)))
+
+        headers = {}
+        buffer, offsets = encode_many(envelopes, taxonomy_id=3, \
+                headers=headers)
+        self.assertEquals(2, len(headers))
+        decoded = Envelope.decode(str(buffer[offsets[1]:]))
+        self.assertEquals(9, decoded.message.fields[0].ordinal)
+
+    def test_lazy_message(self):
+        """Only the fields used are decoded"""
+        sub = Message()
+        sub.add(u'inner', name=u'inner')
+        message = Message()
+        message.add(u'foo', name=u'foo')
+        message.add(sub, name=u'sub')
+        message.add(1234, ordinal=3)
+        encoded = str(message.encode_into(bytearray()))
+
+        lazy = LazyMessage(encoded)
+        self.assertEquals(3, len(lazy.fields))
+
+        fields = list(lazy)
+        self.assertEquals(u'foo', fields[0].name)
+        self.assertEquals(u'foo', fields[0].value)
+        self.assertEquals(3, fields[2].ordinal)
+        self.assertEquals(None, fields[2].name)
+        self.assertTrue(fields[2]._value is field._UNDECODED)
+
+        inner = fields[1].value
+        self.assertTrue(isinstance(inner, LazyMessage))
+        self.assertTrue(inner.fields[0]._value is field._UNDECODED)
+
+        # Sizing doesn't decode values
+        self.assertEquals(len(encoded), lazy.size())
+        self.assertTrue(inner.fields[0]._value is field._UNDECODED)
+        self.assertEquals(u'inner', inner.fields[0].value)
+
+        fields[2].value = 5
+        self.assertEquals(5, fields[2].value)
+
+    def test_lazy_message_offset(self):
+        message = Message()
+        message.add(u'foo', name=u'foo')
+        encoded = bytearray('xx') + message.encode_into(bytearray()) + 'yy'
+
+        lazy = LazyMessage(encoded, 2, len(encoded) - 2)
+        self.assertEquals(1, len(lazy.fields))
+        self.assertEquals(u'foo', lazy.fields[0].value)
+        self.assertTrue(isinstance(LazyMessage.decode(str(encoded[2:-2])), \
+                LazyMessage))
+
+    def test_field_lookup(self):
+        message = Message()
+        message.add(u'a', name=u'foo')
+        message.add(u'b', name=u'bar', ordinal=2)
+        message.add(u'c', name=u'foo', ordinal=3)
+
+        self.assertEquals(u'a', message.get(u'foo').value)
+        self.assertEquals(u'a', message[u'foo'].value)
+        self.assertEquals([u'a', u'c'], \
+                [f.value for f in message.get_all(u'foo')])
+        self.assertEquals(u'b', message.get_by_ordinal(2).value)
+        self.assertEquals(u'c', message[3].value)
+
+        self.assertEquals(None, message.get(u'baz'))
+        self.assertEquals(1, message.get(u'baz', 1))
+        self.assertEquals(None, message.get_by_ordinal(4))
+        self.assertEquals([], message.get_all(u'baz'))
+        self.assertRaises(KeyError, message.__getitem__, u'baz')
+        self.assertRaises(KeyError, message.__getitem__, 4)
+
+        # Adding a field invalidates the indexes
+        message.add(u'd', name=u'baz', ordinal=4)
+        self.assertEquals(u'd', message[u'baz'].value)
+        self.assertEquals(u'd', message[4].value)
+        self.assertEquals(2, len(message.get_all(u'foo')))
+
+    def test_field_lookup_lazy(self):
+        message = Message()
+        message.add(u'a', name=u'foo')
+        message.add(u'b', ordinal=2)
+        lazy = LazyMessage(str(message.encode_into(bytearray())))
+
+        self.assertEquals(u'b', lazy[2].value)
+        self.assertTrue(lazy.fields[0]._value is field._UNDECODED)
+        self.assertEquals(u'a', lazy.get(u'foo').value)
@@ -0,0 +1,89 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import unittest
+import cStringIO
+
+from fudgemsg.message import Message
+from fudgemsg.registry import Registry, UnknownTypeError
+from fudgemsg import types
+
+from nose.plugins.skip import SkipTest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class TestNumpyArrays(unittest.TestCase):
+    def setUp(self):
+        if numpy is None:
+            raise SkipTest("numpy not available")
+        self.reg = Registry(numpy_arrays=True)
+
+    def test_type_by_dtype(self):
+        for dtype, type_id in (('int16', types.SHORTARRAY_TYPE_ID),
+                ('>i4', types.INTARRAY_TYPE_ID),
+                ('int64', types.LONGARRAY_TYPE_ID),
+                ('uint16', types.INTARRAY_TYPE_ID),
+                ('float32', types.FLOATARRAY_TYPE_ID),
+                ('<f8', types.DOUBLEARRAY_TYPE_ID)):
+            value = numpy.zeros(3, dtype=dtype)
+            self.assertEquals(type_id, self.reg.type_by_class(value).type_id)
+
+        self.assertRaises(UnknownTypeError, self.reg.type_by_class, \
+                numpy.zeros(3, dtype=complex))
+        self.assertRaises(UnknownTypeError, Registry().type_by_class, \
+                numpy.zeros(3))
+
+    def test_encode_matches_lists(self):
+        values = [x / 10.0 for x in range(16)]
+        message = Message(self.reg)
+        message.add(numpy.array(values), name=u'doubles')
+        message.add(numpy.arange(5, dtype='int16'), name=u'shorts')
+
+        expected = Message()
+        expected.add(values, name=u'doubles', \
+                type_=expected.registry[types.DOUBLEARRAY_TYPE_ID])
+        expected.add(range(5), name=u'shorts', \
+                type_=expected.registry[types.SHORTARRAY_TYPE_ID])
+
+        self.assertEquals(str(expected.encode_into(bytearray())), \
+                str(message.encode_into(bytearray())))
+        writer = cStringIO.StringIO()
+        message.encode(writer)
+        self.assertEquals(str(expected.encode_into(bytearray())), \
+                writer.getvalue())
+
+    def test_decode_views_buffer(self):
+        values = numpy.arange(6, dtype='float64')
+        field_type = self.reg[types.DOUBLEARRAY_TYPE_ID]
+        encoded = bytearray('\xff' + field_type.encoder(values))
+
+        decoded = field_type.decode_from(encoded, 1, 48)
+        self.assertEquals('>f8', decoded.dtype.str)
+        self.assertEquals(list(values), list(decoded))
+
+        # A view, not a copy
+        encoded[1:9] = field_type.encoder([42.0])
+        self.assertEquals(42.0, decoded[0])
+
+        from_view = field_type.decode_from(memoryview(str(encoded)), 1, 48)
+        self.assertEquals(list(decoded), list(from_view))
+        self.assertEquals([], list(field_type.decoder('')))
@@ -0,0 +1,78 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import unittest
+
+from fudgemsg.message import Envelope, Message
+from fudgemsg import parallel
+from fudgemsg import registry
+from fudgemsg import types
+
+def make_envelope(i):
+    inner = Message()
+    inner.add(i * 1.5, name=u'price')
+    message = Message()
+    message.add(i, name=u'id', ordinal=1)
+    message.add(u'x' * (i % 7), name=u'name')
+    message.add(inner, name=u'inner')
+    message.add(types.INDICATOR, ordinal=2)
+    return Envelope(message, schema_version=i % 3)
+
+class TestParallel(unittest.TestCase):
+    def setUp(self):
+        self.envelopes = [make_envelope(i) for i in range(100)]
+        self.encoded = [e.encode_into() for e in self.envelopes]
+
+    def test_tuple_roundtrip(self):
+        message = self.envelopes[5].message
+        rebuilt = parallel.message_from_tuple( \
+                parallel.message_to_tuple(message))
+        self.assertEquals(message.encode_into(bytearray()), \
+                rebuilt.encode_into(bytearray()))
+        self.assertTrue(rebuilt.get_by_ordinal(2).value is types.INDICATOR)
+
+    def test_chunks(self):
+        chunks = list(parallel._chunks(self.encoded, 30))
+        self.assertEquals(4, len(chunks))
+        self.assertEquals(''.join([str(e) for e in self.encoded]), \
+                ''.join(chunks))
+
+    def test_decode_in_order(self):
+        decoded = parallel.decode_envelopes(self.encoded, processes=2, \
+                chunksize=7)
+        self.assertEquals(self.encoded, \
+                [e.encode_into() for e in decoded])
+        self.assertEquals([e.schema_version for e in self.envelopes], \
+                [e.schema_version for e in decoded])
+
+    def test_decode_tuples(self):
+        with parallel.DecodePool(2, chunksize=7) as pool:
+            decoded = list(pool.decode_tuples(self.encoded))
+        self.assertEquals(len(self.envelopes), len(decoded))
+        for envelope, (directives, schema_version, fields) in \
+                zip(self.envelopes, decoded):
+            self.assertEquals(envelope.schema_version, schema_version)
+            self.assertEquals(parallel.message_to_tuple(envelope.message), \
+                    fields)
+
+    def test_decode_registry(self):
+        custom = registry.Registry()
+        decoded = parallel.decode_envelopes(self.encoded[:3], processes=1, \
+                registry=custom)
+        self.assertTrue(all(e.message.registry is custom for e in decoded))
@@ -0,0 +1,115 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import unittest
+
+from fudgemsg.message import Envelope, Message
+from fudgemsg.projection import Projection
+from fudgemsg.registry import DEFAULT_REGISTRY, Registry
+from fudgemsg.taxonomy.map import Taxonomy
+from fudgemsg import types
+
+class TestProjection(unittest.TestCase):
+    def setUp(self):
+        instrument = Message()
+        instrument.add(42, name=u'id')
+        instrument.add(u'IBM', name=u'ticker')
+        instrument.add(u'NYSE', ordinal=7)
+
+        self.message = Message()
+        self.message.add(instrument, name=u'instrument')
+        self.message.add(range(1000), name=u'history', \
+                type_=DEFAULT_REGISTRY[types.INTARRAY_TYPE_ID])
+        self.message.add(99.5, name=u'bid')
+        self.message.add(100.5, name=u'ask')
+        self.message.add(3, name=u'caf\xe9', ordinal=5)
+        self.message.add(1.5, name=u'bid')
+        self.encoded = str(self.message.encode_into(bytearray()))
+
+    def fields(self, message):
+        return [(f.name, f.ordinal, f.value) for f in message.fields]
+
+    def test_project(self):
+        projection = Projection([u'instrument.id', u'bid', u'ask'])
+        message = projection.decode(self.encoded)
+
+        self.assertEquals([u'instrument', u'bid', u'ask', u'bid'], \
+                [f.name for f in message.fields])
+        self.assertEquals([(u'id', None, 42)], \
+                self.fields(message[u'instrument'].value))
+        self.assertEquals([99.5, 1.5], \
+                [f.value for f in message.get_all(u'bid')])
+
+    def test_ordinals(self):
+        projection = Projection([5, (u'instrument', 7)])
+        message = projection.decode(self.encoded)
+        self.assertEquals([u'instrument', u'caf\xe9'], \
+                [f.name for f in message.fields])
+        self.assertEquals([(None, 7, u'NYSE')], \
+                self.fields(message.fields[0].value))
+
+        # Unicode names are matched on their encoding
+        message = Projection([u'caf\xe9']).decode(self.encoded)
+        self.assertEquals([(u'caf\xe9', 5, 3)], self.fields(message))
+
+    def test_whole_submessage(self):
+        projection = Projection([u'instrument.id', u'instrument'])
+        self.assertEquals(self.fields(self.message[u'instrument'].value), \
+                self.fields(projection.decode(self.encoded)[u'instrument'] \
+                    .value))
+        projection = Projection([u'instrument', u'instrument.id'])
+        self.assertEquals(3, \
+                len(projection.decode(self.encoded)[u'instrument'].value \
+                    .fields))
+
+    def test_no_match(self):
+        for paths in ([], [u'bid.x'], [u'missing']):
+            message = Projection(paths).decode(self.encoded)
+            self.assertEquals([], message.fields)
+
+    def test_skips_values(self):
+        def fail(*args):
+            raise AssertionError("decoded a skipped field")
+        registry = Registry()
+        registry[types.INTARRAY_TYPE_ID].decode_from = fail
+        registry[types.INTARRAY_TYPE_ID].decoder = fail
+
+        message = Projection([u'ask']).decode(self.encoded, registry=registry)
+        self.assertEquals([(u'ask', None, 100.5)], self.fields(message))
+
+    def test_taxonomy(self):
+        taxonomy = Taxonomy({1 : u'bid', 2 : u'instrument', 3 : u'id'})
+
+        class Resolver(object):
+            def resolve_taxonomy(self, taxonomy_id):
+                return taxonomy
+
+        encoded = str(Envelope(self.message, schema_version=2, \
+                taxonomy_resolver=Resolver()).encode_into(taxonomy_id=1))
+        projection = Projection([u'bid', u'instrument.id'])
+        envelope = projection.decode_envelope(encoded, Resolver())
+        self.assertEquals(2, envelope.schema_version)
+        self.assertEquals([(u'instrument', 2), (u'bid', 1), (u'bid', 1)], \
+                [(f.name, f.ordinal) for f in envelope.message.fields])
+        self.assertEquals(42, envelope.message[u'instrument'].value[u'id'] \
+                .value)
+
+        envelope, end = projection.decode_envelope_from('xx' + encoded, 2)
+        self.assertEquals(len(encoded) + 2, end)
+        self.assertEquals([], envelope.message.fields)
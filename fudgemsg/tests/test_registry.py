@@ -22,6 +22,8 @@
 import unittest
 
 from fudgemsg.registry import *
+from fudgemsg.message import Message
+from fudgemsg import codecs
 from fudgemsg import types
 from fudgemsg import utils
 
@@ -31,6 +33,10 @@ class TestClass(object):
     """Used for testing `fudgemsg.registry.fullname`"""
     pass
 
+class Ticker(unicode):
+    """A subclass of a registered class"""
+    pass
+
 class testRegistry(unittest.TestCase):
 
     def setUp(self):
@@ -81,6 +87,50 @@ class testRegistry(unittest.TestCase):
         self.assertEquals(self.INT_TYPE, self.reg.type_by_class(utils.MAX_INT))
         self.assertEquals(self.LONG_TYPE, self.reg.type_by_class(long(utils.MAX_INT + 1)))
 
+    def test_type_by_class_subclass(self):
+        self.assertEquals(self.STRING_TYPE, self.reg.type_by_class(Ticker(u'IBM')))
+        self.assertTrue(Ticker in self.reg._class_cache)
+        self.assertEquals(self.STRING_TYPE, self.reg.type_by_class(Ticker(u'X')))
+
+    def test_register_class(self):
+        self.assertRaises(UnknownTypeError, self.reg.type_by_class, TestClass())
+        # Failures are cached too, until a class is registered
+        self.assertRaises(UnknownTypeError, self.reg.narrowed_type, TestClass())
+        self.reg.register_class(TestClass, types.STRING_TYPE_ID)
+        self.assertEquals(self.STRING_TYPE, self.reg.type_by_class(TestClass()))
+        self.reg.register_class('fudgemsg.tests.test_registry.Ticker', \
+                types.BYTEARRAY_TYPE_ID)
+        self.assertEquals(types.BYTEARRAY_TYPE_ID, \
+                self.reg.type_by_class(Ticker(u'x')).type_id)
+        self.assertRaises(UnknownTypeError, self.reg.register_class, \
+                TestClass, 254)
+
+    def test_narrowed_type(self):
+        self.assertEquals(self.BYTE_TYPE, self.reg.narrowed_type(1))
+        self.assertEquals(self.SHORT_TYPE, self.reg.narrowed_type(-1))
+        self.assertEquals(self.LONG_TYPE, self.reg.narrowed_type(utils.MAX_LONG))
+        self.assertEquals(self.BYTE_TYPE, self.reg.narrowed_type(long(1)))
+        self.assertEquals(self.reg[types.BYTEARRAY8_TYPE_ID], \
+                self.reg.narrowed_type('x' * 8))
+        self.assertEquals(self.STRING_TYPE, self.reg.narrowed_type(u'x'))
+        self.assertRaises(UnknownTypeError, self.reg.narrowed_type, uuid.uuid1())
+
+    def test_narrow_replaced_type(self):
+        short_type = FieldType(types.SHORT_TYPE_ID, int, False, 2, \
+                codecs.enc_short, codecs.dec_short)
+        bytearray4_type = FieldType(types.BYTEARRAY4_TYPE_ID, str, False, 4, \
+                codecs.enc_str, codecs.dec_str)
+        self.reg.register_type(short_type)
+        self.reg.register_type(bytearray4_type)
+        self.assertTrue(self.reg.narrowed_type(1000) is short_type)
+        self.assertTrue(self.reg.narrowed_type('abcd') is bytearray4_type)
+
+        message = Message(self.reg)
+        message.add(1000)
+        message.add('abcd')
+        self.assertTrue(message.fields[0].type_ is short_type)
+        self.assertTrue(message.fields[1].type_ is bytearray4_type)
+
     def test_narrow_int_byte(self):
         self.assertEquals(self.BYTE_TYPE, self.reg._narrow_int(0))
         self.assertEquals(self.BYTE_TYPE, self.reg._narrow_int(255))
@@ -135,6 +185,28 @@ class testRegistry(unittest.TestCase):
         array = 'x'*27
         self.assertEquals(self.reg[types.BYTEARRAY_TYPE_ID], self.reg.narrow(self.reg[types.BYTEARRAY_TYPE_ID], array))
 
+    def test_narrow_column_ints(self):
+        self.assertEquals(self.BYTE_TYPE, self.reg.narrow_column(self.LONG_TYPE, [0, 5, 255]))
+        self.assertEquals(self.SHORT_TYPE, self.reg.narrow_column(self.INT_TYPE, [-1, 5]))
+        self.assertEquals(self.INT_TYPE, self.reg.narrow_column(self.BYTE_TYPE, [0, utils.MAX_INT]))
+        self.assertEquals(self.LONG_TYPE, self.reg.narrow_column(self.INT_TYPE, [utils.MIN_INT - 1, 0]))
+        self.assertEquals(self.INT_TYPE, self.reg.narrow_column(self.INT_TYPE, []))
+
+    def test_narrow_column_str(self):
+        bytearray_type = self.reg[types.BYTEARRAY_TYPE_ID]
+        self.assertEquals(self.reg[types.BYTEARRAY16_TYPE_ID], \
+                self.reg.narrow_column(bytearray_type, ['x' * 16, 'y' * 16]))
+        self.assertEquals(bytearray_type, \
+                self.reg.narrow_column(bytearray_type, ['x' * 16, 'y' * 8]))
+        self.assertEquals(self.STRING_TYPE, \
+                self.reg.narrow_column(self.STRING_TYPE, [u'x' * 16]))
+
+    def test_int_array_type(self):
+        self.assertEquals(types.SHORTARRAY_TYPE_ID, self.reg.int_array_type([-5, 1000]).type_id)
+        self.assertEquals(types.SHORTARRAY_TYPE_ID, self.reg.int_array_type([]).type_id)
+        self.assertEquals(types.INTARRAY_TYPE_ID, self.reg.int_array_type([0, utils.MAX_SHORT + 1]).type_id)
+        self.assertEquals(types.LONGARRAY_TYPE_ID, self.reg.int_array_type([utils.MIN_INT - 1]).type_id)
+
     def test_type_repr(self):
         f = FieldType(1, int, False, 2)
         self.assertEquals("FieldType[id=1, classname='int']", "%r"%f)
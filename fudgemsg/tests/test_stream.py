@@ -0,0 +1,122 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import unittest
+import cStringIO
+
+from fudgemsg.message import Envelope
+from fudgemsg.registry import UnknownTypeError
+from fudgemsg.stream import EnvelopeReader, read_envelopes
+from fudgemsg.tests import make_envelope
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.values = [u'foo', u'x' * 300, u'', u'bar']
+        self.encoded = ''.join([str(make_envelope(v).encode_into()) \
+                for v in self.values])
+
+    def assertValues(self, envelopes):
+        self.assertEquals(self.values, \
+                [e.message.fields[0].value for e in envelopes])
+        for e in envelopes:
+            self.assertEquals(1, e.schema_version)
+
+    def test_whole(self):
+        reader = EnvelopeReader()
+        self.assertValues(reader.feed(self.encoded))
+        self.assertEquals(0, reader.pending())
+
+    def test_byte_at_a_time(self):
+        reader = EnvelopeReader()
+        envelopes = []
+        for byte in self.encoded:
+            envelopes.extend(reader.feed(byte))
+        self.assertValues(envelopes)
+        self.assertEquals(0, reader.pending())
+
+    def test_chunks(self):
+        reader = EnvelopeReader(lazy=True)
+        envelopes = []
+        for start in range(0, len(self.encoded), 7):
+            envelopes.extend(reader.feed(self.encoded[start:start + 7]))
+        self.assertValues(envelopes)
+
+    def test_partial(self):
+        reader = EnvelopeReader()
+        self.assertEquals([], reader.feed(self.encoded[:5]))
+        self.assertEquals(5, reader.pending())
+        self.assertEquals(1, len(reader.feed(self.encoded[5:20])))
+
+    def test_bad_size(self):
+        reader = EnvelopeReader()
+        self.assertRaises(ValueError, reader.feed, '\x00' * 8)
+
+    def test_error_after_envelopes(self):
+        """Envelopes before an error are returned, and the error raised
+        by the next call"""
+        first = str(make_envelope(u'foo').encode_into())
+        reader = EnvelopeReader()
+        envelopes = reader.feed(first + '\x00' * 8)
+        self.assertEquals([u'foo'], \
+                [e.message.fields[0].value for e in envelopes])
+        self.assertEquals(8, reader.pending())
+        self.assertRaises(ValueError, reader.check)
+        reader.check()
+        self.assertRaises(ValueError, reader.feed, '')
+
+    def test_undecodable_envelope(self):
+        """An envelope which fails to decode is dropped"""
+        first = str(make_envelope(u'foo').encode_into())
+        # A field of an unknown fixed width type
+        bad = '\x00\x00\x00\x00\x00\x00\x00\x0a\x80\xc8'
+        reader = EnvelopeReader()
+        self.assertEquals(1, len(reader.feed(first + bad + first)))
+        self.assertEquals(len(first), reader.pending())
+        self.assertRaises(UnknownTypeError, reader.feed, '')
+        self.assertEquals(1, len(reader.feed('')))
+        self.assertEquals(0, reader.pending())
+
+        self.assertRaises(UnknownTypeError, reader.feed, bad)
+        self.assertEquals(0, reader.pending())
+
+    def test_read_envelopes(self):
+        stream = cStringIO.StringIO(self.encoded)
+        self.assertValues(list(read_envelopes(stream, chunk_size=10)))
+
+        stream = cStringIO.StringIO(self.encoded[:-1])
+        self.assertRaises(ValueError, list, read_envelopes(stream))
+
+        stream = cStringIO.StringIO(self.encoded + '\x00' * 8)
+        envelopes = []
+        try:
+            for envelope in read_envelopes(stream):
+                envelopes.append(envelope)
+        except ValueError:
+            pass
+        else:
+            self.fail("ValueError not raised")
+        self.assertValues(envelopes)
+
+    def test_decode_frames_by_size(self):
+        envelope, end = Envelope.decode_from(self.encoded)
+        self.assertEquals(u'foo', envelope.message.fields[0].value)
+        envelope, end = Envelope.decode_from(self.encoded, end)
+        self.assertEquals(self.values[1], envelope.message.fields[0].value)
+
+        self.assertEquals(1, len(Envelope.decode(self.encoded).message.fields))
@@ -0,0 +1,95 @@
+#
+# Copyright CERN, 2010.
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import unittest
+
+from fudgemsg.message import Envelope, Message
+from fudgemsg.taxonomy.learner import TaxonomyLearner
+
+class TestTaxonomyLearner(unittest.TestCase):
+    def message(self, i):
+        sub = Message()
+        sub.add(i, name=u'quantity')
+        message = Message()
+        message.add(u'x', name=u'x')
+        message.add(i, name=u'id', ordinal=1)
+        message.add(1.5, name=u'price')
+        message.add(2, ordinal=3)
+        message.add(sub, name=u'order')
+        return message
+
+    def test_ranking(self):
+        learner = TaxonomyLearner()
+        for i in range(10):
+            learner.observe(self.message(i))
+
+        # 'x' would save nothing, 'id' is sent with its ordinal anyway
+        self.assertEquals([(70, u'quantity'), (40, u'order'), \
+                (40, u'price'), (30, u'id')], learner.ranked_names())
+
+        taxonomy = learner.learn()
+        self.assertEquals(1, taxonomy.get_ordinal(u'id'))
+        self.assertEquals(2, taxonomy.get_ordinal(u'quantity'))
+        # 3 is already in use
+        self.assertEquals(4, taxonomy.get_ordinal(u'order'))
+        self.assertEquals(5, taxonomy.get_ordinal(u'price'))
+        self.assertEquals(None, taxonomy.get_ordinal(u'x'))
+
+        self.assertEquals(2, len(learner.learn(max_size=2)))
+
+    def test_projected_saving(self):
+        learner = TaxonomyLearner()
+        plain = taxonomy_bytes = 0
+        messages = [self.message(i) for i in range(10)]
+        for message in messages:
+            learner.observe(message)
+        taxonomy = learner.learn()
+
+        class Resolver(object):
+            def resolve_taxonomy(self, taxonomy_id):
+                return taxonomy
+        for message in messages:
+            envelope = Envelope(message, taxonomy_resolver=Resolver())
+            plain += len(envelope.encode_into())
+            taxonomy_bytes += len(envelope.encode_into(taxonomy_id=1))
+
+        # Envelope headers are not counted in the sample
+        self.assertEquals((plain - 80, plain - taxonomy_bytes), \
+                learner.projected_saving(taxonomy))
+        self.assertTrue('4 names, 10 messages' in learner.report(taxonomy))
+
+    def test_clashing_ordinals(self):
+        learner = TaxonomyLearner()
+        message = Message()
+        message.add(1, name=u'price', ordinal=1)
+        message.add(2, name=u'price', ordinal=2)
+        message.add(3, name=u'volume', ordinal=0)
+        learner.observe(message)
+        self.assertEquals([], learner.ranked_names())
+
+    def test_sampling(self):
+        learner = TaxonomyLearner(sample_every=3)
+        for i in range(10):
+            learner.observe(self.message(i))
+            encoded = str(Envelope(self.message(i)).encode_into())
+            learner.observe_encoded(encoded)
+        self.assertEquals(20, learner.seen)
+        self.assertEquals(7, learner.messages)
+        self.assertEquals(49, learner.ranked_names()[0][0])
@@ -0,0 +1,119 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import unittest
+
+import datetime
+
+from fudgemsg.message import Message
+from fudgemsg.registry import Registry
+from fudgemsg.template import MessageTemplate
+from fudgemsg.taxonomy.map import Taxonomy
+from fudgemsg import types
+
+TRADE = [(u'id', None, types.LONG_TYPE_ID),
+         (u'price', None, types.DOUBLE_TYPE_ID),
+         (None, 3, types.INT_TYPE_ID),
+         (u'ticker', None, types.STRING_TYPE_ID),
+         (u'flag', None, types.BOOLEAN_TYPE_ID),
+         (u'done', 2, types.INDICATOR_TYPE_ID)]
+
+VALUES = (1234, 99.5, -7, u'IBM', True, types.INDICATOR)
+
+class TestTemplate(unittest.TestCase):
+    def setUp(self):
+        self.template = MessageTemplate(TRADE)
+
+    def test_matches_message(self):
+        encoded = self.template.encode(VALUES)
+        message = self.template.to_message(VALUES)
+        self.assertEquals(str(message.encode_into(bytearray())), encoded)
+        self.assertEquals(len(encoded), message.size())
+
+    def test_roundtrip(self):
+        encoded = self.template.encode(VALUES)
+        self.assertEquals(VALUES, self.template.decode(encoded))
+        self.assertEquals(VALUES, self.template.decode(buffer(encoded)))
+
+        decoded = Message.decode(encoded)
+        self.assertEquals(1234, decoded[u'id'].value)
+        self.assertEquals(u'IBM', decoded[u'ticker'].value)
+
+    def test_long_string(self):
+        values = (1, 2.0, 3, u'x' * 1000, False, None)
+        encoded = self.template.encode(values)
+        self.assertEquals(u'x' * 1000, self.template.decode(encoded)[3])
+
+    def test_submessage(self):
+        outer = MessageTemplate([(u'trade', 1, self.template),
+                                 (u'n', None, types.SHORT_TYPE_ID)])
+        values = (VALUES, 4)
+        encoded = outer.encode(values)
+        self.assertEquals(values, outer.decode(encoded))
+        self.assertEquals(encoded, \
+                str(outer.to_message(values).encode_into(bytearray())))
+
+    def test_mismatch(self):
+        message = Message()
+        message.add(1234, name=u'id')
+        self.assertRaises(ValueError, self.template.decode, \
+                str(message.encode_into(bytearray())))
+        encoded = self.template.encode(VALUES)
+        self.assertRaises(ValueError, self.template.decode, encoded[:-1])
+        self.assertRaises(ValueError, self.template.decode, encoded + '\x00')
+
+    def test_envelope(self):
+        buffer = bytearray('xx')
+        self.template.encode_envelope_into(buffer, VALUES, schema_version=3)
+        values, end = self.template.decode_envelope_from(buffer, 2)
+        self.assertEquals(VALUES, values)
+        self.assertEquals(len(buffer), end)
+
+    def test_taxonomy(self):
+        template = MessageTemplate(TRADE, taxonomy=Taxonomy({5 : u'price'}))
+        encoded = template.encode(VALUES)
+        self.assertEquals(len(self.template.encode(VALUES)) - 4, len(encoded))
+        self.assertEquals(VALUES, template.decode(encoded))
+
+    def test_unsigned_byte(self):
+        """Bytes are unsigned, as for Message"""
+        message = Message()
+        message.add(200, name=u'flags')
+        self.assertEquals(types.BYTE_TYPE_ID, message.fields[0].type_.type_id)
+        encoded = str(message.encode_into(bytearray()))
+
+        template = MessageTemplate([(u'flags', None, types.BYTE_TYPE_ID)])
+        self.assertEquals((200,), template.decode(encoded))
+        self.assertEquals(encoded, template.encode((200,)))
+
+    def test_registry(self):
+        """Generic sub-messages are decoded and built with the template's
+        registry"""
+        raw = Registry(raw_datetimes=True)
+        template = MessageTemplate([(u'sub', None, types.FUDGEMSG_TYPE_ID)], \
+                registry=raw)
+        sub = Message()
+        sub.add(datetime.date(2010, 3, 4), name=u'date')
+        message = Message()
+        message.add(sub, name=u'sub')
+
+        values = template.decode(str(message.encode_into(bytearray())))
+        self.assertEquals(raw, values[0].registry)
+        self.assertEquals((2010 << 9) | (3 << 5) | 4, values[0][u'date'].value)
+        self.assertEquals(raw, template.to_message(values).registry)
@@ -21,6 +21,8 @@
 
 """Functions for working with types. """
 
+import datetime
+
 INDICATOR_TYPE_ID = 0
 BOOLEAN_TYPE_ID = 1
 BYTE_TYPE_ID = 2
@@ -47,6 +49,25 @@ BYTEARRAY64_TYPE_ID = 22
 BYTEARRAY128_TYPE_ID = 23
 BYTEARRAY256_TYPE_ID = 24
 BYTEARRAY512_TYPE_ID = 25
+DATE_TYPE_ID = 26
+TIME_TYPE_ID = 27
+DATETIME_TYPE_ID = 28
+
+# The accuracy of a Fudge time, held alongside it
+ACCURACY_MILLENNIUM = 0
+ACCURACY_CENTURY = 1
+ACCURACY_YEAR = 2
+ACCURACY_MONTH = 3
+ACCURACY_DAY = 4
+ACCURACY_HOUR = 5
+ACCURACY_MINUTE = 6
+ACCURACY_SECOND = 7
+ACCURACY_MILLISECOND = 8
+ACCURACY_MICROSECOND = 9
+ACCURACY_NANOSECOND = 10
+
+# The timezone offset of a Fudge time with no timezone
+NO_TIMEZONE = -128
 
 FUDGE_TYPE_NAMES =  {
     0 : "indicator",
@@ -74,6 +95,9 @@ FUDGE_TYPE_NAMES =  {
     BYTEARRAY128_TYPE_ID : "byte[128]",
     BYTEARRAY256_TYPE_ID : "byte[256]",
     BYTEARRAY512_TYPE_ID : "byte[512]",
+    DATE_TYPE_ID : "date",
+    TIME_TYPE_ID : "time",
+    DATETIME_TYPE_ID : "datetime",
 }
 
 def size_unicode(arg):
@@ -94,3 +118,45 @@ class Indicator(object):
         return "Indicator()"
 
 INDICATOR = Indicator()
+
+class FixedOffset(datetime.tzinfo):
+    """A timezone a fixed number of minutes east of UTC.
+
+    Fudge times carry their offset from UTC, in units of 15 minutes, but
+    no timezone name. Use `fixed_offset` to get a shared instance."""
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self._offset = datetime.timedelta(minutes=minutes)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return _ZERO
+
+    def tzname(self, dt):
+        sign = '+'
+        minutes = self.minutes
+        if minutes < 0:
+            sign = '-'
+            minutes = -minutes
+        return "UTC%s%02d:%02d"% (sign, minutes // 60, minutes % 60)
+
+    def __repr__(self):
+        return "FixedOffset(%r)"% self.minutes
+
+    def __reduce__(self):
+        return fixed_offset, (self.minutes,)
+
+_ZERO = datetime.timedelta(0)
+_FIXED_OFFSETS = {}
+
+def fixed_offset(minutes):
+    """Return the FixedOffset timezone for an offset from UTC in minutes"""
+    try:
+        return _FIXED_OFFSETS[minutes]
+    except KeyError:
+        return _FIXED_OFFSETS.setdefault(minutes, FixedOffset(minutes))
+
+UTC = fixed_offset(0)